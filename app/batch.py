@@ -0,0 +1,190 @@
+"""
+Batch recommendations over stored sessions, for offline re-scoring (e.g. after a
+catalog change). Sessions are processed in chunks: one batched embedding call per
+chunk, one query_many over the catalog and optional LLM reasons, with results
+streamed out as JSON Lines as each chunk finishes.
+
+    python -m app.batch --all --output rescore.jsonl
+    python -m app.batch session-1 session-2 --top-k 5 --reasons
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from app.catalog import get_catalog
+from app.embedding_utils import generate_text_embeddings
+from app.metrics import span
+from app.rec_cache import preference_fingerprint, recommendation_cache
+from app.utils import (
+    apply_fast_extraction,
+    preference_summary,
+    rank_by_rewards,
+    rank_embedded,
+    reasons_for,
+)
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Sessions per chunk; bounds memory and the size of each embedding/query batch
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "256"))
+# Most session ids one /recommend/batch request may name
+BATCH_MAX_SESSIONS = int(os.getenv("BATCH_MAX_SESSIONS", "10000"))
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _rank_chunk(prefs_list: list, vector_store, top_k: int):
+    """(matches, from_vectors) per preference set, using cached rankings where possible."""
+    fingerprints = [preference_fingerprint(prefs) for prefs in prefs_list]
+    results = [recommendation_cache.get_matches(fp, top_k) for fp in fingerprints]
+    todo = [i for i, matches in enumerate(results) if matches is None]
+    ranked = [(matches, True) for matches in results]
+    if not todo:
+        return ranked, fingerprints
+    try:
+        with span("embedding", texts=len(todo)):
+            embeddings = await generate_text_embeddings(
+                [preference_summary(prefs_list[i]) for i in todo]
+            )
+    except Exception as e:
+        logger.warning(
+            "Embedding unavailable, ranking %d sessions by reward value only: %r", len(todo), e
+        )
+        for i in todo:
+            ranked[i] = (rank_by_rewards(prefs_list[i], top_k), False)
+        return ranked, fingerprints
+    found = await rank_embedded([prefs_list[i] for i in todo], embeddings, vector_store, top_k)
+    for i, matches in zip(todo, found):
+        recommendation_cache.put_matches(fingerprints[i], top_k, matches)
+        ranked[i] = (matches, True)
+    return ranked, fingerprints
+
+
+async def _session_result(
+    session_id: str, prefs: dict, matches: list, from_vectors: bool, fingerprint: str, reasons: bool
+) -> dict:
+    catalog = get_catalog()
+    matches = catalog.join(matches)
+    engine = catalog.rewards
+    cards = []
+    for match in matches:
+        simulation, details = engine.simulate(match["id"], prefs)
+        metadata = match["metadata"]
+        cards.append(
+            {
+                "id": match["id"],
+                "name": metadata.get("name", ""),
+                "score": match.get("score", 0.0),
+                "image_url": metadata.get("image_url", ""),
+                "apply_link": metadata.get("apply_link", ""),
+                "reward_simulation": simulation,
+                "reward_details": details,
+            }
+        )
+    degraded = not from_vectors
+    if reasons and cards:
+        texts, templated = await reasons_for(
+            {match["id"]: dict(match["metadata"]) for match in matches}, prefs, fingerprint
+        )
+        for card in cards:
+            card["llm_reason"] = texts[card["id"]]
+        degraded = degraded or bool(templated)
+    return {"session_id": session_id, "recommendations": cards, "degraded": degraded}
+
+
+async def recommend_many(
+    session_ids, store, vector_store, top_k: int = 3, reasons: bool = False, chunk_size: int = BATCH_CHUNK_SIZE
+):
+    """
+    Async generator of one result dict per session id, in input order:
+    {"session_id", "recommendations": [...], "degraded"} or {"session_id", "error"}.
+    Preferences come from the stored sessions (turns not yet extracted go through
+    the rule-based extractor only); reasons adds LLM explanations per card.
+    """
+    for chunk in _chunks(session_ids, max(chunk_size, 1)):
+        with span("batch.chunk", sessions=len(chunk)):
+            results = {}
+            ready = []
+            # Sessions not in memory are read from SQLite; keep that off the event loop
+            snapshots = await asyncio.to_thread(lambda: [store.snapshot(session_id) for session_id in chunk])
+            for session_id, session in zip(chunk, snapshots):
+                if session is None:
+                    results[session_id] = {"session_id": session_id, "error": "session not found"}
+                    continue
+                apply_fast_extraction(session)
+                if not any(session["preferences"].values()):
+                    results[session_id] = {"session_id": session_id, "error": "no preferences yet"}
+                    continue
+                ready.append((session_id, session["preferences"]))
+
+            if ready:
+                ranked, fingerprints = await _rank_chunk([p for _, p in ready], vector_store, top_k)
+                done = await asyncio.gather(
+                    *(
+                        _session_result(session_id, prefs, matches, from_vectors, fingerprint, reasons)
+                        for (session_id, prefs), (matches, from_vectors), fingerprint in zip(
+                            ready, ranked, fingerprints
+                        )
+                    )
+                )
+                for result in done:
+                    results[result["session_id"]] = result
+        for session_id in chunk:
+            yield results[session_id]
+
+
+async def _run(args) -> int:
+    from app.clients import get_vector_store
+    from app.session_store import SessionStore
+
+    store = SessionStore(flush_interval=0, sweep_interval=0)
+    ids = store.session_ids() if args.all else args.session_ids
+    vector_store = get_vector_store()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    started = time.perf_counter()
+    written = failed = 0
+    try:
+        async for result in recommend_many(ids, store, vector_store, args.top_k, args.reasons, args.chunk_size):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            written += 1
+            failed += "error" in result
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        store.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{written} sessions scored ({failed} skipped) in {elapsed:.1f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session_ids", nargs="*", help="sessions to score")
+    parser.add_argument("--all", action="store_true", help="score every stored session")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--reasons", action="store_true", help="add LLM explanations (one call per session)")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--output", help="JSONL file to write (default: stdout)")
+    args = parser.parse_args()
+    if not args.all and not args.session_ids:
+        parser.error("give session ids or --all")
+    sys.exit(asyncio.run(_run(args)))
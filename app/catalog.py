@@ -0,0 +1,282 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+from app.metrics import count
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CARDS_FILE = Path(os.getenv("CARDS_FILE", DATA_DIR / "cards.json"))
+# How often the cards file is checked for changes to hot-reload (0 = only on request)
+CATALOG_WATCH_SECONDS = float(os.getenv("CATALOG_WATCH_SECONDS", "5"))
+
+
+def card_id(card: dict) -> str:
+    # Same id scheme the Pinecone index was originally seeded with
+    return card["name"].replace(" ", "_").lower()
+
+
+def load_cards(path: Path = CARDS_FILE) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Citation markers left in the scraped card text, e.g. ":contentReference[oaicite:3]{index=3}"
+_CITATION_RE = re.compile(r":contentReference\[[^\]]*\](?:\{[^}]*\})?")
+
+
+def strip_citations(text: str) -> str:
+    return _CITATION_RE.sub("", text or "")
+
+
+_INR_RE = re.compile(
+    r"(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?)"
+    r"(?:\s*(?:-|–|to)\s*(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?))?"
+    r"\+?\s*(lakhs?|lacs?|lpa\b|l\b|crores?|cr\b|k\b|thousand|million|mn\b)?",
+    re.IGNORECASE,
+)
+_INR_MULTIPLIERS = {
+    "k": 1_000,
+    "thousand": 1_000,
+    "l": 100_000,
+    "lpa": 100_000,
+    "lakh": 100_000,
+    "lakhs": 100_000,
+    "lac": 100_000,
+    "lacs": 100_000,
+    "million": 1_000_000,
+    "mn": 1_000_000,
+    "cr": 10_000_000,
+    "crore": 10_000_000,
+    "crores": 10_000_000,
+}
+_MONTHLY_RE = re.compile(
+    r"per month|a month|each month|every month|/\s*mo(?:nth)?\b|monthly|\bpm\b|p\.m\.|\bmonth\b",
+    re.IGNORECASE,
+)
+_ANNUAL_RE = re.compile(
+    r"per annum|\bp\.?a\b\.?|annual(?:ly)?|yearly|a year|per year|every year|/\s*y(?:ea)?r\b|\blpa\b|\bctc\b|\byear\b",
+    re.IGNORECASE,
+)
+
+
+def parse_inr(text: str):
+    """
+    Parse the first rupee amount in text, e.g. "₹1,00,000", "₹1.5L", "₹12 lakh" or
+    "₹2,500", into a float; for a range such as "₹1-2 lakh" its lower end. Returns
+    None when there is no number.
+    """
+    match = _INR_RE.search(text or "")
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", ""))
+    return value * _INR_MULTIPLIERS.get((match.group(3) or "").lower(), 1)
+
+
+def parse_inr_amounts(text: str) -> list:
+    """Every rupee amount in text; a range such as "3-4k" counts once, as its midpoint."""
+    amounts = []
+    for match in _INR_RE.finditer(text or ""):
+        unit = _INR_MULTIPLIERS.get((match.group(3) or "").lower(), 1)
+        low = float(match.group(1).replace(",", ""))
+        high = float(match.group(2).replace(",", "")) if match.group(2) else low
+        amounts.append((low + high) / 2 * unit)
+    return amounts
+
+
+def inr_period(text: str):
+    """"monthly", "annual" or None, from the wording around an amount."""
+    if _ANNUAL_RE.search(text or ""):
+        return "annual"
+    if _MONTHLY_RE.search(text or ""):
+        return "monthly"
+    return None
+
+
+# Card fields kept as attributes; anything else in cards.json goes to Card.extra
+_CARD_FIELDS = (
+    "name",
+    "issuer",
+    "joining_fee",
+    "annual_fee",
+    "reward_type",
+    "reward_rate",
+    "eligibility",
+    "special_perks",
+    "image_url",
+    "apply_link",
+)
+# Normalized numeric columns from app.eligibility.eligibility_columns
+_COLUMN_FIELDS = ("min_income_monthly", "min_age", "max_age", "joining_fee_inr", "annual_fee_inr")
+
+
+class Card:
+    """
+    One catalog card: the fields from cards.json plus its eligibility/fee columns,
+    parsed once when the catalog is loaded. get() and to_dict() give the same view
+    as the card dict with its columns (what the vector store used to return as metadata).
+    """
+
+    __slots__ = ("id",) + _CARD_FIELDS + _COLUMN_FIELDS + ("extra",)
+
+    def __init__(self, card: dict, columns: dict):
+        self.id = card_id(card)
+        for field in _CARD_FIELDS:
+            setattr(self, field, card.get(field, ""))
+        for field in _COLUMN_FIELDS:
+            setattr(self, field, columns[field])
+        extra = {k: v for k, v in card.items() if k not in _CARD_FIELDS}
+        self.extra = extra or None
+
+    def get(self, key: str, default=None):
+        if key in _CARD_FIELDS or key in _COLUMN_FIELDS:
+            return getattr(self, key)
+        return (self.extra or {}).get(key, default)
+
+    def to_dict(self) -> dict:
+        """A fresh dict of the card's fields and columns; callers may modify it."""
+        card = {field: getattr(self, field) for field in _CARD_FIELDS}
+        card.update(self.extra or {})
+        card.update({field: getattr(self, field) for field in _COLUMN_FIELDS})
+        return card
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of one version of the catalog: the cards, an id index, the distinct
+    monthly income thresholds and the reward engine compiled from them. A reload builds a new snapshot and swaps the
+    module reference, so a request that took a snapshot keeps a consistent one.
+    """
+
+    __slots__ = ("version", "cards", "by_id", "income_thresholds", "rewards")
+
+    def __init__(self, raw_cards: list, version: str):
+        from app.eligibility import eligibility_columns
+        from app.rewards import RewardEngine
+
+        if not isinstance(raw_cards, list):
+            raise ValueError("cards file must hold a JSON list of cards")
+        cards = []
+        for i, card in enumerate(raw_cards):
+            if not isinstance(card, dict) or not card.get("name"):
+                raise ValueError(f"card #{i} has no name")
+            cards.append(Card(card, eligibility_columns(card)))
+        by_id = {card.id: card for card in cards}
+        if len(by_id) != len(cards):
+            raise ValueError("card names must be unique")
+        self.version = version
+        self.cards = tuple(cards)
+        self.by_id = by_id
+        self.income_thresholds = tuple(sorted({card.min_income_monthly for card in cards}))
+        self.rewards = RewardEngine(raw_cards)
+
+    def join(self, matches: list[dict]) -> list[dict]:
+        """
+        Vector-store matches ({"id", "score"}) with each card's metadata attached.
+        Ids no longer in the catalog are dropped.
+        """
+        joined = []
+        for match in matches:
+            card = self.by_id.get(match["id"])
+            if card is not None:
+                joined.append(
+                    {"id": card.id, "score": match.get("score", 0.0), "metadata": card.to_dict()}
+                )
+        return joined
+
+
+_snapshot = None
+_reload_lock = threading.Lock()
+
+
+def reload_catalog(path: Path = CARDS_FILE) -> bool:
+    """
+    Load the cards file into a new snapshot and swap it in. Returns False when the
+    file content is what is already loaded. A file that does not parse or validate
+    raises and leaves the current snapshot in place.
+    """
+    global _snapshot
+    with _reload_lock:
+        try:
+            data = Path(path).read_bytes()
+            version = hashlib.sha256(data).hexdigest()[:16]
+            if _snapshot is not None and _snapshot.version == version:
+                return False
+            snapshot = CatalogSnapshot(json.loads(data), version)
+        except Exception:
+            count("catalog.reload", "error")
+            raise
+        _snapshot = snapshot
+    count("catalog.reload", "ok")
+    logger.info("Catalog loaded: %d cards, version %s", len(snapshot.cards), version)
+    return True
+
+
+def get_catalog() -> CatalogSnapshot:
+    """The current catalog snapshot, loaded on first use."""
+    if _snapshot is None:
+        reload_catalog()
+    return _snapshot
+
+
+def catalog_version() -> str:
+    """
+    Content hash of the catalog being served, used to invalidate anything derived
+    from it (cached rankings, stored recommendations) when it is reloaded.
+    """
+    return get_catalog().version
+
+
+def file_signature(path: Path):
+    """[mtime_ns, size] of a file, or None if it is missing (a list, so it round-trips through JSON)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+_watch_stop = threading.Event()
+_watcher = None
+
+
+def _watch_loop(path: Path, interval: float):
+    # None so the first poll also catches a change made before the watcher started
+    signature = None
+    while not _watch_stop.wait(interval):
+        current = file_signature(path)
+        if current is None or current == signature:
+            continue
+        signature = current
+        try:
+            reload_catalog(path)
+        except Exception as e:
+            # Most likely caught mid-write; the next change is picked up again
+            logger.warning("Catalog reload from %s failed, keeping the current one: %r", path, e)
+
+
+def start_watcher(path: Path = CARDS_FILE, interval: float = CATALOG_WATCH_SECONDS):
+    """Poll the cards file every interval seconds and hot-reload it when it changes."""
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return
+    _watch_stop.clear()
+    _watcher = threading.Thread(
+        target=_watch_loop, args=(Path(path), interval), name="catalog-watch", daemon=True
+    )
+    _watcher.start()
+
+
+def stop_watcher():
+    global _watcher
+    _watch_stop.set()
+    if _watcher is not None:
+        _watcher.join()
+        _watcher = None
@@ -0,0 +1,72 @@
+import json
+import os
+from dotenv import load_dotenv
+from app.system_prompt import SYSTEM_PROMPT
+
+load_dotenv()
+
+# Rough token budget for one chat prompt (system prompt + summary + recent turns)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "2000"))
+# Number of most recent history turns that are always sent verbatim
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "8"))
+# The last bot question and the user's answer are never dropped to fit the budget
+MIN_VERBATIM_TURNS = 2
+
+# Prompt size per chat turn, in estimated tokens
+prompt_stats = {"turns": 0, "total_tokens": 0, "last_tokens": 0, "max_tokens": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English chat text
+    return len(text) // 4 + 1
+
+
+def _format_turns(turns: list[dict]) -> str:
+    return "\n".join(f"{m['sender']}: {m['text']}" for m in turns)
+
+
+def _record_prompt_size(tokens: int):
+    prompt_stats["turns"] += 1
+    prompt_stats["total_tokens"] += tokens
+    prompt_stats["last_tokens"] = tokens
+    prompt_stats["max_tokens"] = max(prompt_stats["max_tokens"], tokens)
+
+
+async def build_chat_prompt(session: dict) -> str:
+    """
+    Build the chat prompt within CHAT_CONTEXT_TOKEN_BUDGET. The last CHAT_RECENT_TURNS
+    turns are sent verbatim; older turns are represented by the structured preference
+    JSON, which is brought up to date incrementally whenever unsummarized turns are
+    about to leave the verbatim window.
+    """
+    from app.utils import extract_user_preferences_and_update_session
+
+    history = session.get("history", [])
+    recent_start = max(0, len(history) - CHAT_RECENT_TURNS)
+    if recent_start > session.get("preferences_turns", 0):
+        await extract_user_preferences_and_update_session(session)
+
+    # Turns covered by the summary; if extraction failed they stay verbatim instead
+    summarized = min(session.get("preferences_turns", 0), recent_start)
+    summary = ""
+    if summarized and session.get("preferences"):
+        summary = (
+            "Information already collected earlier in this conversation (JSON):\n"
+            + json.dumps(session["preferences"], ensure_ascii=False)
+        )
+
+    turns = history[summarized:]
+    fixed_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(summary)
+    turn_tokens = [estimate_tokens(f"{m['sender']}: {m['text']}\n") for m in turns]
+    total = fixed_tokens + sum(turn_tokens)
+    drop = 0
+    while total > CHAT_CONTEXT_TOKEN_BUDGET and len(turns) - drop > MIN_VERBATIM_TURNS:
+        total -= turn_tokens[drop]
+        drop += 1
+    turns = turns[drop:]
+
+    full_prompt = "\n".join(
+        part for part in (SYSTEM_PROMPT, summary, _format_turns(turns)) if part
+    )
+    _record_prompt_size(estimate_tokens(full_prompt))
+    return full_prompt
@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Keep-alive pool shared by every Gemini call in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+# Seconds between checks whether the local/IVF index files were rewritten (by a
+# seed run); a changed index is reloaded as a new store. 0 = only on refresh_vector_store()
+VECTOR_STORE_CHECK_SECONDS = float(os.getenv("VECTOR_STORE_CHECK_SECONDS", "5"))
+
+# Process-wide clients, created on first use (or by warm_up() at startup). google.genai
+# and pinecone are imported here rather than at module level because importing them
+# is most of the app's cold-start time.
+_lock = threading.Lock()
+_genai_client = None
+_vector_store = None
+_vector_store_checked = 0.0
+
+
+def get_genai_client():
+    """The shared Gemini client; sync and async calls reuse one pooled connection set each."""
+    global _genai_client
+    if _genai_client is None:
+        with _lock:
+            if _genai_client is None:
+                import httpx
+                from google import genai
+                from google.genai import types
+
+                limits = httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+                )
+                _genai_client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options=types.HttpOptions(
+                        client_args={"limits": limits},
+                        async_client_args={"limits": limits},
+                    ),
+                )
+    return _genai_client
+
+
+def get_vector_store():
+    """
+    The shared vector store for the configured VECTOR_STORE backend. Blocking when it
+    has to be loaded; async callers run it in a worker thread.
+    """
+    global _vector_store, _vector_store_checked
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                from app.vector_store import get_vector_store as build_vector_store
+
+                _vector_store = build_vector_store()
+                _vector_store_checked = time.monotonic()
+    elif VECTOR_STORE_CHECK_SECONDS > 0 and time.monotonic() - _vector_store_checked >= VECTOR_STORE_CHECK_SECONDS:
+        refresh_vector_store()
+    return _vector_store
+
+
+def refresh_vector_store() -> bool:
+    """
+    Reload the shared vector store if its files changed since it was loaded. The new
+    store is swapped in whole, so queries already running finish on the old one.
+    Returns whether it was reloaded.
+    """
+    global _vector_store, _vector_store_checked
+    with _lock:
+        _vector_store_checked = time.monotonic()
+        store = _vector_store
+        if store is None or not store.stale():
+            return False
+        from app.vector_store import get_vector_store as build_vector_store
+
+        fresh = build_vector_store()
+        if fresh.stale():
+            # Files still being written; try again on the next check
+            return False
+        _vector_store = fresh
+    logger.info("Vector store files changed; reloaded %s", type(_vector_store).__name__)
+    return True
+
+
+def set_genai_client(client):
+    """Replace the shared Gemini client (benchmarks and local tooling)."""
+    global _genai_client
+    _genai_client = client
+
+
+def set_vector_store(store):
+    """Replace the shared vector store (benchmarks and local tooling)."""
+    global _vector_store
+    _vector_store = store
+
+
+def warm_up():
+    """
+    Create every client now instead of on the first request. Blocking; the app runs it
+    in a worker thread at startup so the server starts accepting requests immediately.
+    """
+    try:
+        get_genai_client()
+        get_vector_store()
+    except Exception as e:
+        # Leave it to the first request to retry and surface the error
+        logger.warning("Client warm-up failed: %r", e)
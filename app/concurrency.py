@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class SessionLocks:
+    """
+    One asyncio.Lock per session id, created on demand and dropped once nobody holds
+    or waits for it, so idle sessions cost nothing. Serializes history mutations
+    within a worker; across workers the session store's versioning takes over.
+    """
+
+    def __init__(self):
+        # session_id -> [lock, holders + waiters]
+        self._locks: dict[str, list] = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def __contains__(self, session_id: str) -> bool:
+        """Whether a request holds or waits for the session's lock."""
+        return session_id in self._locks
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls: while a call for a key is running, callers
+    with the same key await its result instead of starting their own. The work runs
+    in its own task, so a caller that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, call):
+        """Return await call() for key, sharing one in-flight run per key."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+
+            def forget(done):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+session_locks = SessionLocks()
@@ -0,0 +1,88 @@
+import os
+import re
+from dotenv import load_dotenv
+from app.catalog import _MONTHLY_RE, parse_inr, strip_citations
+
+load_dotenv()
+
+# Annual fee at or below which a card counts as "low/waived fee"
+LOW_FEE_MAX_INR = float(os.getenv("LOW_FEE_MAX_INR", "1000"))
+
+# Open-ended bounds for cards that state no constraint
+MIN_AGE, MAX_AGE = 18, 100
+
+_AGE_RANGE_RE = re.compile(r"age\s*(\d{2})\s*(?:-|–|to)\s*(\d{2})", re.IGNORECASE)
+_AGE_MIN_RE = re.compile(r"age\s*(\d{2})\s*\+", re.IGNORECASE)
+_AMOUNT_RE = re.compile(r"₹\s*[\d.,]+\+?\s*(?:lakhs?|lpa|l\b|k\b)?", re.IGNORECASE)
+
+
+def _min_monthly_income(eligibility: str) -> float:
+    """
+    Lowest monthly income any applicant type qualifies with, e.g.
+    "Salaried: ₹1,00,000+/month; Self-Employed: ₹12+ lakh p.a." gives 1,00,000.
+    Cards without a stated income threshold give 0.
+    """
+    thresholds = []
+    for clause in re.split(r";|\bor\b", eligibility):
+        amount_match = _AMOUNT_RE.search(clause)
+        if not amount_match:
+            continue
+        amount = parse_inr(amount_match.group(0))
+        if not amount:
+            continue
+        tail = clause[amount_match.start() :]
+        thresholds.append(amount if _MONTHLY_RE.search(tail) else amount / 12)
+    return min(thresholds) if thresholds else 0.0
+
+
+def eligibility_columns(card: dict) -> dict:
+    """
+    Numeric columns parsed from a card's eligibility and fee strings. They are stored
+    with the card's vector metadata so both vector backends can filter on them.
+    """
+    eligibility = strip_citations(card.get("eligibility", ""))
+    min_age, max_age = MIN_AGE, MAX_AGE
+    age_range = _AGE_RANGE_RE.search(eligibility)
+    if age_range:
+        min_age, max_age = int(age_range.group(1)), int(age_range.group(2))
+    else:
+        age_min = _AGE_MIN_RE.search(eligibility)
+        if age_min:
+            min_age = int(age_min.group(1))
+    return {
+        "min_income_monthly": _min_monthly_income(eligibility),
+        "min_age": min_age,
+        "max_age": max_age,
+        "joining_fee_inr": parse_inr(card.get("joining_fee", "")) or 0.0,
+        "annual_fee_inr": parse_inr(card.get("annual_fee", "")) or 0.0,
+    }
+
+
+def monthly_income(prefs: dict):
+    income = prefs.get("income")
+    if not isinstance(income, (int, float)) or income <= 0:
+        return None
+    if prefs.get("income_period") == "annual":
+        return income / 12
+    return float(income)
+
+
+def build_eligibility_filter(prefs: dict, include_fee: bool = True):
+    """
+    Metadata filter (Pinecone filter syntax, also understood by the local store)
+    that keeps only cards the user qualifies for: income at or above the card's
+    minimum, age within its range, and, when the user asked for a low/waived fee,
+    an annual fee of at most LOW_FEE_MAX_INR. Unknown preferences add no clause.
+    Returns None when there is nothing to filter on.
+    """
+    clauses = {}
+    income = monthly_income(prefs)
+    if income is not None:
+        clauses["min_income_monthly"] = {"$lte": income}
+    age = prefs.get("age")
+    if isinstance(age, (int, float)) and age > 0:
+        clauses["min_age"] = {"$lte": age}
+        clauses["max_age"] = {"$gte": age}
+    if include_fee and prefs.get("annual_fee_preference") is True:
+        clauses["annual_fee_inr"] = {"$lte": LOW_FEE_MAX_INR}
+    return clauses or None
@@ -1,15 +1,164 @@
-from google import genai
-from google.genai import types
+import asyncio
+import hashlib
+import logging
 import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
 from dotenv import load_dotenv
+from app.clients import get_genai_client
+from app.llm import embed
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
+EMBEDDING_MODEL = "text-embedding-004"
+EMBEDDING_TASK_TYPE = "SEMANTIC_SIMILARITY"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "10000"))
+# embed_content accepts at most 100 contents per request
+EMBED_BATCH_SIZE = 100
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache. Keys are a SHA-256 of model, task type and text.
+    Recent vectors stay in an in-memory LRU bounded to max_items; every vector is also
+    written to a SQLite file so the cache survives restarts. Pass path=None to keep
+    it memory-only. The memory tier never waits for the disk tier, so async callers
+    can check memory on the event loop and leave disk reads and writes to a thread.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_items: int = EMBEDDING_CACHE_MAX_ITEMS):
+        self.max_items = max_items
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache disk tier disabled: %s", e)
+                self._db = None
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{task_type}\0{text}".encode("utf-8")).hexdigest()
+
+    @property
+    def has_disk(self) -> bool:
+        return self._db is not None
+
+    def get(self, key: str):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: list[str], memory_only: bool = False) -> list:
+        """
+        Cached vectors for keys in order, None where not cached. With memory_only the
+        disk tier is skipped and misses are not counted; a follow-up call for the
+        missing keys reads the disk.
+        """
+        vectors = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    vectors[i] = vector
+        if memory_only:
+            return vectors
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        stored = {}
+        if missing and self._db is not None:
+            wanted = list({keys[i] for i in missing})
+            with self._db_lock:
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start : start + 500]
+                    stored.update(
+                        self._db.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        ).fetchall()
+                    )
+        with self._lock:
+            for i in missing:
+                blob = stored.get(keys[i])
+                if blob is None:
+                    self.misses += 1
+                    continue
+                vectors[i] = array("f", blob).tolist()
+                self._remember(keys[i], vectors[i])
+                self.disk_hits += 1
+        return vectors
 
-def generate_embedding(card: dict):
+    def put(self, key: str, vector, model: str = EMBEDDING_MODEL):
+        self.put_many([(key, vector)], model)
+
+    def put_many(self, items: list, model: str = EMBEDDING_MODEL, persist: bool = True):
+        """
+        Cache (key, vector) pairs in memory and, with persist, write them to disk in one
+        transaction. Returns the pairs with the vectors as lists of floats.
+        """
+        items = [(key, [float(v) for v in vector]) for key, vector in items]
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+        if persist:
+            self.persist(items, model)
+        return items
+
+    def persist(self, items: list, model: str = EMBEDDING_MODEL):
+        """Write (key, vector) pairs to the disk tier with a single commit."""
+        if self._db is None or not items:
+            return
+        with self._db_lock:
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    [(key, model, array("f", vector).tobytes()) for key, vector in items],
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache write failed: %s", e)
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+embedding_cache = EmbeddingCache()
+
+
+def card_embedding_text(card: dict) -> str:
     # Convert the card to a flat text string for embedding
-    card_text = f"""
+    return f"""
     Name: {card['name']}
     Issuer: {card['issuer']}
     Joining Fee: {card['joining_fee']}
@@ -19,35 +168,117 @@ def generate_embedding(card: dict):
     Eligibility: {card['eligibility']}
     Perks: {card['special_perks']}
     """
-    result = client.models.embed_content(
-        model="text-embedding-004",
-        contents=card_text,
-        config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
-    )
+
+
+def _embedding_values(result) -> list[float]:
     embedding = result.embeddings
-    print("DEBUG: embedding type:", type(embedding))
-    print("DEBUG: embedding value:", embedding)
+    # If embedding is a list of ContentEmbedding, get the .values from the first
+    if isinstance(embedding, list) and hasattr(embedding[0], "values"):
+        return embedding[0].values
     # Flatten if nested (e.g., [[...]] instead of [...])
     if (
         isinstance(embedding, list)
         and len(embedding) == 1
         and isinstance(embedding[0], list)
     ):
-        embedding = embedding[0]
-    print("DEBUG: final embedding type:", type(embedding))
-    print("DEBUG: final embedding value:", embedding)
+        return embedding[0]
     return embedding
 
 
-def generate_text_embedding(text: str):
-    result = client.models.embed_content(
-        model="text-embedding-004",
-        contents=text,
-        config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
-    )
-    embedding = result.embeddings
-    # If embedding is a list of ContentEmbedding, get the .values from the first
-    if isinstance(embedding, list) and hasattr(embedding[0], "values"):
-        return embedding[0].values
+def generate_embedding(card: dict) -> list[float]:
+    return generate_embeddings_batch([card_embedding_text(card)])[0]
+
+
+def generate_embeddings_batch(texts: list[str], batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Embed many texts with as few embed_content calls as possible. Cached vectors are
+    reused and only the misses are sent, batch_size texts per request. Returns the
+    vectors in input order.
+    """
+    keys = [
+        EmbeddingCache.make_key(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, text)
+        for text in texts
+    ]
+    vectors = embedding_cache.get_many(keys)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start : start + batch_size]
+        result = get_genai_client().models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=[texts[i] for i in chunk],
+            config={"task_type": EMBEDDING_TASK_TYPE},
+        )
+        # One commit per request, so an interrupted seed run keeps what it paid for
+        cached = embedding_cache.put_many(
+            [(keys[i], embedding.values) for i, embedding in zip(chunk, result.embeddings)]
+        )
+        for i, (_, vector) in zip(chunk, cached):
+            vectors[i] = vector
+    return vectors
+
+
+async def _cached_vectors(keys: list[str]) -> list:
+    """Cache lookups on the event loop for the memory tier, in a worker thread for the disk."""
+    vectors = embedding_cache.get_many(keys, memory_only=True)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        lookup = [keys[i] for i in missing]
+        if embedding_cache.has_disk:
+            found = await asyncio.to_thread(embedding_cache.get_many, lookup)
+        else:
+            found = embedding_cache.get_many(lookup)
+        for i, vector in zip(missing, found):
+            vectors[i] = vector
+    return vectors
+
+
+async def _cache_vectors(items: list):
+    """Remember new (key, vector) pairs now; write them to disk in a worker thread, one commit."""
+    items = embedding_cache.put_many(items, persist=False)
+    if embedding_cache.has_disk:
+        await asyncio.to_thread(embedding_cache.persist, items)
+
+
+async def generate_text_embedding(text: str):
+    key = EmbeddingCache.make_key(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, text)
+    cached = (await _cached_vectors([key]))[0]
+    if cached is not None:
+        return cached
+    result = await embed(text, EMBEDDING_MODEL, {"task_type": EMBEDDING_TASK_TYPE})
+    embedding = _embedding_values(result)
+    await _cache_vectors([(key, embedding)])
     return embedding
 
+
+async def generate_text_embeddings(texts: list[str], batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Async counterpart of generate_embeddings_batch: cached vectors are reused, the
+    distinct misses go out in embed_content calls of batch_size texts. Returns the
+    vectors in input order.
+    """
+    keys = [
+        EmbeddingCache.make_key(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, text)
+        for text in texts
+    ]
+    vectors = await _cached_vectors(keys)
+    # One request per distinct text, however many sessions share it
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    pending = list(missing.values())
+    fetched = []
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start : start + batch_size]
+        result = await embed(
+            [texts[rows[0]] for rows in chunk],
+            EMBEDDING_MODEL,
+            {"task_type": EMBEDDING_TASK_TYPE},
+        )
+        for rows, embedding in zip(chunk, result.embeddings):
+            vector = list(embedding.values)
+            fetched.append((keys[rows[0]], vector))
+            for i in rows:
+                vectors[i] = vector
+    await _cache_vectors(fetched)
+    return vectors
@@ -0,0 +1,412 @@
+import os
+import re
+from dotenv import load_dotenv
+from app.catalog import _ANNUAL_RE, _INR_RE, _MONTHLY_RE, get_catalog, inr_period, parse_inr_amounts
+
+load_dotenv()
+
+# Answers resolved with at least this confidence are folded into the preferences
+# without asking the LLM extractor
+FAST_EXTRACT_MIN_CONFIDENCE = float(os.getenv("FAST_EXTRACT_MIN_CONFIDENCE", "0.75"))
+
+# Longer answers usually carry more than the one field that was asked for
+MAX_ANSWER_WORDS = 16
+
+SPENDING_CATEGORIES = {
+    "fuel": r"fuel|petrol|diesel",
+    "travel": r"travel|flights?|trips?|hotels?",
+    "groceries": r"grocer(?:y|ies)",
+    "dining": r"dining|eat(?:ing)? out|restaurants?|food",
+    "online_shopping": r"online shopping|shop(?:ping)? online|e-?commerce|online purchases",
+    "utilities": r"utilit(?:y|ies)|electricity|bills?\b|dth|recharges?",
+}
+
+# The field a bot question asks for, first match wins. Questions often list examples
+# ("cashback, fuel surcharge waiver, ..."), so the specific phrasings come first.
+_QUESTION_RULES = [
+    ("credit_score", r"credit score|cibil"),
+    ("existing_cards", r"already (?:have|use|hold)|existing (?:credit )?cards?|currently (?:have|use|hold)"),
+    ("reward_preferences", r"(?:type|kind)s? of (?:rewards?|benefits?)|rewards? or benefits?|prefer\w* .*(?:rewards?|benefits?)"),
+    ("bank_preference", r"\bbank\b|\bissuer"),
+    ("special_features", r"\bfeatures?\b|\bperks?\b"),
+    ("annual_fee_preference", r"\bfees?\b"),
+    ("custom_spending", r"\bother\b.*(?:spend|categor|expense)|(?:spend|categor|expense).*\bother\b"),
+    ("spending", r"\bspend|\bspent\b|expenses?|how much"),
+    ("income", r"income|salary|earn"),
+    ("age", r"\bage\b|how old"),
+]
+
+_REWARD_TERMS = {
+    "cashback": r"cash\s*-?\s*back",
+    "reward points": r"reward points?|\bpoints\b",
+    "travel rewards": r"travel(?: rewards?| benefits?)?|air ?miles|\bmiles\b",
+    "lounge access": r"(?:airport )?lounges?(?: access)?",
+    "dining discounts": r"dining(?: discounts?| offers?)?|restaurants?",
+    "fuel surcharge waiver": r"fuel(?: surcharge)?(?: waiver)?|petrol",
+    "movie tickets": r"movies?(?: tickets?)?|cinema|bookmyshow",
+    "shopping discounts": r"(?:online )?shopping(?: discounts?| offers?)?",
+    "grocery discounts": r"grocer(?:y|ies)",
+    "utility bill rewards": r"utilit(?:y|ies)|bill payments?",
+    "low forex markup": r"forex(?: markup)?|foreign (?:currency|transaction)s?",
+    "no annual fee": r"no (?:annual |joining )?fees?|lifetime free|\bltf\b|zero fees?",
+    "milestone benefits": r"milestones?(?: benefits?)?",
+    "welcome benefits": r"welcome (?:bonus|benefits?|gifts?)",
+    "insurance": r"insurance",
+    "golf": r"golf",
+    "concierge": r"concierge",
+}
+
+# Issuers that are not in the catalog but come up in answers
+_EXTRA_BANKS = {
+    "amex": "American Express",
+    "idfc": "IDFC FIRST Bank",
+    "yes bank": "YES Bank",
+    "hsbc": "HSBC",
+    "standard chartered": "Standard Chartered",
+    "citi": "Citibank",
+    "bank of baroda": "Bank of Baroda",
+    "bob": "Bank of Baroda",
+    "au bank": "AU Small Finance Bank",
+    "federal bank": "Federal Bank",
+    "onecard": "OneCard",
+}
+
+_CARD_NAME_NOISE = {"credit", "card", "cards", "bank", "signature"}
+
+# Words that carry no information of their own once the recognised terms are removed
+_FILLER = set(
+    """a an and the i i'm im me my we our is are am it its of for to on in at with or
+    also only just mostly mainly maybe probably really very would like want prefer
+    preferably love any some something things stuff have has use using currently
+    already card cards credit bank banks rewards reward benefits benefit discounts
+    discount offers offer perks perk access waiver surcharge both all kind type
+    good great nice yes yeah yep sure please thanks thank you ok okay etc one two
+    more most definitely especially other others else plus about around roughly
+    approx approximately nearly almost under over less than max maximum spend spends
+    spending spent per rs inr rupees month year monthly""".split()
+)
+
+_NEGATIVE_RE = re.compile(
+    r"(?:no+|nope|nah|none|nothing|nil|na|n/a|zero|0|not really|not particularly|"
+    r"no preferences?|no specific(?: \w+)?|no particular(?: \w+)?|nothing (?:much|else|specific|really)|"
+    r"any|any bank|anything|anyone|any of them|doesn'?t matter|does not matter|"
+    r"no,? thanks?(?: you)?|not at all|"
+    r"(?:i )?(?:don'?t|do not) (?:have|use|hold|spend|care|need|mind)(?: (?:any|anything|much))?(?: \w+){0,3})",
+)
+# A negation anywhere in an otherwise matching answer ("no lounge", "anything but hdfc")
+# flips its meaning, which the term matchers cannot tell; those go to the LLM extractor
+_NEGATION_RE = re.compile(
+    r"\b(?:no|not|never|none|nor|neither|without|except|excluding|anything but|other than|apart from)\b"
+    r"|n['’]t\b|\b(?:dont|doesnt|didnt|cant|wont|isnt|arent)\b"
+)
+_NO_FEE_RE = re.compile(r"no (?:annual |joining )?fees?")
+_SMALL_TALK_RE = re.compile(r"(?:ok(?:ay)?|hi|hello|hey|thanks?(?: you)?|thank you|cool|got it|alright)")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z\"“‘'(])")
+
+# (catalog version, table); rebuilt when the catalog is reloaded
+_banks = (None, None)
+_cards = (None, None)
+
+
+def _known_banks() -> dict:
+    """alias -> issuer name, from the catalog's issuers plus _EXTRA_BANKS."""
+    global _banks
+    catalog = get_catalog()
+    if _banks[0] != catalog.version:
+        banks = {}
+        for card in catalog.cards:
+            issuer = card.issuer or ""
+            if not issuer:
+                continue
+            banks[issuer.lower()] = issuer
+            first = issuer.split()[0].lower()
+            if len(first) >= 3 and first not in ("american", "the"):
+                banks[first] = issuer
+        banks.update(_EXTRA_BANKS)
+        _banks = (catalog.version, banks)
+    return _banks[1]
+
+
+def _known_cards() -> list:
+    """(card name, words that identify it) for every catalog card."""
+    global _cards
+    catalog = get_catalog()
+    if _cards[0] != catalog.version:
+        cards = []
+        for card in catalog.cards:
+            issuer_words = set((card.issuer or "").lower().split())
+            words = {
+                w
+                for w in re.findall(r"[a-z]+", card.name.lower())
+                if w not in issuer_words and w not in _CARD_NAME_NOISE
+            }
+            if words:
+                cards.append((card.name, words))
+        _cards = (catalog.version, cards)
+    return _cards[1]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").lower()).strip()
+
+
+def _bare(text: str) -> str:
+    """text without surrounding punctuation, for whole-answer matches."""
+    return re.sub(r"^[\s.,!?;:'\"]+|[\s.,!?;:'\"]+$", "", text)
+
+
+def _is_negative(text: str) -> bool:
+    return bool(_NEGATIVE_RE.fullmatch(_bare(text)))
+
+
+def _is_negated(text: str) -> bool:
+    """Whether text negates part of itself; "no annual fee" is a feature, not a negation."""
+    return bool(_NEGATION_RE.search(_NO_FEE_RE.sub(" ", text)))
+
+
+def _has_leftover(text: str) -> bool:
+    """Whether text still has content words once the recognised terms are removed."""
+    words = re.findall(r"[a-z][a-z']+", text)
+    return any(w not in _FILLER and len(w) > 2 for w in words)
+
+
+def _field_of(question: str):
+    for field, pattern in _QUESTION_RULES:
+        if not re.search(pattern, question):
+            continue
+        if field != "spending":
+            return field, None
+        categories = [c for c, p in SPENDING_CATEGORIES.items() if re.search(p, question)]
+        return (field, categories[0]) if len(categories) == 1 else None
+    return None
+
+
+def _locate(bot_text: str):
+    """(field, spending category, question sentence) for a bot message, or None."""
+    sentences = _SENTENCE_END_RE.split(bot_text or "")
+    # Follow-ups like "If so, roughly how much per month?" lean on the question before them
+    asked = [s for s in sentences if "?" in s] or sentences[-1:]
+    for sentence in reversed(asked):
+        question = _normalize(sentence)
+        target = _field_of(question)
+        if target is not None:
+            return target[0], target[1], question
+    return None
+
+
+def question_field(bot_text: str):
+    """
+    (field, spending category) the bot message asks for, e.g. ("income", None) or
+    ("spending", "fuel"), or None when it cannot be told.
+    """
+    target = _locate(bot_text)
+    return target[:2] if target else None
+
+
+def _parse_age(answer: str):
+    numbers = re.findall(r"\d+(?:\.\d+)?", answer)
+    if len(numbers) != 1 or re.search(r"₹|\d\s*k\b|lakh|\brs\b", answer):
+        return None
+    age = float(numbers[0])
+    if not 18 <= age <= 100:
+        return None
+    return {"age": int(age)}, {"age": 0.95}
+
+
+def _parse_income(question: str, answer: str):
+    amounts = parse_inr_amounts(answer)
+    if len(amounts) != 1 or amounts[0] <= 0:
+        return None
+    income = amounts[0]
+    period = inr_period(answer)
+    confidence = 0.95
+    if period is None:
+        # The question may already fix the period ("What is your monthly income?")
+        asked = inr_period(question)
+        asks_both = "monthly or annual" in question or "annual or monthly" in question
+        if asked and not asks_both:
+            period, confidence = asked, 0.9
+        elif re.search(r"lpa|lakhs? per|ctc", answer) or income >= 500_000:
+            # "12 lakh" is how annual packages are quoted; few monthly salaries get there
+            period, confidence = "annual", 0.8
+        elif income < 100_000:
+            # A lakh or more could be either ("3 lakh" a month or a year); the LLM asks
+            period, confidence = "monthly", 0.8
+        else:
+            return None
+    return {"income": int(round(income)), "income_period": period}, {
+        "income": confidence,
+        "income_period": confidence,
+    }
+
+
+def _parse_spending(category: str, question: str, answer: str):
+    key = f"spending.{category}"
+    if _is_negative(answer):
+        return {"spending": {category: 0}}, {key: 0.9}
+    amounts = parse_inr_amounts(answer)
+    if len(amounts) != 1:
+        return None
+    amount = amounts[0]
+    confidence = 0.95
+    if (inr_period(answer) or inr_period(question)) == "annual":
+        amount /= 12
+        confidence = 0.9
+    if _has_leftover(_INR_RE.sub(" ", _MONTHLY_RE.sub(" ", answer))):
+        confidence = 0.7
+    return {"spending": {category: int(round(amount))}}, {key: confidence}
+
+
+def _parse_custom_spending(answer: str):
+    if _is_negative(answer):
+        return {"custom_spending": {}}, {"custom_spending": 0.9}
+    amounts = parse_inr_amounts(answer)
+    if len(amounts) != 1:
+        return None
+    amount = amounts[0] / (12 if inr_period(answer) == "annual" else 1)
+    rest = _INR_RE.sub(" ", _ANNUAL_RE.sub(" ", _MONTHLY_RE.sub(" ", answer)))
+    words = [
+        w
+        for w in re.findall(r"[a-z][a-z']+", rest)
+        if w not in _FILLER
+    ]
+    if not 1 <= len(words) <= 3:
+        return None
+    name = "_".join(words)
+    return {"custom_spending": {name: int(round(amount))}}, {f"custom_spending.{name}": 0.8}
+
+
+def _parse_terms(field: str, answer: str):
+    if _is_negative(answer):
+        return {field: []}, {field: 0.9}
+    if _is_negated(answer):
+        return None
+    found = []
+    rest = answer
+    for term, pattern in _REWARD_TERMS.items():
+        if re.search(pattern, rest):
+            found.append(term)
+            rest = re.sub(pattern, " ", rest)
+    if not found:
+        return None
+    return {field: found}, {field: 0.7 if _has_leftover(rest) else 0.9}
+
+
+def _parse_bank(answer: str):
+    if _is_negative(answer):
+        # Answered, just nothing to record
+        return {}, {"bank_preference": 0.9}
+    found = []
+    rest = answer
+    for alias in sorted(_known_banks(), key=len, reverse=True):
+        pattern = rf"\b{re.escape(alias)}\b"
+        if re.search(pattern, rest):
+            if _known_banks()[alias] not in found:
+                found.append(_known_banks()[alias])
+            rest = re.sub(pattern, " ", rest)
+    if re.search(r"\bno (?:specific |particular )?preference|\bany\b", answer):
+        # "not any particular one, maybe sbi" still names a bank
+        return None if found else ({}, {"bank_preference": 0.9})
+    if not found or _is_negated(answer):
+        return None
+    confidence = 0.7 if _has_leftover(rest) else 0.95
+    return {"bank_preference": " or ".join(found)}, {"bank_preference": confidence}
+
+
+def _parse_fee(question: str, answer: str):
+    if re.search(r"no (?:annual |joining )?fees?|lifetime free|\bltf\b|zero fees?|\b(?:low|lower|waived|minimal)\b", answer):
+        # "I don't need a low fee card" mentions the same words the other way round
+        if _is_negated(answer):
+            return None
+        return {"annual_fee_preference": True}, {"annual_fee_preference": 0.9}
+    if re.search(r"(?:don'?t|do not) mind|fine (?:with|paying)|ok(?:ay)? (?:with|paying)|doesn'?t matter|not (?:an? )?(?:issue|concern|problem)", answer):
+        return {"annual_fee_preference": False}, {"annual_fee_preference": 0.9}
+    # A bare yes/no means "low fee" or "fine paying" depending on how the question is put
+    wants_low = bool(re.search(r"\blow\b|waived|\bno (?:annual )?fee|\bfree\b|avoid|minimal|zero", question))
+    willing = bool(re.search(r"\bpay(?:ing)?\b|okay|\bok\b|fine|willing|comfortable|\bmind\b", question))
+    if wants_low == willing:
+        return None
+    bare = _bare(answer)
+    if re.fullmatch(r"(?:yes|yeah|yep|yup|sure|definitely|of course|absolutely|y|please|yes please)", bare):
+        return {"annual_fee_preference": wants_low}, {"annual_fee_preference": 0.9}
+    if re.fullmatch(r"(?:no|nope|nah|not really|n|no thanks)", bare):
+        return {"annual_fee_preference": not wants_low}, {"annual_fee_preference": 0.9}
+    return None
+
+
+def _parse_credit_score(answer: str):
+    numbers = re.findall(r"\d+", answer)
+    if len(numbers) == 1 and 300 <= int(numbers[0]) <= 900:
+        return {"credit_score": numbers[0]}, {"credit_score": 0.95}
+    if len(numbers) == 2 and all(300 <= int(n) <= 900 for n in numbers):
+        return {"credit_score": "-".join(numbers)}, {"credit_score": 0.9}
+    if numbers:
+        return None
+    if re.search(r"unknown|not sure|don'?t know|no idea|never checked|not checked|no clue", answer):
+        return {"credit_score": "unknown"}, {"credit_score": 0.9}
+    match = re.fullmatch(r"(?:it'?s |it is |pretty |very |quite )?(excellent|very good|good|fair|average|okay|poor|bad|low|high)", _bare(answer))
+    if match:
+        return {"credit_score": match.group(1)}, {"credit_score": 0.85}
+    return None
+
+
+def _parse_existing_cards(answer: str):
+    if _is_negative(answer) or re.fullmatch(r"no(?:,? i don'?t| credit cards?| cards?)?", _bare(answer)):
+        return {"existing_cards": []}, {"existing_cards": 0.9}
+    if _is_negated(answer):
+        return None
+    words = set(re.findall(r"[a-z]+", answer))
+    matches = [(name, ident) for name, ident in _known_cards() if ident <= words]
+    # "Regalia Gold" also contains "Regalia"; keep only the most specific names
+    matches = [(n, i) for n, i in matches if not any(i < other for _, other in matches)]
+    if not matches:
+        return None
+    names = [name for name, _ in matches]
+    issuers = {card.issuer for card in get_catalog().cards if card.name in names}
+    aliases = {alias for alias, issuer in _known_banks().items() if issuer in issuers}
+    rest = words - set().union(*(i for _, i in matches)) - set().union(*(a.split() for a in aliases))
+    leftover = _has_leftover(" ".join(sorted(rest)))
+    return {"existing_cards": names}, {"existing_cards": 0.7 if leftover else 0.9}
+
+
+def extract_answer(bot_text: str, user_text: str):
+    """
+    Deterministic extraction of the user's answer to the bot message before it.
+    Returns (preference update, {field: confidence}) when every field in the update
+    clears FAST_EXTRACT_MIN_CONFIDENCE, or None when the LLM extractor is needed.
+    The update has the same shape as the LLM extractor's output (see merge_preferences).
+    """
+    answer = _normalize(user_text)
+    if not answer:
+        return {}, {}
+    target = _locate(bot_text)
+    if target is None:
+        if _SMALL_TALK_RE.fullmatch(_bare(answer)):
+            return {}, {}
+        return None
+    if len(answer.split()) > MAX_ANSWER_WORDS:
+        return None
+
+    field, category, question = target
+    if field == "age":
+        result = _parse_age(answer)
+    elif field == "income":
+        result = _parse_income(question, answer)
+    elif field == "spending":
+        result = _parse_spending(category, question, answer)
+    elif field == "custom_spending":
+        result = _parse_custom_spending(answer)
+    elif field in ("reward_preferences", "special_features"):
+        result = _parse_terms(field, answer)
+    elif field == "bank_preference":
+        result = _parse_bank(answer)
+    elif field == "annual_fee_preference":
+        result = _parse_fee(question, answer)
+    elif field == "credit_score":
+        result = _parse_credit_score(answer)
+    else:
+        result = _parse_existing_cards(answer)
+
+    if result is None or min(result[1].values(), default=1.0) < FAST_EXTRACT_MIN_CONFIDENCE:
+        return None
+    return result
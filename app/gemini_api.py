@@ -1,72 +1,137 @@
-import os
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from app.system_prompt import SYSTEM_PROMPT
-from app.embedding_utils import generate_embedding
-import json
-from pathlib import Path
+import logging
+import re
+from contextlib import aclosing
+from app.chat_context import build_chat_prompt
+from app.concurrency import session_locks
+from app.llm import generate, generate_stream
+from app.metrics import record_tokens, span
+from app.session_store import SessionStore, history_offset
+from app.system_prompt import FALLBACK_DONE, FALLBACK_QUESTIONS
+from app.utils import apply_fast_extraction, preferences_complete
 
-SESSIONS_FILE = Path("sessions.json")
+logger = logging.getLogger(__name__)
 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
+# Session store: { session_id: { history: [], preferences: {} } }, loaded lazily from
+# SQLite and persisted incrementally (sessions.json is migrated by the app lifespan). Sessions
+# a request holds the lock for are never evicted from memory under it.
+sessions = SessionStore(pinned=session_locks.__contains__)
 
-genai_client = genai.Client(api_key=api_key)
 
-# In-memory store for sessions: { session_id: { history: [], preferences: {} } }
-sessions: dict = {}
+GEMINI_ERROR_REPLY = "⚠️ Error from Gemini."
+INITIAL_BOT_MESSAGE = "Hello! 👋 I can help you find the best credit card for your needs. To get started, may I know your age?"
+FALLBACK_PREFIX = "I'm having a little trouble right now, so let's keep it simple. "
+# SYSTEM_PROMPT has the bot open its last message with this once it has every answer
+COMPLETION_MARKER = re.compile(r"\bDONE\b")
 
-if SESSIONS_FILE.exists():
-    try:
-        with open(SESSIONS_FILE, "r") as f:
-            sessions = json.load(f)
-    except Exception as e:
-        print("Failed to load sessions.json:", e)
 
+class ReplyTruncated(Exception):
+    """The chat stream failed after part of the reply was sent; the turn was not saved."""
 
-def save_sessions():
-    try:
-        with open(SESSIONS_FILE, "w") as f:
-            json.dump(sessions, f, indent=2)
-    except Exception as e:
-        print("Failed to save sessions.json:", e)
+
+def interview_complete(session: dict, reply: str) -> bool:
+    """Whether the interview is over after this reply, so recommendations can be prepared."""
+    return bool(COMPLETION_MARKER.search(reply or "")) or preferences_complete(session)
+
+
+def fallback_reply(session: dict) -> str:
+    """
+    Deterministic stand-in for the chat model: the next question of the fixed
+    question flow, chosen by how many answers the user has given so far.
+    """
+    answers = sum(1 for m in session.get("history", []) if m.get("sender") == "user")
+    # A trimmed history is far past the question flow
+    if answers > len(FALLBACK_QUESTIONS) or history_offset(session):
+        return FALLBACK_DONE
+    return FALLBACK_PREFIX + FALLBACK_QUESTIONS[max(answers, 1) - 1]
 
 
-# Ask Gemini using the documented way
-def ask_gemini(prompt: str) -> str:
+# Ask Gemini through the async client so the event loop keeps serving other sessions
+async def ask_gemini(prompt: str, fallback: str = GEMINI_ERROR_REPLY) -> str:
     try:
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
-            ),
-        )
+        with span("llm.chat"):
+            response = await generate(prompt, "llm.chat")
+        record_tokens("llm.chat", response)
         return response.text
     except Exception as e:
-        print("Gemini Error:", e)
-        return "⚠️ Error from Gemini."
+        logger.warning("Gemini chat call failed, using fallback reply: %r", e)
+        return fallback
 
 
-async def chat_with_gemini(session_id: str, user_input: str) -> str:
-    session = sessions.setdefault(session_id, {"history": [], "preferences": {}})
+async def _start_turn(session_id: str, user_input: str):
+    session = sessions.get_or_create(session_id, holder=True)
     # Ensure the initial bot message is present for every new session
-    INITIAL_BOT_MESSAGE = "Hello! 👋 I can help you find the best credit card for your needs. To get started, may I know your age?"
     if not session["history"]:
         session["history"].append({"sender": "bot", "text": INITIAL_BOT_MESSAGE})
 
-    session["history"].append({"sender": "user", "text": user_input})
+    user_turn = {"sender": "user", "text": user_input}
+    session["history"].append(user_turn)
 
-    prompt = "\n".join([f"{m['sender']}: {m['text']}" for m in session["history"]])
-    
-    full_prompt = f"{SYSTEM_PROMPT}\n{prompt}"
+    # System prompt + summary of older turns + the most recent turns, within a token budget
+    full_prompt = await build_chat_prompt(session)
+    return session, user_turn, full_prompt
 
-    bot_reply = ask_gemini(full_prompt)
-    session["history"].append({"sender": "bot", "text": bot_reply})
 
+async def chat_with_gemini(session_id: str, user_input: str) -> str:
+    # One turn at a time per session, so concurrent messages cannot interleave
+    async with session_locks.hold(session_id):
+        session, _, full_prompt = await _start_turn(session_id, user_input)
 
+        bot_reply = await ask_gemini(full_prompt, fallback_reply(session))
+        session["history"].append({"sender": "bot", "text": bot_reply})
+        # Fold the answer into the preferences now, while it is cheap
+        apply_fast_extraction(session)
 
-    save_sessions()  #persist data after each reply
+        with span("session.save"):
+            await sessions.save_async(session_id)  # queue the new turns for the flush
 
     return bot_reply
+
+
+async def stream_chat_with_gemini(session_id: str, user_input: str):
+    """
+    Async generator yielding the bot reply in chunks as Gemini produces them. The user
+    turn and the assembled reply are saved only once the stream completes; if the
+    consumer goes away mid-stream the user turn is rolled back and nothing is saved.
+    The same happens when Gemini fails after the first chunk, which raises
+    ReplyTruncated. The session stays locked until then.
+    """
+    async with session_locks.hold(session_id):
+        async with aclosing(_stream_turn(session_id, user_input)) as turn:
+            async for text in turn:
+                yield text
+
+
+async def _stream_turn(session_id: str, user_input: str):
+    session, user_turn, full_prompt = await _start_turn(session_id, user_input)
+    parts = []
+    completed = False
+    last_chunk = None
+    try:
+        stream = generate_stream(full_prompt, "llm.chat_stream")
+        with span("llm.chat_stream"):
+            async with aclosing(stream):
+                async for chunk in stream:
+                    last_chunk = chunk
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+        # Usage totals arrive with the final chunk
+        record_tokens("llm.chat_stream", last_chunk)
+        completed = True
+    except Exception as e:
+        logger.warning("Gemini chat stream failed: %r", e)
+        if parts:
+            # The user already has half a reply; keeping it would save it as a whole one
+            raise ReplyTruncated("".join(parts)) from e
+        reply = fallback_reply(session)
+        parts.append(reply)
+        yield reply
+        completed = True
+    finally:
+        if completed:
+            session["history"].append({"sender": "bot", "text": "".join(parts)})
+            apply_fast_extraction(session)
+            with span("session.save"):
+                await sessions.save_async(session_id)
+        elif session["history"] and session["history"][-1] is user_turn:
+            session["history"].pop()
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from dotenv import load_dotenv
+from app.clients import get_genai_client
+from app.metrics import count, register_gauge
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Model and request config shared by every generate call
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+DEFAULT_CONFIG = {"thinking_config": {"thinking_budget": 0}}
+
+# Upper bound on Gemini requests (chat, extraction, reasons, embeddings) that a
+# single worker keeps in flight at once. Requests beyond this wait their turn
+# instead of piling up on the provider.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+# Per-attempt timeouts in seconds, applied once a concurrency slot is acquired (the
+# wait for a slot counts against the overall deadline below)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "10"))
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "5"))
+# Overall budget per call, retries and backoff included
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+EMBEDDING_DEADLINE_SECONDS = float(os.getenv("EMBEDDING_DEADLINE_SECONDS", "10"))
+
+# Retries after the first attempt, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.25"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "2"))
+
+# Hedging: when an attempt outlives the operation's recent p95 latency, send a second
+# identical request and take whichever answers first
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Circuit breaker: this many consecutive failures open it for the cool-down, during
+# which calls fail fast and callers use their fallbacks
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+class LLMUnavailable(Exception):
+    """Raised instead of calling Gemini while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed until failure_threshold consecutive failures, then open for cooldown
+    seconds. After the cool-down one trial call is let through (half-open); its
+    success closes the breaker, its failure opens it again. A trial that ends any
+    other way (non-retryable error, cancellation) must be released with
+    end_trial(), which counts it as failed.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def end_trial(self):
+        """Called when a call that may have been the trial is over; an unresolved trial failed."""
+        if self.trial_in_flight:
+            self.record_failure()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("Circuit %s opened after %d failures", self.name, self.failures)
+            self.opened_at = time.monotonic()
+
+
+generate_breaker = CircuitBreaker("gemini.generate")
+embed_breaker = CircuitBreaker("gemini.embed")
+
+register_gauge(
+    "ccr_llm_circuit_open",
+    "1 while the circuit breaker for the upstream is open.",
+    lambda: {b.name: int(b.state == "open") for b in (generate_breaker, embed_breaker)},
+)
+
+# operation -> recent successful attempt latencies, for the hedge delay
+_latencies: dict[str, deque] = {}
+
+
+def _record_latency(operation: str, seconds: float):
+    _latencies.setdefault(operation, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def hedge_delay(operation: str):
+    """Recent p95 attempt latency of operation, or None until enough samples exist."""
+    samples = _latencies.get(operation)
+    if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if status in _RETRYABLE_STATUS:
+        return True
+    import httpx
+
+    return isinstance(error, httpx.TransportError)
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+async def run_limited(call, timeout: float = LLM_TIMEOUT_SECONDS, budget: float = None):
+    """
+    Await call() while holding a concurrency slot, raising asyncio.TimeoutError if it
+    does not finish within timeout seconds of getting the slot, or if waiting for the
+    slot plus the call takes longer than budget seconds. call is a zero-argument
+    function returning an awaitable, so nothing is started until a slot is free.
+    """
+
+    async def limited():
+        async with _llm_semaphore:
+            return await asyncio.wait_for(call(), timeout)
+
+    if budget is None:
+        return await limited()
+    return await asyncio.wait_for(limited(), budget)
+
+
+async def _attempt(call, operation: str, timeout: float, hedge: bool, budget: float = None):
+    """One attempt, plus a hedged duplicate if it runs past the p95 latency."""
+    start = time.perf_counter()
+    delay = hedge_delay(operation) if hedge and LLM_HEDGING else None
+    if delay is None or delay >= timeout:
+        result = await run_limited(call, timeout, budget)
+        _record_latency(operation, time.perf_counter() - start)
+        return result
+
+    primary = asyncio.ensure_future(run_limited(call, timeout, budget))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        result = primary.result()
+        _record_latency(operation, time.perf_counter() - start)
+        return result
+    count(operation, "hedge")
+    backup = asyncio.ensure_future(
+        run_limited(
+            call,
+            max(timeout - delay, 0.001),
+            None if budget is None else max(budget - delay, 0.001),
+        )
+    )
+    pending = {primary, backup}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _record_latency(operation, time.perf_counter() - start)
+                    return task.result()
+        # Both failed; surface the primary's error
+        raise primary.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_resilience(
+    call,
+    operation: str,
+    breaker: CircuitBreaker = generate_breaker,
+    timeout: float = LLM_TIMEOUT_SECONDS,
+    deadline: float = LLM_DEADLINE_SECONDS,
+    hedge: bool = True,
+):
+    """
+    Run call() (a zero-argument factory returning an awaitable) with a per-attempt
+    timeout, retries with jittered backoff on retryable errors, optional hedging,
+    all within deadline seconds overall. Raises LLMUnavailable without calling
+    upstream while breaker is open, otherwise the last error once out of attempts.
+    """
+    if not breaker.allow():
+        count(operation, "circuit_open")
+        raise LLMUnavailable(f"{breaker.name} circuit is open")
+    end = time.monotonic() + deadline
+    attempt = 0
+    try:
+        while True:
+            remaining = max(end - time.monotonic(), 0.001)
+            try:
+                result = await _attempt(call, operation, min(timeout, remaining), hedge, remaining)
+                breaker.record_success()
+                return result
+            except Exception as e:
+                retryable = is_retryable(e)
+                pause = _backoff(attempt)
+                if not retryable or attempt >= LLM_MAX_RETRIES or end - time.monotonic() <= pause:
+                    if retryable:
+                        breaker.record_failure()
+                    raise
+                attempt += 1
+                count(operation, "retry")
+                logger.info("Retrying %s after %r (attempt %d)", operation, e, attempt + 1)
+                await asyncio.sleep(pause)
+    finally:
+        # Also covers non-retryable errors and cancellation of a half-open trial
+        breaker.end_trial()
+
+
+async def generate(contents, operation: str, config: dict = None, deadline: float = LLM_DEADLINE_SECONDS):
+    """generate_content on GEMINI_MODEL with DEFAULT_CONFIG plus config overrides."""
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    return await call_with_resilience(
+        lambda: get_genai_client().aio.models.generate_content(
+            model=GEMINI_MODEL, contents=contents, config=config
+        ),
+        operation,
+        deadline=deadline,
+    )
+
+
+async def embed(contents, model: str, config: dict = None):
+    return await call_with_resilience(
+        lambda: get_genai_client().aio.models.embed_content(
+            model=model, contents=contents, config=config
+        ),
+        "embedding",
+        breaker=embed_breaker,
+        timeout=EMBEDDING_TIMEOUT_SECONDS,
+        deadline=EMBEDDING_DEADLINE_SECONDS,
+    )
+
+
+async def stream_limited(call, timeout: float = LLM_TIMEOUT_SECONDS):
+    """
+    Async generator over a streaming call() that holds a concurrency slot until the
+    stream ends. timeout bounds the wait for the stream to open and for each chunk.
+    """
+    # The wait for a slot is bounded by the same timeout as opening the stream
+    await asyncio.wait_for(_llm_semaphore.acquire(), timeout)
+    try:
+        stream = await asyncio.wait_for(call(), timeout)
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            # Release the upstream connection promptly if the consumer stops early
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+    finally:
+        _llm_semaphore.release()
+
+
+async def generate_stream(contents, operation: str, config: dict = None, deadline: float = LLM_DEADLINE_SECONDS):
+    """
+    Streaming generate_content with the same breaker, timeouts and retries as
+    generate(). Retries only happen before the first chunk; once text has been
+    yielded a failure is raised to the caller.
+    """
+    if not generate_breaker.allow():
+        count(operation, "circuit_open")
+        raise LLMUnavailable(f"{generate_breaker.name} circuit is open")
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    end = time.monotonic() + deadline
+    attempt = 0
+    try:
+        while True:
+            started = False
+            stream = stream_limited(
+                lambda: get_genai_client().aio.models.generate_content_stream(
+                    model=GEMINI_MODEL, contents=contents, config=config
+                ),
+                timeout=max(min(LLM_TIMEOUT_SECONDS, end - time.monotonic()), 0.001),
+            )
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                generate_breaker.record_success()
+                return
+            except Exception as e:
+                retryable = is_retryable(e)
+                pause = _backoff(attempt)
+                if started or not retryable or attempt >= LLM_MAX_RETRIES or end - time.monotonic() <= pause:
+                    if retryable:
+                        generate_breaker.record_failure()
+                    raise
+                attempt += 1
+                count(operation, "retry")
+                await asyncio.sleep(pause)
+            finally:
+                await stream.aclose()
+    finally:
+        # A half-open trial abandoned mid-stream (client gone: GeneratorExit) counts as failed
+        generate_breaker.end_trial()
@@ -1,8 +1,39 @@
+import logging
+import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.catalog import start_watcher, stop_watcher
+from app.clients import warm_up
+from app.gemini_api import sessions
 from app.routes import router
 
-app = FastAPI(title="Credit Card Recommender Bot")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+# httpx logs every outbound Gemini request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the Gemini client and vector store in the background so startup is not
+    # held up by the Pinecone handshake; a request arriving first just waits for it
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    # Import a legacy sessions.json once; every worker tries, only one gets the file
+    await asyncio.to_thread(sessions.migrate_json)
+    # Hot-reload data/cards.json when it changes
+    start_watcher()
+    yield
+    stop_watcher()
+    await warm_up_task
+    # Write out anything still waiting for the write-behind flush
+    sessions.close()
+
+
+app = FastAPI(title="Credit Card Recommender Bot", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
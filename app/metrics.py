@@ -0,0 +1,129 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+# stage -> [bucket counts..., +Inf count], sum of seconds
+_histograms: dict[str, list[int]] = {}
+_histogram_sums: dict[str, float] = {}
+# (stage, outcome) -> count
+_calls: dict[tuple[str, str], int] = {}
+# (stage, kind) -> tokens, kind is "prompt" or "completion"
+_tokens: dict[tuple[str, str], int] = {}
+# name -> (help, zero-argument function returning {label value: number})
+_gauges: dict[str, tuple[str, callable]] = {}
+
+
+def observe(stage: str, seconds: float, outcome: str = "ok"):
+    with _lock:
+        counts = _histograms.setdefault(stage, [0] * (len(LATENCY_BUCKETS) + 1))
+        counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        _histogram_sums[stage] = _histogram_sums.get(stage, 0.0) + seconds
+        _calls[(stage, outcome)] = _calls.get((stage, outcome), 0) + 1
+
+
+def count(stage: str, outcome: str):
+    """Count an event for stage without a latency sample (retries, hedges, ...)."""
+    with _lock:
+        _calls[(stage, outcome)] = _calls.get((stage, outcome), 0) + 1
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Time the enclosed block as one call of stage. The duration goes into the stage's
+    latency histogram and the call is counted as ok or error (the exception still
+    propagates). Works inside async functions too. fields are added to the debug log line.
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(stage, elapsed, outcome)
+        if logger.isEnabledFor(logging.DEBUG):
+            extra = "".join(f" {k}={v}" for k, v in fields.items())
+            logger.debug("span stage=%s outcome=%s ms=%.1f%s", stage, outcome, elapsed * 1000, extra)
+
+
+def record_tokens(stage: str, response):
+    """Add the prompt/completion token counts from a Gemini response's usage_metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    with _lock:
+        for kind, attr in (("prompt", "prompt_token_count"), ("completion", "candidates_token_count")):
+            n = getattr(usage, attr, None) or 0
+            if n:
+                _tokens[(stage, kind)] = _tokens.get((stage, kind), 0) + n
+
+
+def register_gauge(name: str, help_text: str, collect):
+    """
+    Expose the numbers returned by collect() as gauge name{key="..."}; collect is called
+    on every scrape and returns a dict of key -> number.
+    """
+    _gauges[name] = (help_text, collect)
+
+
+def _fmt(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        sums = dict(_histogram_sums)
+        calls = dict(_calls)
+        tokens = dict(_tokens)
+
+    lines += [
+        "# HELP ccr_stage_duration_seconds Latency of pipeline stages.",
+        "# TYPE ccr_stage_duration_seconds histogram",
+    ]
+    for stage in sorted(histograms):
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), histograms[stage]):
+            cumulative += n
+            lines.append(f'ccr_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'ccr_stage_duration_seconds_sum{{stage="{stage}"}} {_fmt(sums[stage])}')
+        lines.append(f'ccr_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+
+    lines += [
+        "# HELP ccr_stage_calls_total Calls per pipeline stage by outcome (ok, error, retry, hedge, circuit_open).",
+        "# TYPE ccr_stage_calls_total counter",
+    ]
+    for (stage, outcome), n in sorted(calls.items()):
+        lines.append(f'ccr_stage_calls_total{{stage="{stage}",outcome="{outcome}"}} {n}')
+
+    lines += [
+        "# HELP ccr_llm_tokens_total Gemini tokens used per stage.",
+        "# TYPE ccr_llm_tokens_total counter",
+    ]
+    for (stage, kind), n in sorted(tokens.items()):
+        lines.append(f'ccr_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {n}')
+
+    for name, (help_text, collect) in sorted(_gauges.items()):
+        try:
+            values = collect()
+        except Exception:
+            logger.exception("metrics gauge %s failed", name)
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{name}{{key="{key}"}} {_fmt(value)}')
+    return "\n".join(lines) + "\n"
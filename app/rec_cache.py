@@ -0,0 +1,148 @@
+import bisect
+import copy
+import hashlib
+import json
+import os
+import threading
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from app.catalog import catalog_version, get_catalog
+from app.eligibility import monthly_income
+
+load_dotenv()
+
+REC_CACHE_TTL_SECONDS = float(os.getenv("REC_CACHE_TTL_SECONDS", "3600"))
+REC_CACHE_MAX_ITEMS = int(os.getenv("REC_CACHE_MAX_ITEMS", "1024"))
+REASON_CACHE_MAX_ITEMS = int(os.getenv("REASON_CACHE_MAX_ITEMS", "4096"))
+
+
+def _income_tier(prefs: dict) -> float:
+    """
+    Highest catalog income threshold (monthly) the user's income reaches, -1 below all
+    of them. Incomes in the same tier pass exactly the same eligibility filter, so
+    they can share a cached ranking whatever the thresholds are (Rubyx's 45,833.33).
+    """
+    thresholds = get_catalog().income_thresholds
+    position = bisect.bisect_right(thresholds, monthly_income(prefs))
+    return thresholds[position - 1] if position else -1.0
+
+
+def _round_spend(value) -> int:
+    # Monthly spend to the nearest ₹500
+    return int(round(float(value) / 500) * 500)
+
+
+def _normalize_text(value) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def normalize_preferences(prefs: dict) -> dict:
+    """
+    Canonical form of a preference dict for caching: income (with its period) as its
+    eligibility tier, spend bucketed, strings lower-cased, lists sorted and
+    de-duplicated, empty values dropped.
+    """
+    normalized = {}
+    for field, value in (prefs or {}).items():
+        if value is None or value == [] or value == {} or field == "income_period":
+            continue
+        if field == "income" and isinstance(value, (int, float)):
+            if monthly_income(prefs) is not None:
+                normalized[field] = _income_tier(prefs)
+        elif field in ("spending", "custom_spending") and isinstance(value, dict):
+            buckets = {
+                _normalize_text(k): _round_spend(v)
+                for k, v in value.items()
+                if isinstance(v, (int, float)) and v
+            }
+            normalized[field] = {k: v for k, v in buckets.items() if v}
+        elif isinstance(value, list):
+            normalized[field] = sorted({_normalize_text(v) for v in value if v})
+        elif isinstance(value, str):
+            normalized[field] = _normalize_text(value)
+        else:
+            normalized[field] = value
+    return {k: v for k, v in normalized.items() if v not in ([], {}, "")}
+
+
+def preference_fingerprint(prefs: dict) -> str:
+    payload = json.dumps(normalize_preferences(prefs), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    """
+    TTL + LRU memo of ranked matches per (fingerprint, top_k) and of LLM reasons per
+    (card id, fingerprint). Both caches are dropped whenever the catalog version
+    changes, so a catalog update never serves stale picks.
+    """
+
+    def __init__(
+        self,
+        ttl: float = REC_CACHE_TTL_SECONDS,
+        max_items: int = REC_CACHE_MAX_ITEMS,
+        max_reasons: int = REASON_CACHE_MAX_ITEMS,
+    ):
+        self._matches = TTLCache(maxsize=max_items, ttl=ttl)
+        self._reasons = TTLCache(maxsize=max_reasons, ttl=ttl)
+        self._lock = threading.Lock()
+        # Read on first use so creating the cache does not load the catalog
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.reason_hits = 0
+        self.reason_misses = 0
+
+    def _check_version(self):
+        version = catalog_version()
+        if version != self._version:
+            self._matches.clear()
+            self._reasons.clear()
+            self._version = version
+
+    def get_matches(self, fingerprint: str, top_k: int):
+        with self._lock:
+            self._check_version()
+            matches = self._matches.get((fingerprint, top_k))
+            if matches is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(matches)
+
+    def put_matches(self, fingerprint: str, top_k: int, matches: list[dict]):
+        with self._lock:
+            self._check_version()
+            self._matches[(fingerprint, top_k)] = copy.deepcopy(matches)
+
+    def get_reason(self, card_id: str, fingerprint: str):
+        with self._lock:
+            self._check_version()
+            reason = self._reasons.get((card_id, fingerprint))
+            if reason is None:
+                self.reason_misses += 1
+            else:
+                self.reason_hits += 1
+            return reason
+
+    def put_reason(self, card_id: str, fingerprint: str, reason: str):
+        with self._lock:
+            self._reasons[(card_id, fingerprint)] = reason
+
+    def clear(self):
+        with self._lock:
+            self._matches.clear()
+            self._reasons.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reason_hits": self.reason_hits,
+            "reason_misses": self.reason_misses,
+            "entries": len(self._matches),
+            "reason_entries": len(self._reasons),
+        }
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,318 @@
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+from app.catalog import card_id, get_catalog, parse_inr, strip_citations
+
+load_dotenv()
+
+# Weight of simulated net annual value (rewards - annual fee, scaled to 0..1 across the
+# candidates) relative to embedding similarity when ranking recommendations
+REWARD_RANK_WEIGHT = float(os.getenv("REWARD_RANK_WEIGHT", "0.3"))
+
+# Spending buckets, in the order of the columns of the rate matrix. "other" collects
+# custom_spending and anything the catalog describes as "other/all spends".
+CATEGORIES = [
+    "fuel",
+    "travel",
+    "groceries",
+    "dining",
+    "online_shopping",
+    "utilities",
+    "other",
+]
+_CATEGORY_INDEX = {cat: i for i, cat in enumerate(CATEGORIES)}
+
+# Words in a reward clause that tie it to a spending bucket
+CATEGORY_KEYWORDS = {
+    "fuel": ["fuel", "petrol"],
+    "travel": ["travel", "flight", "air", "vistara", "hotel", "ola", "uber", "mmt", "international"],
+    "groceries": ["grocery", "groceries", "departmental", "supermarket"],
+    "dining": ["dining", "restaurant", "swiggy", "zomato"],
+    "online_shopping": ["online", "amazon", "flipkart", "myntra", "shopping", "smartbuy", "bookmyshow"],
+    "utilities": ["utilit", "bill payment", "dth", "electricity", "recharge"],
+}
+_DEFAULT_WORDS = re.compile(r"\b(other|all|any|retail|domestic)\b")
+
+# INR value of one reward point / air mile when the catalog does not say
+DEFAULT_POINT_VALUE = 0.25
+DEFAULT_MILE_VALUE = 0.5
+
+_POINTS_RE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(?:x\s*)?[a-z ]*?\bpoints?\s+per\s+(?:₹|rs\.?\s*)\s*([\d,]+)"
+    r"(?:\s*\((?:[^)%]*?)(\d+(?:\.\d+)?)%[^)]*\))?",
+    re.IGNORECASE,
+)
+_MILES_RE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(?:air\s*)?miles?\s+per\s+(?:₹|rs\.?\s*)\s*([\d,]+)()",
+    re.IGNORECASE,
+)
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_CAP_RE = re.compile(
+    r"up to\s*₹\s*([\d,]+)\s*(?:/|per\s+)(month|year|statement|quarter)", re.IGNORECASE
+)
+_FUEL_WAIVER_RE = re.compile(
+    r"(?:(\d+(?:\.\d+)?)%\s*)?fuel surcharge waiver(?:\s*\((?:(\d+(?:\.\d+)?)%)?([^)]*)\))?",
+    re.IGNORECASE,
+)
+_MILESTONE_RE = re.compile(
+    r"([\d,]+)\s*bonus points on\s*(₹\s*[\d.,]+\s*(?:lakh|l)?)\s*annual spend",
+    re.IGNORECASE,
+)
+_CAP_PERIODS_PER_YEAR = {"month": 12, "statement": 12, "quarter": 4, "year": 1}
+
+
+def _clean(text: str) -> str:
+    return strip_citations(text)
+
+
+def _classify(text: str):
+    """
+    Map the text describing where a rate applies to (categories, is_default, excluded).
+    """
+    lowered = text.lower()
+    excluded = set()
+    if "excl" in lowered:
+        lowered, _, excl_text = lowered.partition("excl")
+        excluded = _categories_in(excl_text)
+    # "on retail spends (up to 6x via SmartBuy)": the parenthetical is an aside
+    # when the clause itself already reads as a catch-all
+    outside = re.sub(r"\([^)]*\)?", "", lowered)
+    if _DEFAULT_WORDS.search(outside) and not _categories_in(outside):
+        lowered = outside
+    cats = _categories_in(lowered)
+    return cats, bool(_DEFAULT_WORDS.search(lowered)), excluded
+
+
+def _categories_in(text: str) -> set:
+    return {
+        cat
+        for cat, words in CATEGORY_KEYWORDS.items()
+        if any(word in text for word in words)
+    }
+
+
+def _annual_cap(text: str):
+    match = _CAP_RE.search(text)
+    if not match:
+        return None
+    return float(match.group(1).replace(",", "")) * _CAP_PERIODS_PER_YEAR[
+        match.group(2).lower()
+    ]
+
+
+class CardRules:
+    """
+    Structured reward rules for one card: an INR return per INR spent for each
+    category (rate), optional annual caps per category, and milestone bonuses.
+    """
+
+    __slots__ = ("rates", "caps", "default_rate", "milestones", "notes")
+
+    def __init__(self):
+        self.rates: dict[str, float] = {}
+        self.caps: dict[str, float] = {}
+        self.default_rate = 0.0
+        self.milestones: list[tuple[float, float]] = []  # (annual spend, INR bonus)
+        self.notes: dict[str, str] = {}
+
+    def rate_for(self, category: str) -> float:
+        return self.rates.get(category, self.default_rate)
+
+
+def compile_card_rules(card: dict) -> CardRules:
+    """
+    Compile the free-text reward_rate and special_perks of a card into CardRules.
+    Percentages become cashback rates, "N points per ₹X" becomes N/X times the point
+    value (taken from an "(N% value)" hint when present), fuel surcharge waivers and
+    "up to ₹N/month" caps are applied to fuel, and "N bonus points on ₹X annual
+    spend" becomes a milestone.
+    """
+    rules = CardRules()
+    text = _clean(card.get("reward_rate", ""))
+    found = []  # (start, end, rate, note)
+
+    for regex in (_POINTS_RE, _MILES_RE):
+        for m in regex.finditer(text):
+            points, per = float(m.group(1)), float(m.group(2).replace(",", ""))
+            if m.group(3):
+                rate = float(m.group(3)) / 100
+                point_value = rate * per / points
+            else:
+                point_value = DEFAULT_MILE_VALUE if regex is _MILES_RE else DEFAULT_POINT_VALUE
+                rate = points / per * point_value
+            note = f"{points:g} points per ₹{per:g} (~₹{point_value:g}/point)"
+            found.append((m.start(), m.end(), rate, note))
+    masked = list(text)
+    for start, end, _, _ in found:
+        masked[start:end] = " " * (end - start)
+    for m in _PERCENT_RE.finditer("".join(masked)):
+        pct = float(m.group(1))
+        found.append((m.start(), m.end(), pct / 100, f"{pct:g}% cashback"))
+    found.sort()
+
+    default_candidates = []
+    explicit_default = None
+    for i, (start, end, rate, note) in enumerate(found):
+        prev_end = found[i - 1][1] if i else 0
+        next_start = found[i + 1][0] if i + 1 < len(found) else len(text)
+        after, before = text[end:next_start], text[prev_end:start]
+        # "5% on X" / "4% back on X" describe what follows; "(online spends 4 points...)"
+        # describes what precedes
+        if re.match(r"\s*(?:back\s+|cashback\s*(?:\([^)]*\)\s*)?)?(?:on|at|for)\b", after, re.I):
+            where = after
+        else:
+            where = before
+        cats, is_default, excluded = _classify(where)
+        for cat in excluded:
+            rules.rates.setdefault(cat, 0.0)
+        if cats:
+            for cat in cats:
+                if cat not in rules.rates:
+                    rules.rates[cat] = rate
+                    rules.notes[cat] = note
+        elif is_default:
+            if explicit_default is None:
+                explicit_default = (rate, note)
+        else:
+            default_candidates.append((rate, note))
+    default = explicit_default or (default_candidates[0] if default_candidates else None)
+    if default:
+        rules.default_rate, rules.notes["other"] = default
+
+    perks = _clean(card.get("special_perks", ""))
+    waiver = _FUEL_WAIVER_RE.search(perks)
+    if waiver:
+        pct = float(waiver.group(1) or waiver.group(2) or 1)
+        rules.rates["fuel"] = rules.rate_for("fuel") + pct / 100
+        rules.notes["fuel"] = (
+            rules.notes.get("fuel", rules.notes.get("other", "")) + f" + {pct:g}% fuel surcharge waiver"
+        ).lstrip(" +")
+        cap = _annual_cap(waiver.group(0))
+        if cap is not None:
+            rules.caps["fuel"] = cap
+    for m in _MILESTONE_RE.finditer(perks):
+        bonus_points = float(m.group(1).replace(",", ""))
+        threshold = parse_inr(m.group(2))
+        if threshold:
+            rules.milestones.append((threshold, bonus_points * DEFAULT_POINT_VALUE))
+    return rules
+
+
+class RewardEngine:
+    """
+    Reward rules for a whole catalog, laid out as matrices so that annual rewards for
+    every card and spending category come out of one vectorized computation:
+    rates is (cards x categories), caps holds annual INR caps (inf when uncapped) and
+    milestone_* hold one milestone bonus per card.
+    """
+
+    def __init__(self, cards: list[dict]):
+        self.ids = [card_id(card) for card in cards]
+        self.row = {cid: i for i, cid in enumerate(self.ids)}
+        self.rules = [compile_card_rules(card) for card in cards]
+        n = len(cards)
+        self.rates = np.zeros((n, len(CATEGORIES)), dtype=np.float64)
+        self.caps = np.full((n, len(CATEGORIES)), np.inf, dtype=np.float64)
+        self.milestone_spend = np.full(n, np.inf, dtype=np.float64)
+        self.milestone_bonus = np.zeros(n, dtype=np.float64)
+        self.annual_fees = np.array(
+            [parse_inr(card.get("annual_fee", "")) or 0.0 for card in cards],
+            dtype=np.float64,
+        )
+        for i, rules in enumerate(self.rules):
+            for cat, j in _CATEGORY_INDEX.items():
+                self.rates[i, j] = rules.rate_for(cat)
+                if cat in rules.caps:
+                    self.caps[i, j] = rules.caps[cat]
+            if rules.milestones:
+                self.milestone_spend[i], self.milestone_bonus[i] = min(rules.milestones)
+
+    @staticmethod
+    def spend_vector(prefs: dict) -> np.ndarray:
+        """
+        Annual INR spend per category from the monthly figures in the preferences.
+        """
+        spend = np.zeros(len(CATEGORIES), dtype=np.float64)
+        for cat, amount in (prefs.get("spending") or {}).items():
+            spend[_CATEGORY_INDEX.get(cat, _CATEGORY_INDEX["other"])] += _as_number(amount)
+        for amount in (prefs.get("custom_spending") or {}).values():
+            spend[_CATEGORY_INDEX["other"]] += _as_number(amount)
+        return spend * 12
+
+    def category_rewards(self, spend: np.ndarray) -> np.ndarray:
+        """
+        Capped annual rewards per card and category. spend is (categories,) or
+        (users, categories); the result is (cards, categories) or (users, cards, categories).
+        """
+        return np.minimum(spend[..., None, :] * self.rates, self.caps)
+
+    def annual_rewards(self, spend: np.ndarray) -> np.ndarray:
+        """
+        Total annual rewards in INR for every card: the capped spend x rate product
+        summed over categories, plus milestone bonuses the total spend reaches.
+        """
+        total = self.category_rewards(spend).sum(axis=-1)
+        reached = spend.sum(axis=-1)[..., None] >= self.milestone_spend
+        return total + reached * self.milestone_bonus
+
+    def net_value(self, spend: np.ndarray) -> np.ndarray:
+        return self.annual_rewards(spend) - self.annual_fees
+
+    def simulate(self, cid: str, prefs: dict):
+        """
+        (summary, details) for one card, in the shape simulate_rewards always returned.
+        """
+        row = self.row.get(cid)
+        spend = self.spend_vector(prefs)
+        if row is None or not spend.any():
+            return "Reward simulation not available", []
+        per_category = self.category_rewards(spend)[row]
+        rules = self.rules[row]
+        details = [
+            f"{rules.notes.get(cat, rules.notes.get('other', ''))} on {cat}: ₹{per_category[j]:.0f}/year"
+            for cat, j in _CATEGORY_INDEX.items()
+            if spend[j] and per_category[j]
+        ]
+        total = self.annual_rewards(spend)[row]
+        if self.milestone_bonus[row] and spend.sum() >= self.milestone_spend[row]:
+            details.append(f"Milestone bonus: ₹{self.milestone_bonus[row]:.0f}/year")
+        if not details:
+            return "Reward simulation not available", []
+        return f"You could earn approx. ₹{total:.0f}/year", details
+
+    def rerank(self, matches: list[dict], prefs: dict, weight: float = REWARD_RANK_WEIGHT):
+        """
+        Re-order vector-store matches by similarity plus weight times the card's
+        simulated net annual value, min-max scaled across the matches. Cards unknown
+        to the engine get no value bonus.
+        """
+        spend = self.spend_vector(prefs)
+        if not matches or weight <= 0 or not spend.any():
+            return matches
+        values = self.net_value(spend)
+        rows = [self.row.get(m["id"]) for m in matches]
+        known = np.array([values[r] for r in rows if r is not None])
+        if known.size == 0:
+            return matches
+        low, span = known.min(), np.ptp(known) or 1.0
+        scored = []
+        for match, row in zip(matches, rows):
+            bonus = (values[row] - low) / span if row is not None else 0.0
+            scored.append((match["score"] + weight * bonus, match))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [match for _, match in scored]
+
+
+def _as_number(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_inr(str(value)) or 0.0
+
+
+def get_reward_engine() -> RewardEngine:
+    """
+    Reward engine for the current catalog snapshot; compiled when the catalog is
+    (re)loaded, see app.catalog.
+    """
+    return get_catalog().rewards
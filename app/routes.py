@@ -1,73 +1,363 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from app.gemini_api import chat_with_gemini, sessions, save_sessions
-from pinecone import Pinecone
+import asyncio
+import hmac
+import json
+import logging
 import os
+from typing import Optional
 from dotenv import load_dotenv
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from app.gemini_api import (
+    ReplyTruncated,
+    chat_with_gemini,
+    interview_complete,
+    stream_chat_with_gemini,
+    sessions,
+)
 from app.utils import (
     get_top_credit_card_recommendations_from_session,
     extract_user_preferences_and_update_session,
 )
+from app.batch import BATCH_MAX_SESSIONS, recommend_many
+from app.catalog import catalog_version, get_catalog, reload_catalog
+from app.chat_context import prompt_stats
+from app.clients import get_vector_store, refresh_vector_store
+from app.concurrency import SingleFlight, session_locks
+from app.embedding_utils import embedding_cache
+from app.metrics import count, register_gauge, render, span
+from app.rec_cache import recommendation_cache
+from app.session_store import history_offset, total_turns
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("credit-cards")
 
+# Start the recommendation pipeline in the background as soon as the interview is
+# complete, for the top_k the frontend asks for, so /recommend finds it ready
+SPECULATIVE_RECOMMEND = os.getenv("SPECULATIVE_RECOMMEND", "1").lower() in ("1", "true", "yes")
+SPECULATIVE_TOP_K = int(os.getenv("SPECULATIVE_TOP_K", "3"))
+# Shared secret for /admin endpoints and /recommend/batch, sent as X-Admin-Token
+# (unset = those endpoints are disabled)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 router = APIRouter()
 
+register_gauge("ccr_chat_prompt", "Chat prompt size statistics (tokens).", lambda: prompt_stats)
+register_gauge("ccr_embedding_cache", "Embedding cache hits, misses and size.", embedding_cache.stats)
+# Identical in-flight /recommend calls (double taps, client retries) share one run
+recommend_flight = SingleFlight()
+# Precompute tasks, referenced until done so they are not garbage collected
+_background_tasks = set()
+
+register_gauge("ccr_recommend_single_flight", "Started vs. coalesced /recommend runs.", recommend_flight.stats)
+register_gauge("ccr_recommendation_cache", "Recommendation cache hits, misses and size.", recommendation_cache.stats)
+register_gauge("ccr_session_store", "Resident sessions, their approximate bytes and lifecycle counts.", sessions.stats)
+
 
 class ChatRequest(BaseModel):
     session_id: str
     user_input: str
+    # Number of history turns the client already holds; when set, only later turns
+    # are returned instead of the whole transcript
+    since: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
     reply: str
     history: list[dict]
+    history_offset: int = 0
+    total_turns: int = 0
+    version: int = 0
+
+
+class HistoryResponse(BaseModel):
+    turns: list[dict]
+    since: int
+    next: int
+    total_turns: int
+    version: int
+
+
+def _session_etag(session_id: str, session: dict) -> str:
+    return f'W/"{session_id}-{session.get("version", 0)}"'
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_chat_response(req: ChatRequest) -> StreamingResponse:
+    async def events():
+        parts = []
+        try:
+            async for text in stream_chat_with_gemini(req.session_id, req.user_input):
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+        except ReplyTruncated:
+            # The tokens sent so far are not a reply; the client should resend the message
+            yield _sse_event(
+                "error", {"error": "The reply was cut off, please send your message again", "truncated": True}
+            )
+            return
+        _maybe_precompute(req.session_id, "".join(parts))
+        session = sessions.get(req.session_id)
+        yield _sse_event(
+            "done",
+            {
+                "reply": "".join(parts),
+                "total_turns": total_turns(session),
+                "version": session.get("version", 0),
+            },
+        )
+
+    # Starlette cancels the generator when the client disconnects, which rolls the
+    # turn back in stream_chat_with_gemini
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events variant of /chat: "token" events carry reply chunks as they
+    are generated and a final "done" event carries the assembled reply. If Gemini
+    fails mid-reply an "error" event replaces "done" and the turn is not saved.
+    """
+    if not req.session_id or not req.user_input:
+        raise HTTPException(
+            status_code=400, detail="session_id and user_input required"
+        )
+    return _stream_chat_response(req)
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
     if not req.session_id or not req.user_input:
         raise HTTPException(
             status_code=400, detail="session_id and user_input required"
         )
-    bot_reply = await chat_with_gemini(req.session_id, req.user_input)
-    print("DEBUG: bot_reply:", bot_reply)
-    return {"reply": bot_reply, "history": sessions[req.session_id]["history"]}
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return _stream_chat_response(req)
+    with span("chat"):
+        bot_reply = await chat_with_gemini(req.session_id, req.user_input)
+    logger.debug("chat session=%s reply_chars=%d", req.session_id, len(bot_reply))
+    _maybe_precompute(req.session_id, bot_reply)
+    session = sessions.get(req.session_id)
+    # Turn numbers are absolute; turns before history_offset are no longer in memory
+    base = history_offset(session)
+    offset = min(max(req.since or 0, base), total_turns(session))
+    return {
+        "reply": bot_reply,
+        "history": session["history"][offset - base :],
+        "history_offset": offset,
+        "total_turns": total_turns(session),
+        "version": session.get("version", 0),
+    }
+
+
+@router.get("/sessions/{session_id}/history", response_model=HistoryResponse)
+async def session_history(
+    session_id: str, request: Request, response: Response, since: int = 0, limit: int = 50
+):
+    """
+    Page through a session's history: turns at index >= since, at most limit of them.
+    Responds 304 when If-None-Match carries the current session ETag.
+    """
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    etag = _session_etag(session_id, session)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    base = history_offset(session)
+    total = total_turns(session)
+    since = min(max(since, 0), total)
+    stop = min(since + max(limit, 0), total)
+    # Turns trimmed from memory are read back from the store
+    turns = sessions.turns(session_id, since, min(stop, base)) if since < base else []
+    turns += session["history"][max(since - base, 0) : max(stop - base, 0)]
+    response.headers["ETag"] = etag
+    return {
+        "turns": turns,
+        "since": since,
+        "next": since + len(turns),
+        "total_turns": total,
+        "version": session.get("version", 0),
+    }
 
 
 class RecommendResponse(BaseModel):
     recommendations: list
 
 
+def _recommendation_stamp(session: dict, top_k: int) -> dict:
+    """What a stored result depends on; it is reused only while all of it is unchanged."""
+    return {"turns": total_turns(session), "top_k": top_k, "catalog": catalog_version()}
+
+
+def _stored_recommendations(session: dict, top_k: int):
+    stored = session.get("recommendations")
+    if stored and all(stored.get(k) == v for k, v in _recommendation_stamp(session, top_k).items()):
+        return stored["items"]
+    return None
+
+
+def _maybe_precompute(session_id: str, reply: str):
+    """After a chat turn: start /recommend's pipeline in the background once the interview is done."""
+    if not SPECULATIVE_RECOMMEND:
+        return
+    session = sessions.get(session_id)
+    if session is None or not interview_complete(session, reply):
+        return
+    if _stored_recommendations(session, SPECULATIVE_TOP_K) is not None:
+        return
+    task = asyncio.create_task(_precompute(session_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _precompute(session_id: str):
+    count("recommend.precompute", "started")
+    try:
+        # Same single-flight key as /recommend, so a request arriving meanwhile joins this run
+        await recommend_flight.do(
+            (session_id, SPECULATIVE_TOP_K), lambda: _recommend(session_id, SPECULATIVE_TOP_K)
+        )
+    except Exception as e:
+        logger.warning("Precomputing recommendations for %s failed: %r", session_id, e)
+
+
 @router.post("/recommend", response_model=RecommendResponse)
 async def recommend(session_id: str, top_k: int = 3):
     session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-
-    print(
-        "DEBUG: Session history before extracting preferences:", session.get("history")
+    stored = _stored_recommendations(session, top_k)
+    if stored is not None:
+        # Precomputed (or an earlier /recommend) with the history unchanged since
+        count("recommend.precomputed", "hit")
+        return {"recommendations": stored}
+    return await recommend_flight.do(
+        (session_id, top_k), lambda: _recommend(session_id, top_k)
     )
-    extract_user_preferences_and_update_session(session)
-    save_sessions()
-    print("DEBUG: Preferences after extraction:", session.get("preferences"))
 
-    recommendations = get_top_credit_card_recommendations_from_session(
-        session, index, top_k=top_k
-    )
+
+async def _recommend(session_id: str, top_k: int) -> dict:
+    with span("recommend", session=session_id):
+        # Fold in the latest turns without racing a /chat on the same session. Taken
+        # under the lock, so the session cannot be evicted from memory in between.
+        async with session_locks.hold(session_id):
+            session = sessions.get(session_id, holder=True)
+            if session is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            await extract_user_preferences_and_update_session(session)
+            stamp = _recommendation_stamp(session, top_k)
+            with span("session.save"):
+                await sessions.save_async(session_id)
+        logger.debug(
+            "recommend session=%s turns=%d preferences=%s",
+            session_id,
+            len(session.get("history", [])),
+            json.dumps(session.get("preferences"), ensure_ascii=False),
+        )
+
+        # Only the first call builds the store (Pinecone resolves its index host then)
+        vector_store = await asyncio.to_thread(get_vector_store)
+        recommendations = await get_top_credit_card_recommendations_from_session(
+            session, vector_store, top_k=top_k
+        )
     minimal_recommendations = [
         {
             "name": card.get("name", ""),
             "image_url": card.get("image_url", ""),
             "apply_link": card.get("apply_link", ""),
-            # "reward_simulation": card.get("reward_simulation", ""),
-            # "reward_details": card.get("reward_details", []),
+            "reward_simulation": card.get("reward_simulation", ""),
+            "reward_details": card.get("reward_details", []),
             "llm_reason": card.get("llm_reason", ""),
         }
         for card in recommendations
     ]
-    print("DEBUG: minimal_recommendations:", minimal_recommendations)
+    logger.debug(
+        "recommend session=%s cards=%s",
+        session_id,
+        [card["name"] for card in minimal_recommendations],
+    )
+    # Keep the result with the stamp it was computed for; a later /recommend reuses
+    # it as long as nobody has chatted since
+    if not any(card.get("degraded") for card in recommendations):
+        async with session_locks.hold(session_id):
+            session = sessions.get(session_id, holder=True)
+            if session is not None:
+                session["recommendations"] = {**stamp, "items": minimal_recommendations}
+                await sessions.save_async(session_id)
     return {"recommendations": minimal_recommendations}
+
+
+class BatchRecommendRequest(BaseModel):
+    session_ids: list[str]
+    top_k: int = 3
+    # LLM explanations cost a Gemini call per session; off for bulk re-scoring
+    reasons: bool = False
+
+
+def _check_admin_token(x_admin_token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.post("/recommend/batch")
+async def recommend_batch(req: BatchRecommendRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Recommendations for many sessions at once, streamed as JSON Lines (one object per
+    session id, in order) while they are computed. Sessions are read as stored and
+    are not modified. Reads any session, so it takes the admin token.
+    """
+    _check_admin_token(x_admin_token)
+    if len(req.session_ids) > BATCH_MAX_SESSIONS:
+        raise HTTPException(
+            status_code=400, detail=f"at most {BATCH_MAX_SESSIONS} session_ids per request"
+        )
+    vector_store = await asyncio.to_thread(get_vector_store)
+
+    async def lines():
+        async for result in recommend_many(
+            req.session_ids, sessions, vector_store, req.top_k, req.reasons
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/admin/catalog/reload")
+async def reload_catalog_now(x_admin_token: Optional[str] = Header(None)):
+    """
+    Re-read the cards file and swap in the new catalog, and the vector store if a seed
+    run rewrote its files. Requests already running keep the snapshot they started
+    with; an invalid file leaves the current one in place.
+    """
+    _check_admin_token(x_admin_token)
+    try:
+        reloaded = await asyncio.to_thread(reload_catalog)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Catalog not reloaded: {e}")
+    # A seed run may have rewritten the local index along with the cards
+    index_reloaded = await asyncio.to_thread(refresh_vector_store)
+    catalog = get_catalog()
+    return {
+        "reloaded": reloaded,
+        "index_reloaded": index_reloaded,
+        "version": catalog.version,
+        "cards": len(catalog.cards),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage latencies, call counts and token usage."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -1,38 +1,153 @@
-import google.generativeai as genai
+import argparse
+import hashlib
 import json
 import os
+import time
+from pathlib import Path
 from dotenv import load_dotenv
-from app.embedding_utils import generate_embedding
-from pinecone import Pinecone
+from app.catalog import CARDS_FILE, DATA_DIR, card_id, load_cards
+from app.eligibility import eligibility_columns
+from app.embedding_utils import (
+    EMBED_BATCH_SIZE,
+    card_embedding_text,
+    embedding_cache,
+    generate_embeddings_batch,
+)
+from app.vector_store import VECTOR_STORE, get_vector_store
 
 load_dotenv()
 
-# Initialize Pinecone client
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("credit-cards")
-
-# Initialize Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Convert to Embeddings and Prepare Vectors
-vectors = []
-
-with open("data/cards.json", "r", encoding="utf-8") as f:
-    credit_cards = json.load(f)
-
-for card in credit_cards:
-    embedding = generate_embedding(card)
-    # Extract float values from ContentEmbedding object's.values attribute
-    embedding_floats = embedding[0].values
-    vectors.append(
-        {
-            "id": card["name"].replace(" ", "_").lower(),
-            "values": embedding_floats,
-            "metadata": card,
-        }
+# Fingerprints of the cards already in the vector store; doubles as the resume checkpoint.
+# Kept per backend since the local index and Pinecone are seeded independently.
+SEED_STATE_FILE = Path(
+    os.getenv("SEED_STATE_FILE", DATA_DIR / f"seed_state.{VECTOR_STORE}.json")
+)
+UPSERT_CHUNK_SIZE = int(os.getenv("SEED_UPSERT_CHUNK_SIZE", "50"))
+
+
+def card_metadata(card: dict) -> dict:
+    # Only what query filters need (plus the name, for reading the index); everything
+    # shown to users is joined from the in-process catalog, so it can change without a re-seed
+    return {"name": card["name"], **eligibility_columns(card)}
+
+
+def card_fingerprint(card: dict) -> str:
+    """
+    Hash of the card's embedding text and metadata. A card whose fingerprint matches
+    the checkpoint is already in the vector store and is skipped.
+    """
+    payload = card_embedding_text(card) + json.dumps(
+        card_metadata(card), sort_keys=True, ensure_ascii=False
     )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_state(path: Path = SEED_STATE_FILE) -> dict:
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"fingerprints": {}}
+
+
+def save_state(state: dict, path: Path = SEED_STATE_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
 
 
-# Insert into Pinecone 
-# index.upsert(vectors=vectors)
-# print(f"✅ Inserted {len(vectors)} credit cards into Pinecone.")
+def seed(
+    cards_file: Path = CARDS_FILE,
+    state_file: Path = SEED_STATE_FILE,
+    chunk_size: int = UPSERT_CHUNK_SIZE,
+    force: bool = False,
+    vector_store=None,
+) -> dict:
+    """
+    Bring the vector store in line with the card catalog. New and changed cards are
+    embedded in batches and upserted chunk_size at a time. Cards that were removed
+    from the catalog are deleted from the store.
+
+    Writes are grouped with vector_store.bulk(); the store is flushed and the checkpoint
+    written whenever the cards upserted since the last checkpoint reach the number
+    upserted before it, so an interrupted run resumes from at most half its progress
+    (embeddings are cached) while the local store rewrites its files O(log n) times
+    per run instead of once per chunk.
+    """
+    started = time.perf_counter()
+    vector_store = vector_store or get_vector_store()
+    state = {"fingerprints": {}} if force else load_state(state_file)
+    fingerprints = state["fingerprints"]
+
+    cards = load_cards(cards_file)
+    current = {card_id(card): (card, card_fingerprint(card)) for card in cards}
+    pending = [
+        (cid, card, fp)
+        for cid, (card, fp) in current.items()
+        if fingerprints.get(cid) != fp
+    ]
+    removed = [cid for cid in fingerprints if cid not in current]
+
+    cache_misses_before = embedding_cache.misses
+    upserted = 0
+    checkpointed = 0
+    with vector_store.bulk():
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start : start + chunk_size]
+            embeddings = generate_embeddings_batch(
+                [card_embedding_text(card) for _, card, _ in chunk],
+                batch_size=EMBED_BATCH_SIZE,
+            )
+            vector_store.upsert(
+                [
+                    {"id": cid, "values": values, "metadata": card_metadata(card)}
+                    for (cid, card, _), values in zip(chunk, embeddings)
+                ]
+            )
+            for cid, _, fp in chunk:
+                fingerprints[cid] = fp
+            upserted += len(chunk)
+            print(f"Upserted {upserted}/{len(pending)} cards")
+            if upserted - checkpointed >= max(checkpointed, chunk_size):
+                # The checkpoint must never list cards the store has not persisted
+                vector_store.flush()
+                save_state(state, state_file)
+                checkpointed = upserted
+
+        if removed:
+            vector_store.delete(removed)
+            for cid in removed:
+                fingerprints.pop(cid, None)
+        if upserted != checkpointed or removed:
+            vector_store.flush()
+            save_state(state, state_file)
+    # Approximate backends re-train their index here (no-op when nothing changed)
+    vector_store.build_index()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "cards": len(cards),
+        "unchanged": len(cards) - len(pending),
+        "upserted": upserted,
+        "embedded": embedding_cache.misses - cache_misses_before,
+        "deleted": len(removed),
+        "seconds": round(elapsed, 3),
+        "cards_per_second": round(upserted / elapsed, 1) if elapsed else 0.0,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed data/cards.json into the vector store")
+    parser.add_argument("--cards", type=Path, default=CARDS_FILE)
+    parser.add_argument("--state", type=Path, default=SEED_STATE_FILE)
+    parser.add_argument("--chunk-size", type=int, default=UPSERT_CHUNK_SIZE)
+    parser.add_argument("--force", action="store_true", help="ignore the checkpoint and re-upsert every card")
+    args = parser.parse_args()
+    report = seed(args.cards, args.state, args.chunk_size, args.force)
+    print(
+        f"✅ {report['upserted']} upserted ({report['embedded']} newly embedded), "
+        f"{report['unchanged']} unchanged, {report['deleted']} deleted "
+        f"in {report['seconds']}s ({report['cards_per_second']} cards/s)"
+    )
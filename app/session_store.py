@@ -0,0 +1,702 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from dotenv import load_dotenv
+from app.metrics import span
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+SESSIONS_DB = Path(os.getenv("SESSIONS_DB", "sessions.sqlite3"))
+LEGACY_SESSIONS_FILE = Path("sessions.json")
+# Seconds between write-behind flushes; 0 writes every save through immediately
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "1.0"))
+# Set when several workers or instances share SESSIONS_DB (e.g. uvicorn --workers N):
+# saves are written through and cached sessions are revalidated on every access
+SESSION_SHARED = os.getenv("SESSION_SHARED", "0").lower() in ("1", "true", "yes")
+
+# Working set kept in memory; least recently used sessions beyond either bound are
+# evicted (they stay in SQLite and are reloaded on their next request)
+SESSION_MAX_RESIDENT = int(os.getenv("SESSION_MAX_RESIDENT", "10000"))
+SESSION_MAX_RESIDENT_MB = float(os.getenv("SESSION_MAX_RESIDENT_MB", "256"))
+# Sessions untouched this long are evicted from memory by the sweeper
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# Sessions untouched this long are deleted from SQLite too; 0 keeps them forever
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(30 * 24 * 3600)))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+# Turns kept in memory per session; older turns already folded into the preferences
+# are dropped from memory (not from SQLite). 0 keeps everything.
+SESSION_MAX_HISTORY_TURNS = int(os.getenv("SESSION_MAX_HISTORY_TURNS", "100"))
+
+# Watermarks and queued indices that point into the in-memory history
+_TURN_INDEX_FIELDS = ("preferences_turns", "fast_extract_turns")
+
+
+def new_session() -> dict:
+    return {"history": [], "preferences": {}}
+
+
+def history_offset(session: dict) -> int:
+    """Absolute index of session["history"][0]; earlier turns were trimmed from memory."""
+    return session.get("history_offset", 0)
+
+
+def total_turns(session: dict) -> int:
+    return history_offset(session) + len(session.get("history", []))
+
+
+class SessionStore:
+    """
+    SQLite (WAL) backed session store. Sessions are loaded lazily on first access
+    and kept in memory. save() records only what changed since the last save, the
+    session state without its history plus any newly appended turns, and a background
+    thread writes those batches every SESSION_FLUSH_INTERVAL seconds.
+
+    Each stored session carries a version. A write only goes through if the stored
+    version is still the one the in-memory copy was based on; otherwise another worker
+    got there first and the two are merged (see _merge) instead of overwriting it.
+    With shared=True every save is written through and get() reloads a session whose
+    stored version moved on, so any number of processes can serve the same sessions.
+    Writes go through one connection and reads through another, so a write waiting
+    on another process's lock never holds up reads; async callers use save_async(),
+    which waits for a write-through in a worker thread instead of on the event loop.
+
+    Memory stays bounded: at most max_resident sessions (and max_resident_bytes of
+    their serialized size) are kept, least recently used first out, and a sweeper
+    thread evicts idle sessions and deletes abandoned ones after ttl seconds. Each
+    session keeps at most max_history_turns turns in memory; turns are numbered
+    absolutely in SQLite and session["history_offset"] is the index of the first one
+    still in memory. pinned(session_id) -> bool marks sessions a request is using,
+    which are never evicted.
+    """
+
+    def __init__(
+        self,
+        path: Path = SESSIONS_DB,
+        flush_interval: float = SESSION_FLUSH_INTERVAL,
+        shared: bool = SESSION_SHARED,
+        max_resident: int = SESSION_MAX_RESIDENT,
+        max_resident_bytes: int = int(SESSION_MAX_RESIDENT_MB * 1024 * 1024),
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+        ttl: float = SESSION_TTL_SECONDS,
+        sweep_interval: float = SESSION_SWEEP_SECONDS,
+        max_history_turns: int = SESSION_MAX_HISTORY_TURNS,
+        pinned=None,
+    ):
+        self.path = Path(path)
+        self.shared = shared
+        self.max_resident = max_resident
+        self.max_resident_bytes = max_resident_bytes
+        self.idle_seconds = idle_seconds
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.max_history_turns = max_history_turns
+        self.pinned = pinned or (lambda session_id: False)
+        # Write-behind would let other workers read stale sessions
+        self.flush_interval = 0 if shared else flush_interval
+        # Resident sessions, least recently used first
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+        self._last_used: dict[str, float] = {}
+        # Approximate serialized size of each resident session (state + turns)
+        self._state_bytes: dict[str, int] = {}
+        self._turn_bytes: dict[str, int] = {}
+        self._resident_bytes = 0
+        self._counters = {"loads": 0, "evicted": 0, "expired": 0, "trimmed_turns": 0}
+        # Absolute number of turns per session already written or queued, so save()
+        # only sends new ones
+        self._saved_turns: dict[str, int] = {}
+        # Stored version and state JSON the in-memory copy was last synced with
+        self._versions: dict[str, int] = {}
+        self._base_states: dict[str, str] = {}
+        # session_id -> {"state": str, "turns": [(idx, str)], "replace": bool,
+        #                "version": int, "base_version": int, "base_state": str}
+        self._pending: dict[str, dict] = {}
+        # Sessions whose popped changes are being written right now
+        self._committing: set[str] = set()
+        self._lock = threading.RLock()
+        self._db_lock = threading.Lock()
+        # One flush at a time, so changes to a session are committed in save order
+        self._flush_lock = threading.Lock()
+        # Autocommit mode; writes open their own BEGIN IMMEDIATE transactions
+        self._db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "version" not in columns:
+            self._db.execute(
+                "ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+            )
+            # Older rows only kept the version inside the state JSON
+            self._db.execute(
+                "UPDATE sessions SET version = "
+                "COALESCE(json_extract(state, '$.version'), 0)"
+            )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns "
+            "(session_id TEXT NOT NULL, idx INTEGER NOT NULL, turn TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, idx))"
+        )
+        # WAL readers never wait for a writer
+        self._reader = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self._read_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="session-flush", daemon=True
+            )
+            self._flusher.start()
+        self._sweeper = None
+        if self.sweep_interval > 0:
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, name="session-sweep", daemon=True
+            )
+            self._sweeper.start()
+        atexit.register(self.close)
+
+    def get(self, session_id: str, holder: bool = False):
+        """
+        The in-memory session, loaded on first access. In shared mode a session another
+        worker wrote since is reloaded in place, unless it is pinned: a request in the
+        middle of a turn may hold unsaved changes, which its save() merges instead.
+        holder=True is for the request that just took the session's lock and has not
+        changed anything yet, so it starts from the newest copy.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                if session is not None:
+                    self._touch(session_id)
+                    self._enforce_bounds()
+                return session
+            self._touch(session_id)
+            busy = session_id in self._pending or session_id in self._committing
+            if not holder and self.pinned(session_id):
+                busy = True
+            if self.shared and not busy:
+                with self._read_lock:
+                    row = self._reader.execute(
+                        "SELECT version FROM sessions WHERE id = ?", (session_id,)
+                    ).fetchone()
+                if row is not None and row[0] != self._versions.get(session_id, 0):
+                    # Another worker wrote it since; refresh in place so callers
+                    # holding the dict see the new contents
+                    self._load(session_id)
+            return session
+
+    def get_or_create(self, session_id: str, holder: bool = False) -> dict:
+        with self._lock:
+            session = self.get(session_id, holder)
+            if session is None:
+                session = new_session()
+                self._sessions[session_id] = session
+                self._saved_turns[session_id] = 0
+                self._versions[session_id] = 0
+                self._base_states[session_id] = None
+                self._touch(session_id)
+                self._enforce_bounds()
+            return session
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def _read(self, session_id: str, db=None):
+        """
+        Stored (state JSON, version, history from its offset on) of a session, or None.
+        Reads through the read connection unless db (inside a write transaction) is given.
+        """
+        db = db or self._reader
+        row = db.execute(
+            "SELECT state, version FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = db.execute(
+            "SELECT turn FROM turns WHERE session_id = ? AND idx >= ? ORDER BY idx",
+            (session_id, history_offset(json.loads(row[0]))),
+        ).fetchall()
+        return row[0], row[1], [json.loads(turn) for (turn,) in turns]
+
+    def snapshot(self, session_id: str):
+        """
+        Independent copy of a session, or None. Sessions that are not resident are
+        read straight from SQLite without being cached, so batch jobs over many
+        sessions leave the working set alone.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                return json.loads(json.dumps(session, ensure_ascii=False))
+        with self._read_lock:
+            stored = self._read(session_id)
+        if stored is None:
+            return None
+        state, version, history = stored
+        return {**json.loads(state), "history": history, "version": version}
+
+    def session_ids(self, page_size: int = 1000):
+        """Every stored session id, read page by page so memory stays flat."""
+        self.flush()
+        last = ""
+        while True:
+            with self._read_lock:
+                page = [
+                    session_id
+                    for (session_id,) in self._reader.execute(
+                        "SELECT id FROM sessions WHERE id > ? ORDER BY id LIMIT ?",
+                        (last, page_size),
+                    )
+                ]
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def turns(self, session_id: str, start: int, stop: int) -> list:
+        """Stored turns with absolute index in [start, stop), including trimmed ones."""
+        if session_id in self._pending:
+            self.flush()
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT turn FROM turns WHERE session_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                (session_id, start, stop),
+            ).fetchall()
+        return [json.loads(turn) for (turn,) in rows]
+
+    def _load(self, session_id: str):
+        with span("session.load"), self._read_lock:
+            stored = self._read(session_id)
+        if stored is None:
+            return None
+        state, version, history = stored
+        self._adopt(session_id, state, version, history)
+        self._counters["loads"] += 1
+        return self._sessions[session_id]
+
+    def _adopt(self, session_id: str, state: str, version: int, history: list):
+        """Make a stored copy the in-memory session, updating an existing dict in place."""
+        session = self._sessions.setdefault(session_id, {})
+        session.clear()
+        session.update(json.loads(state))
+        session["history"] = history
+        session["version"] = version
+        self._saved_turns[session_id] = total_turns(session)
+        self._versions[session_id] = version
+        self._base_states[session_id] = state
+        self._account(
+            session_id,
+            len(state),
+            sum(len(json.dumps(t, ensure_ascii=False)) for t in history),
+        )
+
+    def save(self, session_id: str):
+        """
+        Queue the changes to a session for the next flush. Appended turns are sent
+        individually; a history that shrank or was replaced is rewritten in full.
+        Afterwards the in-memory history is trimmed to max_history_turns. With
+        flush_interval 0 the changes are written before returning.
+        """
+        self._queue(session_id)
+        if self.flush_interval <= 0:
+            self.flush()
+
+    async def save_async(self, session_id: str):
+        """save() for the event loop: a write-through runs in a worker thread."""
+        self._queue(session_id)
+        if self.flush_interval <= 0:
+            await asyncio.to_thread(self.flush)
+
+    def _queue(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            # Bumped on every save; clients use it as the session's ETag
+            session["version"] = session.get("version", 0) + 1
+            history = session.get("history", [])
+            offset = history_offset(session)
+            saved = self._saved_turns.get(session_id, 0)
+            pending = self._pending.setdefault(
+                session_id,
+                {
+                    "state": None,
+                    "turns": [],
+                    "replace": False,
+                    "base_version": self._versions.get(session_id, 0),
+                    "base_state": self._base_states.get(session_id),
+                },
+            )
+            pending["version"] = session["version"]
+            if offset + len(history) < saved:
+                pending["replace"] = True
+                pending["turns"] = []
+                saved = offset
+                self._account(session_id, self._state_bytes.get(session_id, 0), 0)
+            new_turns = [
+                (offset + i, json.dumps(history[i], ensure_ascii=False))
+                for i in range(max(saved - offset, 0), len(history))
+            ]
+            # Serialize now so later in-place edits cannot race the flush thread
+            pending["turns"].extend(new_turns)
+            self._account(
+                session_id,
+                self._state_bytes.get(session_id, 0),
+                self._turn_bytes.get(session_id, 0) + sum(len(t) for _, t in new_turns),
+            )
+            self._trim(session_id, session)
+            state = {k: v for k, v in session.items() if k != "history"}
+            pending["state"] = json.dumps(state, ensure_ascii=False)
+            self._saved_turns[session_id] = total_turns(session)
+            self._account(session_id, len(pending["state"]), self._turn_bytes[session_id])
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Changes saved while this batch is being written build on it, not on
+            # the copy before it; otherwise they would look like another writer's
+            for session_id, change in pending.items():
+                self._versions[session_id] = change["version"]
+                self._base_states[session_id] = change["state"]
+            self._committing.update(pending)
+        if not pending:
+            return
+        failed = {}
+        with span("session.flush", sessions=len(pending)):
+            for session_id, change in pending.items():
+                try:
+                    self._commit(session_id, change)
+                except sqlite3.Error as e:
+                    logger.error("Failed to flush session %s: %s", session_id, e)
+                    failed[session_id] = change
+                finally:
+                    with self._lock:
+                        self._committing.discard(session_id)
+        if failed:
+            # Put the batch back in front of anything queued since, so the next flush retries it
+            with self._lock:
+                for session_id, change in failed.items():
+                    newer = self._pending.get(session_id)
+                    if newer is None:
+                        self._pending[session_id] = change
+                    elif not newer["replace"]:
+                        newer["turns"] = change["turns"] + newer["turns"]
+                        newer["replace"] = change["replace"]
+                        newer["base_version"] = change["base_version"]
+                        newer["base_state"] = change["base_state"]
+
+    def _commit(self, session_id: str, change: dict):
+        """
+        Write one queued change in its own transaction. BEGIN IMMEDIATE takes SQLite's
+        write lock up front, so the version check and the write are atomic across
+        processes; a busy database is retried for up to the connection timeout.
+        """
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT version FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if row is None or row[0] == change["base_version"]:
+                    state, version, history = change["state"], change["version"], None
+                    self._write(
+                        session_id, state, version, change["turns"], change["replace"]
+                    )
+                else:
+                    state, version, history = self._merge(session_id, change)
+                    turns = [
+                        (idx, json.dumps(t, ensure_ascii=False))
+                        for idx, t in enumerate(history, history_offset(json.loads(state)))
+                    ]
+                    self._write(session_id, state, version, turns, True)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        # Session lock only after the database lock is released (get() nests them the other way)
+        with self._lock:
+            self._versions[session_id] = version
+            self._base_states[session_id] = state
+            if (
+                history is not None
+                and session_id not in self._pending
+                and session_id in self._sessions
+            ):
+                self._adopt(session_id, state, version, history)
+
+    def _write(self, session_id: str, state: str, version: int, turns: list, replace: bool):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (id, state, updated_at, version) VALUES (?, ?, ?, ?)",
+            (session_id, state, time.time(), version),
+        )
+        if replace:
+            # Turns before the offset are no longer in memory; keep them
+            self._db.execute(
+                "DELETE FROM turns WHERE session_id = ? AND idx >= ?",
+                (session_id, history_offset(json.loads(state))),
+            )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO turns (session_id, idx, turn) VALUES (?, ?, ?)",
+            [(session_id, idx, turn) for idx, turn in turns],
+        )
+
+    def _merge(self, session_id: str, change: dict):
+        """
+        Combine a queued change with a stored copy that another writer updated since
+        our base version. Turns we appended go after the stored history; a state field
+        takes our value only if we changed it and the other writer did not. The
+        preference watermark drops to the lower of the two so every turn is extracted,
+        and the rule-based extractor rescans from there since turn indices moved.
+        Returns (state JSON, version, history from the merged offset on).
+        """
+        stored_state, stored_version, stored_history = self._read(session_id, self._db)
+        theirs = json.loads(stored_state)
+        ours = json.loads(change["state"])
+        base = json.loads(change["base_state"]) if change["base_state"] else {}
+        ours_turns = [json.loads(turn) for _, turn in change["turns"]]
+        history = ours_turns if change["replace"] else stored_history + ours_turns
+        offset = history_offset(ours if change["replace"] else theirs)
+
+        state = dict(theirs)
+        for key in set(ours) | set(base):
+            if ours.get(key) != base.get(key) and theirs.get(key) == base.get(key):
+                if key in ours:
+                    state[key] = ours[key]
+                else:
+                    state.pop(key, None)
+        # Compare the watermarks as absolute turn numbers; the offsets may differ
+        folded = min(
+            history_offset(ours) + ours.get("preferences_turns", 0),
+            history_offset(theirs) + theirs.get("preferences_turns", 0),
+        )
+        state["history_offset"] = offset
+        state["preferences_turns"] = max(folded - offset, 0)
+        state["fast_extract_turns"] = state["preferences_turns"]
+        state["unresolved_turns"] = []
+        version = max(stored_version, change["version"]) + 1
+        state["version"] = version
+        logger.info(
+            "Session %s was updated concurrently; merged version %d into %d",
+            session_id,
+            change["version"],
+            version,
+        )
+        return json.dumps(state, ensure_ascii=False), version, history
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _touch(self, session_id: str):
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+
+    def _account(self, session_id: str, state_bytes: int, turn_bytes: int):
+        self._resident_bytes += (
+            state_bytes
+            + turn_bytes
+            - self._state_bytes.get(session_id, 0)
+            - self._turn_bytes.get(session_id, 0)
+        )
+        self._state_bytes[session_id] = state_bytes
+        self._turn_bytes[session_id] = turn_bytes
+
+    def _trim(self, session_id: str, session: dict):
+        """
+        Drop the oldest turns beyond max_history_turns from memory. Only turns already
+        folded into the preferences go, and the indices pointing into the history
+        shift with it.
+        """
+        history = session.get("history", [])
+        excess = len(history) - self.max_history_turns
+        if self.max_history_turns <= 0 or excess <= 0:
+            return
+        drop = min(excess, session.get("preferences_turns", 0))
+        if drop <= 0:
+            return
+        dropped = sum(len(json.dumps(t, ensure_ascii=False)) for t in history[:drop])
+        del history[:drop]
+        session["history_offset"] = history_offset(session) + drop
+        for field in _TURN_INDEX_FIELDS:
+            if field in session:
+                session[field] = max(session[field] - drop, 0)
+        if session.get("unresolved_turns"):
+            session["unresolved_turns"] = [i - drop for i in session["unresolved_turns"] if i >= drop]
+        self._turn_bytes[session_id] = self._turn_bytes.get(session_id, 0) - dropped
+        self._resident_bytes -= dropped
+        self._counters["trimmed_turns"] += drop
+
+    def _evictable(self, session_id: str) -> bool:
+        return not (
+            session_id in self._pending
+            or session_id in self._committing
+            or self.pinned(session_id)
+        )
+
+    def _evict(self, session_id: str):
+        """Forget a resident session; its stored copy is reloaded on the next get()."""
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        self._saved_turns.pop(session_id, None)
+        self._versions.pop(session_id, None)
+        self._base_states.pop(session_id, None)
+        self._resident_bytes -= self._state_bytes.pop(session_id, 0) + self._turn_bytes.pop(session_id, 0)
+
+    def _enforce_bounds(self):
+        """Evict least recently used sessions until both memory bounds hold."""
+        if (
+            len(self._sessions) <= self.max_resident
+            and self._resident_bytes <= self.max_resident_bytes
+        ):
+            return
+        for session_id in list(self._sessions):
+            if (
+                len(self._sessions) <= self.max_resident
+                and self._resident_bytes <= self.max_resident_bytes
+            ):
+                break
+            if self._evictable(session_id):
+                self._evict(session_id)
+                self._counters["evicted"] += 1
+
+    def sweep(self):
+        """
+        Evict sessions idle for idle_seconds from memory and delete sessions untouched
+        for ttl seconds from SQLite. Runs every sweep_interval seconds in the background.
+        """
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            for session_id, last_used in list(self._last_used.items()):
+                if last_used < cutoff and self._evictable(session_id):
+                    self._evict(session_id)
+                    self._counters["evicted"] += 1
+            self._enforce_bounds()
+        if self.ttl <= 0:
+            return
+        expires_before = time.time() - self.ttl
+        with self._db_lock:
+            expired = [
+                session_id
+                for (session_id,) in self._db.execute(
+                    "SELECT id FROM sessions WHERE updated_at < ?", (expires_before,)
+                )
+            ]
+        with self._lock:
+            expired = [sid for sid in expired if sid not in self._sessions or self._evictable(sid)]
+            for session_id in expired:
+                self._evict(session_id)
+        if not expired:
+            return
+        deleted = 0
+        with span("session.expire", sessions=len(expired)), self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for session_id in expired:
+                    # Another worker may have written the session since the SELECT
+                    removed = self._db.execute(
+                        "DELETE FROM sessions WHERE id = ? AND updated_at < ?",
+                        (session_id, expires_before),
+                    ).rowcount
+                    if removed:
+                        self._db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                        deleted += 1
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if not deleted:
+            return
+        self._counters["expired"] += deleted
+        logger.info("Expired %d sessions idle for over %ds", deleted, self.ttl)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Session sweep failed")
+
+    def stats(self) -> dict:
+        """Memory accounting for /metrics."""
+        with self._lock:
+            return {
+                "resident": len(self._sessions),
+                "resident_bytes": self._resident_bytes,
+                "resident_turns": sum(len(s.get("history", [])) for s in self._sessions.values()),
+                "pending": len(self._pending),
+                **self._counters,
+            }
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def migrate_json(self, json_path: Path = LEGACY_SESSIONS_FILE) -> int:
+        """
+        One-shot import of the legacy sessions.json format, run by the app lifespan and
+        the migrate command. The file is first renamed to *.migrating, which only one of
+        several workers starting together manages; the others find it gone and skip.
+        It ends up as *.migrated so the import never runs twice.
+        """
+        json_path = Path(json_path)
+        claimed = json_path.with_name(json_path.name + ".migrating")
+        try:
+            json_path.rename(claimed)
+        except FileNotFoundError:
+            # Nothing to migrate, or another worker is already on it
+            return 0
+        try:
+            with open(claimed, "r") as f:
+                legacy = json.load(f)
+            with self._lock:
+                for session_id, session in legacy.items():
+                    if self.get(session_id) is not None:
+                        continue
+                    self._sessions[session_id] = session
+                    self._saved_turns[session_id] = 0
+                    self._versions[session_id] = 0
+                    self._base_states[session_id] = None
+                    self.save(session_id)
+                self.flush()
+        except Exception as e:
+            logger.error("Failed to migrate %s: %s", json_path, e)
+            # Put it back for the next start or a manual migrate
+            claimed.rename(json_path)
+            return 0
+        claimed.rename(json_path.with_name(json_path.name + ".migrated"))
+        logger.info("Migrated %d sessions from %s to %s", len(legacy), json_path, self.path)
+        return len(legacy)
+
+
+if __name__ == "__main__":
+    # python -m app.session_store migrate [path/to/sessions.json]
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        source = Path(sys.argv[2]) if len(sys.argv) > 2 else LEGACY_SESSIONS_FILE
+        store = SessionStore(flush_interval=0)
+        store.migrate_json(source)
+        store.close()
+    else:
+        print("usage: python -m app.session_store migrate [sessions.json]")
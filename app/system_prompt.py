@@ -39,4 +39,23 @@ Collect the following information:
 9. Whether they already use any credit cards.
 Once all relevant information is collected, say: 
 “DONE. Based on your preferences, here are the top credit cards for you…”
-"""
\ No newline at end of file
+"""
+# The same questions in order, used verbatim when Gemini is unavailable. The greeting
+# already asks for the age, so the n-th user answer is followed by FALLBACK_QUESTIONS[n - 1].
+FALLBACK_QUESTIONS = [
+    "What is your monthly or annual income?",
+    "How much do you spend on fuel in a typical month?",
+    "How much do you spend on travel in a typical month?",
+    "How much do you spend on groceries in a typical month?",
+    "How much do you spend on dining out in a typical month?",
+    "How much do you spend on online shopping in a typical month?",
+    "How much do you spend on utilities (electricity, water, DTH, etc.) in a typical month?",
+    "Is there any other significant spending category? If so, roughly how much per month?",
+    "What type of rewards or benefits do you prefer (cashback, travel rewards, lounge access, dining discounts, fuel surcharge waiver, etc.)?",
+    "Do you prefer a specific bank or card issuer?",
+    "Are there any special features or perks you want?",
+    "Would you like a card with a low or waived annual/joining fee?",
+    "What is your approximate credit score? (“unknown” is fine)",
+    "Do you already use any credit cards?",
+]
+FALLBACK_DONE = "DONE. Based on your preferences, here are the top credit cards for you…"
@@ -1,55 +1,167 @@
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 from app.embedding_utils import generate_text_embedding
-from app.gemini_api import genai_client
+from app.llm import generate
+from app.fast_extract import SPENDING_CATEGORIES, extract_answer
+from app.metrics import count, record_tokens, span
+from app.catalog import card_id, get_catalog, strip_citations
+from app.eligibility import build_eligibility_filter
+from app.rec_cache import preference_fingerprint, recommendation_cache
+from app.rewards import get_reward_engine
 
+logger = logging.getLogger(__name__)
 
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-
-# def parse_amount(text):
-#     import re
-
-#     text = text.lower().replace(",", "")
-#     match = re.search(r"(\d+)(?:\s*(thousand|lakh|lakhs|million|crore|cr))?", text)
-#     if not match:
-#         return 0
-#     num = int(match.group(1))
-#     mult = 1
-#     if match.group(2):
-#         if "thousand" in match.group(2):
-#             mult = 1000
-#         elif "lakh" in match.group(2):
-#             mult = 100000
-#         elif "million" in match.group(2):
-#             mult = 1000000
-#         elif "crore" in match.group(2) or "cr" in match.group(2):
-#             mult = 10000000
-#     return num * mult
-
-
-def extract_user_preferences_and_update_session(session: dict):
+
+
+# Candidates fetched per requested recommendation, re-ranked by simulated reward value
+RERANK_POOL_FACTOR = int(os.getenv("RERANK_POOL_FACTOR", "3"))
+
+# Confidence recorded for fields filled in by the LLM extractor
+LLM_EXTRACT_CONFIDENCE = 0.9
+
+
+def empty_preferences() -> dict:
+    return {
+        "age": None,
+        "income": None,
+        "income_period": None,
+        "spending": {},
+        "custom_spending": {},
+        "reward_preferences": [],
+        "bank_preference": None,
+        "special_features": [],
+        "annual_fee_preference": None,
+        "credit_score": None,
+        "existing_cards": [],
+    }
+
+
+def merge_preferences(current: dict, update: dict) -> dict:
     """
-    Uses Gemini Flash to extract preferences from session['history'] and updates session['preferences'] in-place.
+    Merge freshly extracted fields into the current preferences field by field.
+    Non-null scalars replace the old value, spending dicts are updated per category
+    and lists are unioned in order, so a partial update never erases earlier answers.
     """
-    from app.gemini_api import genai_client
-    from google.genai import types
-    import json
+    merged = empty_preferences()
+    merged.update(current or {})
+    for field, value in (update or {}).items():
+        if value is None:
+            continue
+        old = merged.get(field)
+        if isinstance(value, dict):
+            merged[field] = {
+                **(old if isinstance(old, dict) else {}),
+                **{k: v for k, v in value.items() if v is not None},
+            }
+        elif isinstance(value, list):
+            old = old if isinstance(old, list) else []
+            merged[field] = old + [v for v in value if v not in old]
+        else:
+            merged[field] = value
+    return merged
+
+
+def _record_confidence(confidence: dict, update: dict, score: float):
+    for field, value in update.items():
+        if isinstance(value, dict):
+            confidence.update({f"{field}.{key}": score for key, v in value.items() if v is not None})
+        elif value not in (None, []):
+            confidence[field] = score
+
 
-    # Compose chat history as a string
-    chat = "\n".join(
-        [f"{m['sender']}: {m['text']}" for m in session.get("history", [])]
+def apply_fast_extraction(session: dict) -> list:
+    """
+    Run the rule-based extractor (app/fast_extract.py) over the user turns it has not
+    seen yet and fold what it resolves into session['preferences'], with a confidence
+    per field in session['preference_confidence']. Turns it cannot resolve are queued
+    in session['unresolved_turns'] for the LLM extractor; session['preferences_turns']
+    stops at the first of them. Returns the queued history indices.
+    """
+    history = session.get("history", [])
+    scanned = session.get("fast_extract_turns", session.get("preferences_turns", 0))
+    prefs = session.get("preferences") or {}
+    confidence = dict(session.get("preference_confidence") or {})
+    unresolved = list(session.get("unresolved_turns") or [])
+    if scanned > len(history) or session.get("preferences_turns", 0) > len(history):
+        # History was reset or trimmed behind our back; start over
+        scanned, prefs, confidence, unresolved = 0, {}, {}, []
+
+    for idx in range(scanned, len(history)):
+        turn = history[idx]
+        if turn["sender"] != "user":
+            continue
+        previous = history[idx - 1] if idx else None
+        question = previous["text"] if previous and previous["sender"] == "bot" else ""
+        result = extract_answer(question, turn["text"])
+        if result is None:
+            count("extract.fast", "unresolved")
+            unresolved.append(idx)
+            continue
+        count("extract.fast", "resolved")
+        update, scores = result
+        prefs = merge_preferences(prefs, update)
+        confidence.update(scores)
+
+    session["preferences"] = merge_preferences(prefs, {})
+    session["preference_confidence"] = confidence
+    session["unresolved_turns"] = unresolved
+    session["fast_extract_turns"] = len(history)
+    session["preferences_turns"] = unresolved[0] if unresolved else len(history)
+    return unresolved
+
+
+def preferences_complete(session: dict) -> bool:
+    """
+    Whether every question of the interview has a resolved answer and nothing is
+    waiting for the LLM extractor, i.e. a recommendation now would not change with
+    further extraction.
+    """
+    if session.get("unresolved_turns"):
+        return False
+    confidence = session.get("preference_confidence") or {}
+    needed = (
+        ["age", "income", "reward_preferences", "bank_preference", "special_features"]
+        + [f"spending.{category}" for category in SPENDING_CATEGORIES]
+        + ["annual_fee_preference", "credit_score", "existing_cards"]
     )
+    has_custom = any(k == "custom_spending" or k.startswith("custom_spending.") for k in confidence)
+    return has_custom and all(field in confidence for field in needed)
+
+
+async def extract_user_preferences_and_update_session(session: dict):
+    """
+    Bring session['preferences'] up to date in-place. New turns go through the
+    rule-based extractor first; Gemini Flash only sees the answers it could not
+    resolve (each with the question before it) plus the current preference JSON,
+    so most sessions never make an extraction call.
+    """
+    import json
+
+    unresolved = apply_fast_extraction(session)
+    current = session["preferences"]
+    if not unresolved:
+        return current
+
+    history = session["history"]
+    pairs = []
+    for idx in unresolved:
+        if idx and history[idx - 1]["sender"] == "bot":
+            pairs.append(history[idx - 1])
+        pairs.append(history[idx])
+    chat = "\n".join(f"{m['sender']}: {m['text']}" for m in pairs)
 
     # Compose the extraction prompt
 
     extraction_prompt = f"""
     You are a data extractor.
 
-    Given the following chat history between a user and a credit card assistant, extract the user's preferences in **valid JSON format** with these exact fields and types:
+    You are given the user's preferences extracted so far and the newest messages of a chat between
+    the user and a credit card assistant. Return **valid JSON** with these exact fields and types,
+    filling in only what the new messages state or change and using null (or an empty list/object)
+    for everything they do not mention:
 
     ```json
     {{
@@ -74,140 +186,73 @@ def extract_user_preferences_and_update_session(session: dict):
     "credit_score": string or null,
     "existing_cards": [string]
     }}
+    ```
+
+    Preferences so far:
+    {json.dumps(current, ensure_ascii=False)}
 
+    New messages (each user answer follows the question it replies to):
+    {chat}
     """
 
     # Call Gemini Flash
     try:
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=extraction_prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
-            ),
-        )
-        prefs = json.loads(response.text)
+        with span("llm.extract", turns=len(unresolved)):
+            response = await generate(
+                extraction_prompt,
+                "llm.extract",
+                config={"response_mime_type": "application/json"},
+            )
+        record_tokens("llm.extract", response)
+        update = json.loads(response.text)
     except Exception as e:
-        print("LLM extraction error:", e)
-        prefs = {
-            "age": None,
-            "income": None,
-            "income_period": None,
-            "spending": {},
-            "custom_spending": {},
-            "reward_preferences": [],
-            "bank_preference": None,
-            "special_features": [],
-            "annual_fee_preference": None,
-            "credit_score": None,
-            "existing_cards": [],
-        }
+        # Keep what we have and leave the turns queued so they are retried
+        logger.warning("Preference extraction failed: %r", e)
+        return current
+    prefs = merge_preferences(current, update)
+    _record_confidence(session["preference_confidence"], update, LLM_EXTRACT_CONFIDENCE)
     session["preferences"] = prefs
+    session["unresolved_turns"] = []
+    session["preferences_turns"] = len(history)
     return prefs
 
 
 def simulate_rewards(card, prefs):
     """
-    Simulate annual rewards for a card and user preferences using Gemini LLM (Flash).
-    Falls back to regex-based method if LLM fails.
-    """
-    import re
-    from app.gemini_api import genai_client
-    from google.genai import types
-    import json
-
-    # Prepare prompt for Gemini
-    prompt = f"""
-    You are a financial assistant. Given the following credit card details and user spending preferences, estimate the total annual rewards the user could earn with this card. 
-    
-    Card details (JSON):
-    {json.dumps(card, ensure_ascii=False, indent=2)}
-    
-    User spending preferences (JSON):
-    {json.dumps(prefs.get('spending', {}), ensure_ascii=False, indent=2)}
-    
-    Please:
-    - Calculate the total estimated annual rewards (in INR) for this user, based on the reward structure and spending.
-    - Show a breakdown by category if possible.
-    - If the reward structure is unclear, say so.
-    - Respond in valid JSON with fields: {{"total_rewards_inr": int, "details": [string]}}.
+    Simulate annual rewards for a card and user preferences with the compiled reward
+    engine (see app/rewards.py). Returns (summary, details).
     """
-    try:
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
-            ),
-        )
-        result = json.loads(response.text)
-        total = result.get("total_rewards_inr", 0)
-        details = result.get("details", [])
-        if details:
-            return f"You could earn approx. ₹{total:.0f}/year", details
-    except Exception as e:
-        print("LLM reward simulation error, falling back to regex:", e)
-
-    #Fallback: regex-based method 
-    total = 0
-    details = []
-    rr = card.get("reward_rate", "").lower()
-    generic_cb_match = re.search(r"(\d+)% on (all|other|any) spends", rr)
-    generic_pt_match = re.search(r"(\d+) points per [₹rs\\. ]*(\d+)", rr)
-    for cat, spend in prefs.get("spending", {}).items():
-        if spend == 0:
-            continue
-        cb_match = re.search(r"(\d+)%.*" + cat, rr)
-        if cb_match:
-            rate = float(cb_match.group(1)) / 100
-            annual = spend * 12
-            reward = annual * rate
-            total += reward
-            details.append(f"{rate*100:.0f}% cashback on {cat}: ₹{reward:.0f}/year")
-            continue
-        pt_match = re.search(r"(\d+) points per [₹rs\\. ]*(\d+).*(" + cat + ")", rr)
-        if pt_match:
-            pts = float(pt_match.group(1))
-            per = float(pt_match.group(2))
-            annual = spend * 12
-            reward_points = (annual / per) * pts
-            point_value = 0.25
-            reward_inr = reward_points * point_value
-            total += reward_inr
-            details.append(
-                f"{pts:.0f} points per ₹{per:.0f} on {cat}: {reward_points:.0f} points/year (~₹{reward_inr:.0f}/year)"
-            )
-            continue
-        if generic_cb_match:
-            rate = float(generic_cb_match.group(1)) / 100
-            annual = spend * 12
-            reward = annual * rate
-            total += reward
-            details.append(
-                f"{rate*100:.0f}% cashback on {cat}: ₹{reward:.0f}/year (generic)"
-            )
-            continue
-        if generic_pt_match:
-            pts = float(generic_pt_match.group(1))
-            per = float(generic_pt_match.group(2))
-            annual = spend * 12
-            reward_points = (annual / per) * pts
-            point_value = 0.25
-            reward_inr = reward_points * point_value
-            total += reward_inr
-            details.append(
-                f"{pts:.0f} points per ₹{per:.0f} on {cat}: {reward_points:.0f} points/year (~₹{reward_inr:.0f}/year, generic)"
-            )
-    if details:
-        return f"You could earn approx. ₹{total:.0f}/year", details
-    return "Reward simulation not available", []
+    return get_reward_engine().simulate(card_id(card), prefs)
 
 
-def llm_generate_recommendation_reason(card, prefs):
+def template_reason(card: dict, prefs: dict) -> str:
     """
-    Use Gemini LLM to generate a natural language explanation for why this card is recommended.
+    Deterministic explanation built from the card's own fields and its simulated
+    rewards, used when Gemini cannot produce one.
     """
+    name = card.get("name") or "This card"
+    sentences = []
+    if card.get("reward_type"):
+        rate = strip_citations(card.get("reward_rate", "")).strip()
+        rate = f" ({rate})" if rate else ""
+        sentences.append(f"{name} earns {card['reward_type'].lower()}{rate}.")
+    simulation = card.get("reward_simulation", "")
+    if simulation.startswith("You could earn"):
+        sentences.append(f"With your spending, you could earn {simulation[len('You could earn '):]}.")
+    perks = strip_citations(card.get("special_perks", "")).lower()
+    wanted = [
+        w
+        for w in prefs.get("special_features", []) + prefs.get("reward_preferences", [])
+        if isinstance(w, str) and w.lower() in perks
+    ]
+    if wanted:
+        sentences.append(f"It also offers the {', '.join(wanted)} you asked for.")
+    if prefs.get("annual_fee_preference") and card.get("annual_fee"):
+        sentences.append(f"Annual fee: {card['annual_fee']}.")
+    return " ".join(sentences) or f"{name} matches the preferences you shared."
+
 
+def _user_summary(prefs: dict) -> str:
     user_summary = []
     if prefs.get("income"):
         user_summary.append(f"Income: {prefs['income']}")
@@ -228,33 +273,82 @@ def llm_generate_recommendation_reason(card, prefs):
         user_summary.append(f"Preferred issuer: {prefs['bank_preference']}")
     if prefs.get("annual_fee_preference"):
         user_summary.append("Prefers low/waived fee")
+    return "; ".join(user_summary)
+
 
-    user_summary = "; ".join(user_summary)
-    card_summary = f"Card: {card.get('name', '')}\nIssuer: {card.get('issuer', '')}\nAnnual Fee: {card.get('annual_fee', '')}\nReward Type: {card.get('reward_type', '')}\nReward Rate: {card.get('reward_rate', '')}\nSpecial Perks: {card.get('special_perks', '')}"
+def _card_summary(card: dict) -> str:
+    return f"Card: {card.get('name', '')}\nIssuer: {card.get('issuer', '')}\nAnnual Fee: {card.get('annual_fee', '')}\nReward Type: {card.get('reward_type', '')}\nReward Rate: {card.get('reward_rate', '')}\nSpecial Perks: {card.get('special_perks', '')}"
+
+
+async def llm_generate_recommendation_reason(card, prefs):
+    """
+    Use Gemini LLM to generate a natural language explanation for why this card is recommended.
+    Returns None when Gemini fails or is unavailable.
+    """
     prompt = (
         "You are a credit card recommendation assistant. Based on the following user profile and credit card information, "
         "write a compelling and concise explanation (1–2 sentences) highlighting **why this card is a great match** for the user. "
         "Focus on specific matches between the user's preferences and the card’s features. Your goal is to persuade the user by clearly explaining the benefits they’ll get.\n\n"
-        f"User Profile:\n{user_summary}\n\n"
-        f"Card Details:\n{card_summary}\n\n"
+        f"User Profile:\n{_user_summary(prefs)}\n\n"
+        f"Card Details:\n{_card_summary(card)}\n\n"
         "Explain in a friendly, persuasive tone."
     )
     try:
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
-            ),
-        )
+        with span("llm.reason", card=card.get("name", "")):
+            response = await generate(prompt, "llm.reason")
+        record_tokens("llm.reason", response)
         return response.text.strip()
     except Exception as e:
-        return "Explanation not available."
+        logger.warning("Reason generation failed for %s: %r", card.get("name", ""), e)
+        return None
+
+
+async def llm_generate_recommendation_reasons(cards: dict, prefs: dict):
+    """
+    Explanations for several cards from one structured-output call: the user profile
+    is sent once with every card, and Gemini answers with a JSON object mapping each
+    card_id to its explanation. cards maps card id to card. Returns the reasons it
+    could parse (possibly only some of the ids), or None if the call itself failed.
+    """
+    import json
+
+    card_blocks = "\n\n".join(
+        f"card_id: {cid}\n{_card_summary(card)}" for cid, card in cards.items()
+    )
+    prompt = (
+        "You are a credit card recommendation assistant. Based on the following user profile and credit cards, "
+        "write a compelling and concise explanation (1–2 sentences) for each card highlighting **why it is a great match** for the user. "
+        "Focus on specific matches between the user's preferences and the card’s features, in a friendly, persuasive tone.\n\n"
+        f"User Profile:\n{_user_summary(prefs)}\n\n"
+        f"Cards:\n{card_blocks}\n\n"
+        "Return a JSON object whose keys are exactly the card_id values above and whose values are the explanations."
+    )
+    try:
+        with span("llm.reasons", cards=len(cards)):
+            response = await generate(
+                prompt, "llm.reasons", config={"response_mime_type": "application/json"}
+            )
+        record_tokens("llm.reasons", response)
+    except Exception as e:
+        logger.warning("Batched reason generation failed: %r", e)
+        return None
+    try:
+        parsed = json.loads(response.text)
+    except (TypeError, ValueError) as e:
+        logger.warning("Batched reasons were not valid JSON: %r", e)
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {
+        cid: reason.strip()
+        for cid, reason in parsed.items()
+        if cid in cards and isinstance(reason, str) and reason.strip()
+    }
 
 
-def generate_text_embedding_from_preferences(preferences: dict):
+def preference_summary(preferences: dict) -> str:
     """
-    Generate a summary string from structured preferences for embedding.
+    Summary string of structured preferences for embedding.
     This ensures the embedding is based on key-value pairs, not just raw user text.
     """
     summary_parts = []
@@ -298,35 +392,181 @@ def generate_text_embedding_from_preferences(preferences: dict):
         summary_parts.append(
             "Existing Cards: " + ", ".join(preferences["existing_cards"])
         )
-    summary_text = "; ".join(summary_parts)
-    return generate_text_embedding(summary_text)
+    return "; ".join(summary_parts)
+
+
+async def generate_text_embedding_from_preferences(preferences: dict):
+    with span("embedding"):
+        return await generate_text_embedding(preference_summary(preferences))
 
 
-def get_top_credit_card_recommendations_from_session(
-    session_or_history, pinecone_index, top_k: int = 3
+async def get_top_credit_card_recommendations_from_session(
+    session_or_history, vector_store, top_k: int = 3
 ) -> list[dict]:
     # Accept either a session dict or a history list for backward compatibility
     if isinstance(session_or_history, dict):
-        prefs = session_or_history.get("preferences")
-        history = session_or_history.get("history", [])
+        session = session_or_history
     else:
-        prefs = None
-        history = session_or_history
-    if not prefs or not prefs.get("age"):
-        from app.utils import extract_user_preferences_and_update_session
+        session = {"history": session_or_history}
+    prefs = session.get("preferences")
+    if not prefs:
+        # /recommend extracts before calling us; only bare histories land here
+        prefs = await extract_user_preferences_and_update_session(session)
 
-        # If only history is passed, wrap in a dict for compatibility
-        session = {"history": history}
-        prefs = extract_user_preferences_and_update_session(session)
+    fingerprint = preference_fingerprint(prefs)
+    matches = recommendation_cache.get_matches(fingerprint, top_k)
+    from_vectors = True
+    if matches is None:
+        matches, from_vectors = await _rank_matches(prefs, vector_store, top_k)
+        if from_vectors:
+            # Fallback rankings are not cached, so the next request uses the vectors again
+            recommendation_cache.put_matches(fingerprint, top_k, matches)
 
-    # Use preferences-based summary for embedding
-    embedding = generate_text_embedding_from_preferences(prefs)
+    # One snapshot for the whole response, even if the catalog is reloaded meanwhile
+    catalog = get_catalog()
+    matches = catalog.join(matches)
+    engine = catalog.rewards
     cards = []
-    result = pinecone_index.query(vector=embedding, top_k=top_k, include_metadata=True)
-    cards = [match["metadata"] for match in result["matches"]]
-    for card in cards:
-        # sim, details = simulate_rewards(card, prefs)
-        # card["reward_simulation"] = sim
-        # card["reward_details"] = details
-        card["llm_reason"] = llm_generate_recommendation_reason(card, prefs)
+    for match in matches:
+        card = match["metadata"]
+        sim, details = engine.simulate(match["id"], prefs)
+        card["reward_simulation"] = sim
+        card["reward_details"] = details
+        cards.append(card)
+
+    reasons, templated = await reasons_for(
+        {match["id"]: card for match, card in zip(matches, cards)}, prefs, fingerprint
+    )
+    for match, card in zip(matches, cards):
+        card["llm_reason"] = reasons[match["id"]]
+        # Served by a fallback while Gemini was failing; callers should not keep it
+        card["degraded"] = not from_vectors or match["id"] in templated
     return cards
+
+
+async def reasons_for(cards: dict, prefs: dict, fingerprint: str):
+    """
+    Reason per card id: cached ones first, then one batched Gemini call for the rest.
+    Cards the batch left out (or could not be parsed for) get individual calls; if
+    Gemini is failing altogether they get template_reason. Only Gemini-written
+    reasons are cached. Returns (reasons, ids that got a template reason).
+    """
+    reasons = {}
+    for cid in cards:
+        cached = recommendation_cache.get_reason(cid, fingerprint)
+        if cached is not None:
+            reasons[cid] = cached
+    missing = {cid: card for cid, card in cards.items() if cid not in reasons}
+    if len(missing) > 1:
+        batch = await llm_generate_recommendation_reasons(missing, prefs)
+        if batch is None:
+            # The call layer already retried; don't multiply a failing call per card
+            missing = {}
+        else:
+            for cid, reason in batch.items():
+                reasons[cid] = reason
+                recommendation_cache.put_reason(cid, fingerprint, reason)
+            missing = {cid: card for cid, card in missing.items() if cid not in batch}
+    if missing:
+        singles = await asyncio.gather(
+            *(llm_generate_recommendation_reason(card, prefs) for card in missing.values())
+        )
+        for cid, reason in zip(missing, singles):
+            if reason is not None:
+                reasons[cid] = reason
+                recommendation_cache.put_reason(cid, fingerprint, reason)
+    templated = set()
+    for cid, card in cards.items():
+        if cid not in reasons:
+            reasons[cid] = template_reason(card, prefs)
+            templated.add(cid)
+    return reasons, templated
+
+
+async def _rank_matches(prefs: dict, vector_store, top_k: int):
+    """
+    Embed the preferences, fetch eligible candidates from the vector store and
+    re-rank them by simulated reward value. Returns the top_k matches and whether
+    they came from the vector search (False for the reward-only fallback).
+    """
+    # Use preferences-based summary for embedding
+    try:
+        embedding = await generate_text_embedding_from_preferences(prefs)
+    except Exception as e:
+        logger.warning("Embedding unavailable, ranking by reward value only: %r", e)
+        return rank_by_rewards(prefs, top_k), False
+    (matches,) = await rank_embedded([prefs], [embedding], vector_store, top_k)
+    return matches, True
+
+
+async def rank_embedded(prefs_list: list, embeddings: list, vector_store, top_k: int) -> list:
+    """
+    Top-k matches for many preference sets at once, given their embeddings: eligible
+    candidates from one query_many call, re-ranked by simulated reward value.
+    Returns one list of {"id", "score"} matches per preference set; card details are
+    joined afterwards from the catalog (CatalogSnapshot.join).
+    """
+    # Remote backends are blocking, so keep the query off the event loop. Fetch a wider
+    # pool so simulated reward value can re-rank it before we cut to top_k.
+    pool = max(top_k * RERANK_POOL_FACTOR, top_k)
+    engine = get_reward_engine()
+    # Filter out cards the user cannot qualify for before the top-k cut
+    filters = [build_eligibility_filter(prefs) for prefs in prefs_list]
+    with span("vector.query", vectors=len(embeddings)):
+        found = await asyncio.to_thread(
+            vector_store.query_many, embeddings, pool, filters
+        )
+    # Cards removed from the catalog stay in the index until the next seed run
+    known = get_catalog().by_id
+    found = [[m for m in matches if m["id"] in known] for matches in found]
+    ranked = [engine.rerank(matches, prefs) for matches, prefs in zip(found, prefs_list)]
+
+    # The fee preference is soft: top up with cards that only meet the hard
+    # income/age constraints rather than returning fewer than top_k
+    short = []
+    for i, prefs in enumerate(prefs_list):
+        if len(ranked[i]) < top_k and filters[i]:
+            hard_filter = build_eligibility_filter(prefs, include_fee=False)
+            if hard_filter != filters[i]:
+                short.append((i, hard_filter))
+    if short:
+        with span("vector.query", vectors=len(short)):
+            extra = await asyncio.to_thread(
+                vector_store.query_many,
+                [embeddings[i] for i, _ in short],
+                pool,
+                [hard_filter for _, hard_filter in short],
+            )
+        for (i, _), matches in zip(short, extra):
+            seen = {m["id"] for m in ranked[i]}
+            extra_matches = [m for m in matches if m["id"] in known and m["id"] not in seen]
+            ranked[i] += engine.rerank(extra_matches, prefs_list[i])
+    return [matches[:top_k] for matches in ranked]
+
+
+def rank_by_rewards(prefs: dict, top_k: int) -> list[dict]:
+    """
+    Deterministic fallback for when the preferences cannot be embedded: every eligible
+    catalog card ranked purely by simulated reward value.
+    """
+    from app.vector_store import matches_filter
+
+    catalog = get_catalog()
+    engine = catalog.rewards
+    eligibility_filter = build_eligibility_filter(prefs)
+    eligible = [
+        {"id": card.id, "score": 0.0}
+        for card in catalog.cards
+        if matches_filter(card, eligibility_filter)
+    ]
+    if len(eligible) < top_k:
+        # Same soft fee preference as the vector path
+        hard_filter = build_eligibility_filter(prefs, include_fee=False)
+        seen = {m["id"] for m in eligible}
+        extra = [
+            {"id": card.id, "score": 0.0}
+            for card in catalog.cards
+            if card.id not in seen and matches_filter(card, hard_filter)
+        ]
+        return (engine.rerank(eligible, prefs) + engine.rerank(extra, prefs))[:top_k]
+    return engine.rerank(eligible, prefs)[:top_k]
@@ -0,0 +1,669 @@
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from dotenv import load_dotenv
+from app.catalog import DATA_DIR, file_signature
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# "local" keeps the catalog embeddings in-process, "ivf" adds an approximate index on
+# top of the local store for large catalogs, "pinecone" queries the hosted index
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+LOCAL_INDEX_PATH = Path(os.getenv("LOCAL_INDEX_PATH", DATA_DIR / "card_index.npy"))
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "credit-cards")
+
+# IVF index: number of k-means lists (0 = about 2 * sqrt(vectors)), lists scanned per
+# query (higher = better recall, slower), shortlist size per requested match for exact
+# re-scoring, the in-list storage type ("int8" or "float16") and k-means iterations
+# when the index is built
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_RERANK_FACTOR = int(os.getenv("IVF_RERANK_FACTOR", "10"))
+IVF_DTYPE = os.getenv("IVF_DTYPE", "int8")
+IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", "10"))
+
+
+_FILTER_OPS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_filter(metadata: dict, filter: dict) -> bool:
+    """
+    Evaluate a Pinecone-style metadata filter against one metadata dict (or anything
+    with a dict-like get(), such as an app.catalog.Card).
+    """
+    for key, condition in (filter or {}).items():
+        if key in ("$and", "$or"):
+            results = [matches_filter(metadata, sub) for sub in condition]
+            if not (all(results) if key == "$and" else any(results)):
+                return False
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        value = metadata.get(key)
+        if value is None:
+            return False
+        if not all(_FILTER_OPS[op](value, operand) for op, operand in condition.items()):
+            return False
+    return True
+
+
+class VectorStore:
+    """
+    Minimal interface shared by every backend. Vectors are dicts with "id", "values"
+    and "metadata"; query() returns matches as dicts with "id" and "score", best match
+    first (card details are joined from the in-process catalog, see app.catalog).
+    filter uses Pinecone's metadata filter syntax and is applied before the top-k
+    cut, so every returned match satisfies it.
+    """
+
+    def upsert(self, vectors: list[dict]) -> None:
+        raise NotImplementedError
+
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list[dict]:
+        raise NotImplementedError
+
+    def query_many(self, vectors, top_k: int = 3, filters: list = None) -> list[list[dict]]:
+        """query() for each vector (with the filter at the same position); one result list per vector."""
+        filters = filters or [None] * len(vectors)
+        return [self.query(v, top_k, f) for v, f in zip(vectors, filters)]
+
+    def delete(self, ids: list[str]) -> None:
+        raise NotImplementedError
+
+    def build_index(self, force: bool = False) -> None:
+        """Rebuild derived search structures after a batch of writes; most backends have none."""
+
+    @contextmanager
+    def bulk(self):
+        """
+        Group many writes: backends that rewrite files on every write (the local store)
+        only persist on flush() and at the end of the block. Others write through.
+        """
+        yield
+
+    def flush(self) -> None:
+        """Persist writes buffered inside bulk(); nothing to do for write-through backends."""
+
+    def stale(self) -> bool:
+        """
+        Whether another process (app.seed_cards) rewrote the files behind this store
+        since it was loaded, so a fresh instance would see different vectors.
+        """
+        return False
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Exact cosine search over a contiguous float32 matrix of unit-normalized rows.
+    The matrix lives in a memory-mapped .npy file next to a JSON sidecar holding
+    the ids and metadata in row order. Writes go to an in-memory copy with spare
+    capacity (grown geometrically, so appends do not copy the matrix) and rewrite
+    both files, once per write or, inside bulk(), once per flush().
+    """
+
+    def __init__(self, path: Path = LOCAL_INDEX_PATH):
+        self.path = Path(path)
+        self.sidecar_path = self.path.with_suffix(".json")
+        self.ids: list[str] = []
+        self.metadata: list[dict] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        # Numeric metadata columns, built on first use by a filter
+        self._columns: dict[str, np.ndarray] = {}
+        self._signature = None
+        # Writable rows with spare capacity (self.matrix is a view of the first rows)
+        # and the id -> row index, created by the first write
+        self._rows = None
+        self._row_of = None
+        self._buffered = False
+        self._dirty = False
+        self._load()
+
+    def _files_signature(self):
+        return [file_signature(self.path), file_signature(self.sidecar_path)]
+
+    def _load(self):
+        self._signature = self._files_signature()
+        if not (self.path.exists() and self.sidecar_path.exists()):
+            return
+        with open(self.sidecar_path, "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        matrix = np.load(self.path, mmap_mode="r")
+        if matrix.shape[0] != len(sidecar["ids"]):
+            logger.warning("Local vector index and sidecar disagree, ignoring: %s", self.path)
+            # Most likely caught between the two renames of a write; stays stale
+            self._signature = None
+            return
+        self.ids = sidecar["ids"]
+        self.metadata = sidecar["metadata"]
+        self.matrix = matrix
+        self._columns = {}
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # np.save appends .npy to names without it, so keep the suffix on the temp file
+        tmp_matrix = self.path.with_name(self.path.stem + ".tmp.npy")
+        tmp_sidecar = self.sidecar_path.with_name(self.sidecar_path.name + ".tmp")
+        np.save(tmp_matrix, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        with open(tmp_sidecar, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "metadata": self.metadata}, f, ensure_ascii=False)
+        os.replace(tmp_matrix, self.path)
+        os.replace(tmp_sidecar, self.sidecar_path)
+        if self._rows is None:
+            self.matrix = np.load(self.path, mmap_mode="r")
+        self._signature = self._files_signature()
+        self._dirty = False
+
+    def _written(self):
+        self._columns = {}
+        if self._buffered:
+            self._dirty = True
+        else:
+            self._save()
+
+    @contextmanager
+    def bulk(self):
+        self._buffered = True
+        try:
+            yield
+        finally:
+            self._buffered = False
+            self.flush()
+
+    def flush(self) -> None:
+        if self._dirty:
+            self._save()
+
+    def _writable(self, rows: int, dim: int) -> np.ndarray:
+        """self._rows with room for at least rows rows of dim values."""
+        if self._rows is None or len(self._rows) < rows or self._rows.shape[1] != dim:
+            grown = np.zeros((max(rows, 2 * len(self.ids), 64), dim), dtype=np.float32)
+            if self.ids:
+                grown[: len(self.ids)] = self.matrix
+            self._rows = grown
+        return self._rows
+
+    def stale(self) -> bool:
+        return self._files_signature() != self._signature
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def upsert(self, vectors: list[dict]) -> None:
+        if not vectors:
+            return
+        if self._row_of is None:
+            self._row_of = {vid: i for i, vid in enumerate(self.ids)}
+        rows = self._row_of
+        new_values = self._normalize(
+            np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        )
+        dim = self.matrix.shape[1] if self.ids else new_values.shape[1]
+        if new_values.shape[1] != dim:
+            raise ValueError(f"Expected {dim}-dimensional vectors, got {new_values.shape[1]}")
+        matrix = self._writable(len(self.ids) + len(vectors), dim)
+        for vector, values in zip(vectors, new_values):
+            row = rows.get(vector["id"])
+            if row is None:
+                row = rows[vector["id"]] = len(self.ids)
+                self.ids.append(vector["id"])
+                self.metadata.append(vector.get("metadata", {}))
+            else:
+                self.metadata[row] = vector.get("metadata", {})
+            matrix[row] = values
+        self.matrix = matrix[: len(self.ids)]
+        self._written()
+
+    def _column(self, key: str) -> np.ndarray:
+        """
+        Metadata field as an array in row order: float64 with NaN for missing values
+        when the field is numeric, otherwise an object array with None.
+        """
+        column = self._columns.get(key)
+        if column is None:
+            values = [m.get(key) for m in self.metadata]
+            if all(v is None or isinstance(v, (int, float)) for v in values):
+                column = np.array(
+                    [np.nan if v is None else v for v in values], dtype=np.float64
+                )
+            else:
+                column = np.array(values, dtype=object)
+            self._columns[key] = column
+        return column
+
+    def _filter_mask(self, filter: dict) -> np.ndarray:
+        """
+        Evaluate a Pinecone-style metadata filter ($eq, $ne, $gt, $gte, $lt, $lte, $in,
+        $nin, $and, $or) over the metadata columns. Rows missing a field never match
+        a clause on it, as in Pinecone.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in filter.items():
+            if key in ("$and", "$or"):
+                masks = [self._filter_mask(sub) for sub in condition]
+                combine = np.logical_and if key == "$and" else np.logical_or
+                mask &= combine.reduce(masks) if masks else key == "$and"
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            column = self._column(key)
+            for op, value in condition.items():
+                if column.dtype == np.float64 and op not in ("$in", "$nin"):
+                    # NaN compares False, so missing values drop out ($ne included)
+                    with np.errstate(invalid="ignore"):
+                        mask &= _FILTER_OPS[op](column, value) & ~np.isnan(column)
+                else:
+                    mask &= np.array(
+                        [v is not None and _FILTER_OPS[op](v, value) for v in column],
+                        dtype=bool,
+                    )
+        return mask
+
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list[dict]:
+        if not self.ids or top_k <= 0:
+            return []
+        q = self._normalize(np.asarray(vector, dtype=np.float32))
+        scores = self.matrix @ q
+        candidates = np.arange(len(self.ids))
+        if filter:
+            candidates = candidates[self._filter_mask(filter)]
+            if candidates.size == 0:
+                return []
+        k = min(top_k, candidates.size)
+        candidate_scores = scores[candidates]
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = candidates[top[np.argsort(-candidate_scores[top])]]
+        return [{"id": self.ids[i], "score": float(scores[i])} for i in top]
+
+    def query_many(self, vectors, top_k: int = 3, filters: list = None) -> list[list[dict]]:
+        """
+        Top-k for a batch of query vectors as one matrix-matrix product. Each distinct
+        filter is evaluated once and masks its rows' scores before the top-k cut.
+        """
+        if not len(vectors):
+            return []
+        if not self.ids or top_k <= 0:
+            return [[] for _ in vectors]
+        q = self._normalize(np.asarray(vectors, dtype=np.float32))
+        scores = q @ np.asarray(self.matrix).T
+        masks = {}
+        for row, filter in enumerate(filters or []):
+            if filter:
+                key = json.dumps(filter, sort_keys=True)
+                if key not in masks:
+                    masks[key] = self._filter_mask(filter)
+                scores[row, ~masks[key]] = -np.inf
+        k = min(top_k, len(self.ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return [
+            [
+                {"id": self.ids[i], "score": float(scores[row, i])}
+                for i in top[row]
+                if np.isfinite(scores[row, i])
+            ]
+            for row in range(len(top))
+        ]
+
+    def delete(self, ids: list[str]) -> None:
+        drop = set(ids)
+        keep = [i for i, vid in enumerate(self.ids) if vid not in drop]
+        if len(keep) == len(self.ids):
+            return
+        self.matrix = np.asarray(self.matrix, dtype=np.float32)[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self._rows = None
+        self._row_of = None
+        self._written()
+
+
+# Sample points per list used to train the k-means centroids
+_IVF_TRAIN_POINTS_PER_LIST = 64
+# Rows per block when streaming the full matrix (assignment, quantization)
+_IVF_BLOCK_ROWS = 16384
+
+
+def _nearest(block: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.argmax(block @ centroids.T, axis=1)
+
+
+def _train_centroids(matrix, nlist: int, iterations: int, rng) -> np.ndarray:
+    """Spherical k-means over a random sample of the (unit-normalized) rows."""
+    n = matrix.shape[0]
+    sample_size = min(n, nlist * _IVF_TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.concatenate(
+            [
+                _nearest(sample[start : start + _IVF_BLOCK_ROWS], centroids)
+                for start in range(0, sample_size, _IVF_BLOCK_ROWS)
+            ]
+        )
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.empty_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled])
+        # Lists that lost every point restart from a random sample point
+        sums[~filled] = sample[rng.choice(sample_size, int((~filled).sum()), replace=False)]
+        centroids = LocalVectorStore._normalize(sums)
+    return centroids
+
+
+class _IVFLists:
+    """One built generation of the IVF index; replaced as a whole by a rebuild."""
+
+    __slots__ = ("centroids", "codes", "scales", "rows", "offsets")
+
+    def __init__(self, centroids, codes, scales, rows, offsets):
+        self.centroids = centroids
+        self.codes = codes
+        self.scales = scales
+        self.rows = rows
+        self.offsets = offsets
+
+
+class IVFVectorStore(VectorStore):
+    """
+    Approximate search for large catalogs: an inverted-file (IVF) index over the exact
+    LocalVectorStore at the same path. Rows are clustered around nlist k-means centroids
+    and stored quantized (int8 with a per-row scale, or float16) in memory-mapped files,
+    grouped by list. A query scans the nprobe lists with the closest centroids, keeps a
+    shortlist of rerank_factor * top_k rows by approximate score and re-scores it
+    exactly against the float32 rows.
+
+    Writes go to the exact store and reach the index on the next build_index() (run by
+    app.seed_cards); until then queries use exact search.
+    """
+
+    def __init__(
+        self,
+        path: Path = LOCAL_INDEX_PATH,
+        nlist: int = IVF_NLIST,
+        nprobe: int = IVF_NPROBE,
+        rerank_factor: int = IVF_RERANK_FACTOR,
+        dtype: str = IVF_DTYPE,
+    ):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unsupported IVF_DTYPE: {dtype}")
+        self.base = LocalVectorStore(path)
+        self.dir = self.base.path.with_suffix(".ivf")
+        self.meta_path = self.dir / "meta.json"
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.dtype = dtype
+        self._meta = {}
+        self._meta_signature = None
+        self._index = None
+        self._build_lock = threading.Lock()
+        self._warned = False
+        self._load()
+
+    def _paths(self, generation: int) -> dict:
+        return {
+            name: self.dir / f"{name}.{generation}.npy"
+            for name in ("centroids", "codes", "scales", "rows", "offsets")
+        }
+
+    def _current(self, meta: dict) -> bool:
+        return (
+            meta.get("dtype") == self.dtype
+            and meta.get("count") == len(self.base.ids)
+            and meta.get("base") == file_signature(self.base.path)
+        )
+
+    def _load(self):
+        self._index = None
+        self._meta_signature = file_signature(self.meta_path)
+        if not self.meta_path.exists():
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self._meta = meta
+        if not self._current(meta):
+            logger.warning("IVF index %s is out of date; using exact search until it is rebuilt", self.dir)
+            return
+        paths = self._paths(meta["generation"])
+        self._index = _IVFLists(
+            centroids=np.load(paths["centroids"]),
+            codes=np.load(paths["codes"], mmap_mode="r"),
+            scales=np.load(paths["scales"], mmap_mode="r") if meta["dtype"] == "int8" else None,
+            rows=np.load(paths["rows"], mmap_mode="r"),
+            offsets=np.load(paths["offsets"]),
+        )
+
+    def stale(self) -> bool:
+        return self.base.stale() or file_signature(self.meta_path) != self._meta_signature
+
+    def bulk(self):
+        return self.base.bulk()
+
+    def flush(self) -> None:
+        self.base.flush()
+
+    def upsert(self, vectors: list[dict]) -> None:
+        self.base.upsert(vectors)
+        if vectors:
+            self._index = None
+
+    def delete(self, ids: list[str]) -> None:
+        count = len(self.base.ids)
+        self.base.delete(ids)
+        if len(self.base.ids) != count:
+            self._index = None
+
+    def build_index(self, force: bool = False) -> None:
+        """
+        Train the lists on the exact store's rows and write a new index generation.
+        The metadata file is replaced last, so readers in other processes see either
+        the old index or the new one. Skipped when the index is already current.
+        """
+        with self._build_lock:
+            if not force and self._index is not None and self._current(self._meta):
+                return
+            matrix = self.base.matrix
+            n = len(self.base.ids)
+            if n == 0:
+                self._index = None
+                return
+            nlist = min(self.nlist or max(1, round(2 * math.sqrt(n))), n)
+            rng = np.random.default_rng(0)
+            centroids = _train_centroids(matrix, nlist, IVF_TRAIN_ITERATIONS, rng)
+
+            assign = np.empty(n, dtype=np.int64)
+            for start in range(0, n, _IVF_BLOCK_ROWS):
+                block = np.asarray(matrix[start : start + _IVF_BLOCK_ROWS], dtype=np.float32)
+                assign[start : start + len(block)] = _nearest(block, centroids)
+            rows = np.argsort(assign, kind="stable")
+            offsets = np.zeros(nlist + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+            position = np.empty(n, dtype=np.int64)
+            position[rows] = np.arange(n)
+
+            generation = self._meta.get("generation", 0) + 1
+            paths = self._paths(generation)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            codes = np.lib.format.open_memmap(
+                paths["codes"], mode="w+", dtype=np.dtype(self.dtype), shape=(n, matrix.shape[1])
+            )
+            scales = np.ones(n, dtype=np.float32)
+            for start in range(0, n, _IVF_BLOCK_ROWS):
+                block = np.asarray(matrix[start : start + _IVF_BLOCK_ROWS], dtype=np.float32)
+                at = position[start : start + len(block)]
+                if self.dtype == "int8":
+                    scale = np.abs(block).max(axis=1) / 127
+                    scale[scale == 0] = 1.0
+                    codes[at] = np.rint(block / scale[:, None]).astype(np.int8)
+                    scales[at] = scale
+                else:
+                    codes[at] = block.astype(np.float16)
+            codes.flush()
+            del codes
+            np.save(paths["centroids"], centroids.astype(np.float32))
+            np.save(paths["scales"], scales)
+            np.save(paths["rows"], rows.astype(np.int32 if n < 2**31 else np.int64))
+            np.save(paths["offsets"], offsets)
+
+            meta = {
+                "generation": generation,
+                "dtype": self.dtype,
+                "nlist": nlist,
+                "count": n,
+                "base": file_signature(self.base.path),
+            }
+            tmp = self.meta_path.with_name(self.meta_path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp, self.meta_path)
+            self._meta = meta
+            self._load()
+            # Earlier generations; processes that still map them keep their open files
+            keep = set(paths.values()) | {self.meta_path}
+            for stale in self.dir.iterdir():
+                if stale not in keep:
+                    stale.unlink(missing_ok=True)
+            logger.info("IVF index built: %d vectors in %d lists (%s)", n, nlist, self.dtype)
+
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list[dict]:
+        return self.query_many([vector], top_k, [filter])[0]
+
+    def query_many(self, vectors, top_k: int = 3, filters: list = None) -> list[list[dict]]:
+        index = self._index
+        if index is None:
+            if not self._warned and self.base.ids:
+                logger.warning("IVF index not built for %s; using exact search", self.base.path)
+                self._warned = True
+            return self.base.query_many(vectors, top_k, filters)
+        if not len(vectors):
+            return []
+        if top_k <= 0:
+            return [[] for _ in vectors]
+        filters = filters or [None] * len(vectors)
+        q = self.base._normalize(np.asarray(vectors, dtype=np.float32))
+        masks, by_filter = [], {}
+        for filter in filters:
+            if filter:
+                key = json.dumps(filter, sort_keys=True)
+                if key not in by_filter:
+                    by_filter[key] = self.base._filter_mask(filter)
+                masks.append(by_filter[key])
+            else:
+                masks.append(None)
+
+        # Lists to scan per query, then each list is decoded once for all queries probing it
+        nlist = len(index.centroids)
+        nprobe = min(max(self.nprobe, 1), nlist)
+        coarse = q @ index.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        probing = {}
+        for i, lists in enumerate(probes):
+            for lst in lists:
+                probing.setdefault(int(lst), []).append(i)
+        scores = [[] for _ in vectors]
+        rows = [[] for _ in vectors]
+        for lst, queries in probing.items():
+            start, end = index.offsets[lst], index.offsets[lst + 1]
+            if start == end:
+                continue
+            approx = np.asarray(index.codes[start:end], dtype=np.float32) @ q[queries].T
+            if index.scales is not None:
+                approx *= np.asarray(index.scales[start:end])[:, None]
+            list_rows = np.asarray(index.rows[start:end])
+            for j, i in enumerate(queries):
+                column, found = approx[:, j], list_rows
+                if masks[i] is not None:
+                    keep = masks[i][found]
+                    column, found = column[keep], found[keep]
+                scores[i].append(column)
+                rows[i].append(found)
+
+        results = []
+        shortlist = max(top_k * self.rerank_factor, top_k)
+        for i in range(len(q)):
+            found = np.concatenate(rows[i]) if rows[i] else np.zeros(0, dtype=np.int64)
+            allowed = len(self.base.ids) if masks[i] is None else int(masks[i].sum())
+            if found.size < min(top_k, allowed):
+                # Too few candidates in the probed lists (a narrow filter); search exactly
+                results.append(self.base.query(vectors[i], top_k, filters[i]))
+                continue
+            approx = np.concatenate(scores[i])
+            if found.size > shortlist:
+                best = np.argpartition(-approx, shortlist - 1)[:shortlist]
+                found = found[best]
+            found = np.sort(found)
+            exact = np.asarray(self.base.matrix[found], dtype=np.float32) @ q[i]
+            k = min(top_k, found.size)
+            top = np.argpartition(-exact, k - 1)[:k]
+            top = top[np.argsort(-exact[top])]
+            results.append(
+                [{"id": self.base.ids[found[j]], "score": float(exact[j])} for j in top]
+            )
+        return results
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, index_name: str = PINECONE_INDEX_NAME):
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        self.index = pc.Index(index_name)
+
+    def upsert(self, vectors: list[dict]) -> None:
+        if vectors:
+            self.index.upsert(vectors=vectors)
+
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list[dict]:
+        result = self.index.query(
+            vector=list(vector), top_k=top_k, filter=filter, include_metadata=False
+        )
+        return [{"id": match["id"], "score": match["score"]} for match in result["matches"]]
+
+    def delete(self, ids: list[str]) -> None:
+        if ids:
+            self.index.delete(ids=list(ids))
+
+
+def get_vector_store(backend: str = VECTOR_STORE) -> VectorStore:
+    """
+    Build the vector store selected by the VECTOR_STORE setting.
+    """
+    if backend == "local":
+        return LocalVectorStore()
+    if backend == "ivf":
+        return IVFVectorStore()
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")
+
+
+if __name__ == "__main__":
+    # python -m app.vector_store build [--force]
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        IVFVectorStore().build_index(force="--force" in sys.argv[2:])
+    else:
+        print("usage: python -m app.vector_store build [--force]")
@@ -0,0 +1,235 @@
+"""
+Recall, throughput and memory benchmark for the IVF vector index (app.vector_store).
+
+For each catalog size a synthetic set of clustered, embedding-like unit vectors is
+written in the LocalVectorStore layout, exact top-k ground truth is computed for held-out queries,
+and the IVF index is built. Reported per nprobe: recall@k against exact search,
+single-query and batched QPS, and resident memory, next to the exact store. Build,
+exact and IVF measurements each run in a fresh interpreter so their RSS is their own.
+
+    python -m bench.ann_bench                                    # 10k, 100k and 1M vectors
+    python -m bench.ann_bench --sizes 10000,100000 --nprobe 4,16,64 --dtype float16
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+# Rows generated / scanned per block, so the 1M case never holds the matrix in memory
+BLOCK_ROWS = 20000
+
+
+def memory_mb() -> dict:
+    """
+    Current resident memory: anonymous (heap, arrays) and file-backed (memory-mapped
+    index pages, which the kernel can drop under pressure) separately.
+    """
+    fields = {"RssAnon:": "anon_mb", "RssFile:": "file_mb"}
+    memory = {}
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            key = line.split(maxsplit=1)[0]
+            if key in fields:
+                memory[fields[key]] = round(int(line.split()[1]) / 1024, 1)
+    return memory
+
+
+def _sampler(rng, n: int, dim: int, latent_dim: int, noise: float):
+    """
+    Draws unit vectors shaped like text embeddings: a Gaussian mixture (one cluster
+    per 500 vectors) in a latent_dim-dimensional subspace, projected into dim
+    dimensions with a little full-rank noise. Isotropic 768-d noise would make
+    nearest neighbours at 1M vectors mostly chance alignments, which no index can find.
+    """
+    basis = np.linalg.qr(rng.standard_normal((dim, latent_dim)))[0].T
+    centers = rng.standard_normal((max(32, n // 500), latent_dim))
+
+    def points(count: int) -> np.ndarray:
+        z = centers[rng.integers(0, len(centers), count)] + noise * rng.standard_normal((count, latent_dim))
+        x = z @ basis
+        x += 0.05 * np.linalg.norm(z, axis=1, keepdims=True) * rng.standard_normal((count, dim)) / np.sqrt(dim)
+        return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+    return points
+
+
+def generate(workdir: Path, n: int, args):
+    """Write the vectors, sidecar, queries and exact top-k ids to workdir."""
+    rng = np.random.default_rng(args.seed)
+    points = _sampler(rng, n, args.dim, args.latent_dim, args.noise)
+    matrix = np.lib.format.open_memmap(workdir / "index.npy", mode="w+", dtype=np.float32, shape=(n, args.dim))
+    for start in range(0, n, BLOCK_ROWS):
+        matrix[start : start + BLOCK_ROWS] = points(min(BLOCK_ROWS, n - start))
+    matrix.flush()
+    with open(workdir / "index.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": [f"v{i}" for i in range(n)], "metadata": [{}] * n}, f)
+
+    q = points(args.queries)
+    np.save(workdir / "queries.npy", q)
+    # Exact top-k, merged block by block
+    best_scores = np.full((args.queries, 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((args.queries, 0), dtype=np.int64)
+    for start in range(0, n, BLOCK_ROWS):
+        scores = q @ np.asarray(matrix[start : start + BLOCK_ROWS]).T
+        block_rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, block_rows], axis=1)
+        keep = np.argpartition(-scores, min(args.k, scores.shape[1]) - 1, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    np.save(workdir / "truth.npy", best_rows)
+    del matrix
+
+
+def _recall(results: list, truth: np.ndarray, k: int) -> float:
+    hits = [
+        len({int(m["id"][1:]) for m in found} & set(expected.tolist())) / k
+        for found, expected in zip(results, truth)
+    ]
+    return round(float(np.mean(hits)), 4) if hits else 0.0
+
+
+def _single_queries(store, q: np.ndarray, k: int, budget_s: float):
+    """Queries one at a time until all are done or budget_s runs out."""
+    results = []
+    start = time.perf_counter()
+    for vector in q:
+        results.append(store.query(vector, k))
+        if time.perf_counter() - start > budget_s:
+            break
+    elapsed = time.perf_counter() - start
+    return results, round(len(results) / elapsed, 1)
+
+
+def worker(args) -> dict:
+    from app.vector_store import IVFVectorStore, LocalVectorStore
+
+    workdir = Path(args.workdir)
+    path = workdir / "index.npy"
+    if args.worker == "build":
+        store = IVFVectorStore(path, nlist=args.nlist, dtype=args.dtype)
+        start = time.perf_counter()
+        store.build_index(force=True)
+        return {
+            "build_s": round(time.perf_counter() - start, 2),
+            "nlist": store._meta["nlist"],
+            "index_mb": round(sum(p.stat().st_size for p in store.dir.iterdir()) / 2**20, 1),
+            "vectors_mb": round(path.stat().st_size / 2**20, 1),
+        }
+
+    q = np.load(workdir / "queries.npy")
+    truth = np.load(workdir / "truth.npy")
+    if args.worker == "exact":
+        store = LocalVectorStore(path)
+        results, qps = _single_queries(store, q, args.k, args.time_budget)
+        return {"recall": _recall(results, truth, args.k), "qps": qps, **memory_mb()}
+
+    store = IVFVectorStore(path, nlist=args.nlist, dtype=args.dtype)
+    runs = {}
+    for nprobe in args.nprobe:
+        store.nprobe = nprobe
+        results, qps = _single_queries(store, q, args.k, args.time_budget)
+        start = time.perf_counter()
+        batched = store.query_many(q, args.k)
+        batch_qps = round(len(q) / (time.perf_counter() - start), 1)
+        runs[nprobe] = {
+            "recall": _recall(batched, truth, args.k),
+            "qps": qps,
+            "batch_qps": batch_qps,
+        }
+    return {"runs": runs, **memory_mb()}
+
+
+def _run_worker(kind: str, workdir: Path, args) -> dict:
+    command = [
+        sys.executable, "-m", "bench.ann_bench",
+        "--worker", kind,
+        "--workdir", str(workdir),
+        "--k", str(args.k),
+        "--nlist", str(args.nlist),
+        "--dtype", args.dtype,
+        "--nprobe", ",".join(map(str, args.nprobe)),
+        "--time-budget", str(args.time_budget),
+    ]
+    done = subprocess.run(command, cwd=BENCH_DIR.parent, capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError(f"{kind} worker failed:\n{done.stderr}")
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def run_size(n: int, args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix=f"ccr-ann-{n}-", dir=args.tmpdir))
+    try:
+        start = time.perf_counter()
+        generate(workdir, n, args)
+        print(f"{n} vectors generated in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        result = {"vectors": n, **_run_worker("build", workdir, args)}
+        print(f"{n} vectors indexed in {result['build_s']}s", file=sys.stderr)
+        result["exact"] = _run_worker("exact", workdir, args)
+        result["ivf"] = _run_worker("ivf", workdir, args)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(results: list, args):
+    print(
+        f"dim={args.dim} k={args.k} dtype={args.dtype} queries={args.queries} "
+        f"(synthetic vectors: latent_dim={args.latent_dim}, noise={args.noise})"
+    )
+    for r in results:
+        print(
+            f"\n{r['vectors']:,} vectors: nlist={r['nlist']}, build {r['build_s']}s, "
+            f"index {r['index_mb']} MB + float32 vectors {r['vectors_mb']} MB on disk"
+        )
+        print(f"  {'':<12}{'recall@k':>10}{'QPS':>10}{'batch QPS':>12}{'RSS anon MB':>13}{'RSS file MB':>13}")
+        exact, ivf = r["exact"], r["ivf"]
+        print(
+            f"  {'exact':<12}{exact['recall']:>10}{exact['qps']:>10}{'':>12}"
+            f"{exact['anon_mb']:>13}{exact['file_mb']:>13}"
+        )
+        for nprobe, run in ivf["runs"].items():
+            print(
+                f"  {'nprobe=' + str(nprobe):<12}{run['recall']:>10}{run['qps']:>10}"
+                f"{run['batch_qps']:>12}{ivf['anon_mb']:>13}{ivf['file_mb']:>13}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ints = lambda text: [int(v) for v in text.split(",") if v]  # noqa: E731
+    parser.add_argument("--sizes", type=ints, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768, help="text-embedding-004 vectors are 768-d")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=ints, default=[4, 16, 64])
+    parser.add_argument("--nlist", type=int, default=0, help="0 = the index default (about 2 * sqrt(vectors))")
+    parser.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    parser.add_argument("--time-budget", type=float, default=10.0, help="seconds of single queries per measurement")
+    parser.add_argument("--latent-dim", type=int, default=32, help="intrinsic dimension of the synthetic vectors")
+    parser.add_argument("--noise", type=float, default=1.0, help="cluster spread of the synthetic vectors")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tmpdir", help="where to write the generated vectors (1M x 768 needs ~4 GB)")
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    parser.add_argument("--worker", choices=["build", "exact", "ivf"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+    results = [run_size(n, args) for n in args.sizes]
+    print_report(results, args)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
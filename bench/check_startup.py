@@ -0,0 +1,74 @@
+"""
+Cold-start budget check: time `import app.main` in this fresh interpreter, then the
+first /chat and the first /recommend against the zero-latency fakes, and exit non-zero
+if any exceeds its budget. Run it on its own so nothing is imported beforehand:
+
+    python -m bench.check_startup --import-budget 1.0 --first-request-budget 0.5
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+
+
+async def first_requests() -> dict:
+    import httpx
+    from bench.fakes import FakeGenaiClient, FakePineconeIndex, LatencyModel, seed_fake_index
+    from bench.run_bench import install_fakes, make_profile
+    from app.main import app
+    import random
+
+    instant = LatencyModel(median_ms=0.001, p95_ms=0.001)
+    index = FakePineconeIndex(instant)
+    seed_fake_index(index)
+    install_fakes(FakeGenaiClient(instant, instant), index)
+
+    timings = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            answers = make_profile(random.Random(0))
+            for i, answer in enumerate(answers):
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"session_id": "cold", "user_input": answer})
+                response.raise_for_status()
+                if i == 0:
+                    timings["first_chat_s"] = time.perf_counter() - start
+            start = time.perf_counter()
+            response = await client.post("/recommend", params={"session_id": "cold"})
+            response.raise_for_status()
+            timings["first_recommend_s"] = time.perf_counter() - start
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-budget", type=float, default=1.0, help="seconds for `import app.main`")
+    parser.add_argument("--first-request-budget", type=float, default=0.5, help="seconds for each first request")
+    args = parser.parse_args(argv)
+
+    from bench.run_bench import _isolate_environment
+
+    _isolate_environment(tempfile.mkdtemp(prefix="ccr-startup-"))
+    start = time.perf_counter()
+    import app.main  # noqa: F401
+
+    timings = {"import_s": time.perf_counter() - start}
+    timings.update(asyncio.run(first_requests()))
+
+    budgets = {
+        "import_s": args.import_budget,
+        "first_chat_s": args.first_request_budget,
+        "first_recommend_s": args.first_request_budget,
+    }
+    over = False
+    for key, budget in budgets.items():
+        ok = timings[key] <= budget
+        over |= not ok
+        print(f"{key:<18} {timings[key]:.3f}s  budget {budget:.3f}s  {'ok' if ok else 'OVER BUDGET'}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
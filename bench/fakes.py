@@ -0,0 +1,338 @@
+"""
+Local stand-ins for the Gemini client and the Pinecone index, so /chat and /recommend
+can be driven end to end without API keys. Latency, error rate and canned responses
+are configurable; every call is counted by kind.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import random
+import re
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+
+EMBEDDING_DIM = 64
+
+# Preference fields in the order SYSTEM_PROMPT asks for them. The greeting asks for the
+# age; the fake chat model then asks app.system_prompt.FALLBACK_QUESTIONS in order.
+QUESTION_FIELDS = [
+    "age",
+    "income",
+    "fuel",
+    "travel",
+    "groceries",
+    "dining",
+    "online_shopping",
+    "utilities",
+    "custom_spending",
+    "reward_preferences",
+    "bank_preference",
+    "special_features",
+    "annual_fee_preference",
+    "credit_score",
+    "existing_cards",
+]
+SPENDING_FIELDS = ("fuel", "travel", "groceries", "dining", "online_shopping", "utilities")
+
+# Endpoint label for call attribution; the harness sets it around each request and it
+# follows the request into gathered tasks and worker threads
+current_endpoint = contextvars.ContextVar("current_endpoint", default="other")
+
+
+def _questions() -> list[str]:
+    from app.gemini_api import INITIAL_BOT_MESSAGE
+    from app.system_prompt import FALLBACK_QUESTIONS
+
+    return [INITIAL_BOT_MESSAGE] + FALLBACK_QUESTIONS
+
+
+def _question_index(bot_text: str):
+    """Position of a bot message in the flow; fallback replies end with the question."""
+    for i, question in enumerate(_questions()):
+        if bot_text == question or bot_text.endswith(" " + question):
+            return i
+    return None
+
+
+def _parse_answer(field: str, answer: str):
+    """Turn a simulated user answer back into the extractor's JSON value."""
+    text = answer.strip()
+    none = text.lower() in ("none", "no", "no preference", "unknown")
+    if field == "age":
+        return {"age": int(text)}
+    if field == "income":
+        amount, _, period = text.partition(" per ")
+        return {
+            "income": int(amount),
+            "income_period": "annual" if period.startswith("year") else "monthly",
+        }
+    if field in SPENDING_FIELDS:
+        return {"spending": {field: int(text)}}
+    if field == "custom_spending":
+        if none:
+            return {}
+        name, _, amount = text.rpartition(" ")
+        return {"custom_spending": {name: int(amount)}}
+    if field in ("reward_preferences", "special_features", "existing_cards"):
+        return {field: [] if none else [part.strip() for part in text.split(",")]}
+    if field == "bank_preference":
+        return {"bank_preference": None if none else text}
+    if field == "annual_fee_preference":
+        return {"annual_fee_preference": text.lower().startswith("yes")}
+    if field == "credit_score":
+        return {"credit_score": text}
+    return {}
+
+
+def extract_from_prompt(prompt: str) -> dict:
+    """
+    Canned extractor: pair each user line in the prompt with the bot question before it
+    and return only the fields those answers cover, like the real extractor does.
+    """
+    update = {}
+    last_question = None
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith("bot: "):
+            last_question = _question_index(line[len("bot: ") :])
+        elif line.startswith("user: ") and last_question is not None:
+            field = QUESTION_FIELDS[last_question]
+            for key, value in _parse_answer(field, line[len("user: ") :]).items():
+                if isinstance(value, dict):
+                    update.setdefault(key, {}).update(value)
+                else:
+                    update[key] = value
+    return update
+
+
+def next_question(prompt: str) -> str:
+    """Canned chat model: ask the question after the last one in the prompt."""
+    questions = _questions()
+    last = 0
+    for line in prompt.splitlines():
+        line = line.strip()
+        if line.startswith("bot: "):
+            index = _question_index(line[len("bot: ") :])
+            if index is not None:
+                last = index
+    if last + 1 >= len(questions):
+        from app.system_prompt import FALLBACK_DONE
+
+        return FALLBACK_DONE
+    return questions[last + 1]
+
+
+class LatencyModel:
+    """
+    Log-normal latency with the given median and p95 (milliseconds) and a uniform
+    error rate. sample() returns seconds.
+    """
+
+    def __init__(self, median_ms: float = 800, p95_ms: float = 2000, error_rate: float = 0.0, seed: int = 0):
+        self.mu = np.log(max(median_ms, 0.001) / 1000)
+        # p95 of a log-normal is exp(mu + 1.645 sigma)
+        self.sigma = max(np.log(max(p95_ms, median_ms) / max(median_ms, 0.001)) / 1.645, 0.0)
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        return float(np.exp(self.rng.gauss(self.mu, self.sigma))) if self.sigma else float(np.exp(self.mu))
+
+    def should_fail(self) -> bool:
+        return self.rng.random() < self.error_rate
+
+
+class FakeUpstreamError(Exception):
+    """Looks like a Gemini 503 to the retry logic."""
+
+    code = 503
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Deterministic pseudo-embedding so identical text always maps to the same vector."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32).tolist()
+
+
+def _usage(prompt: str, reply: str):
+    return SimpleNamespace(
+        prompt_token_count=len(prompt) // 4 + 1,
+        candidates_token_count=len(reply) // 4 + 1,
+        total_token_count=(len(prompt) + len(reply)) // 4 + 2,
+    )
+
+
+class _Response(SimpleNamespace):
+    pass
+
+
+class FakeGenaiModels:
+    """
+    Implements the subset of client.models / client.aio.models the app uses:
+    generate_content, generate_content_stream and embed_content.
+    """
+
+    def __init__(self, latency: LatencyModel, embed_latency: LatencyModel, calls: Counter, canned: dict):
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.calls = calls
+        self.canned = canned
+
+    def _reply_for(self, prompt: str) -> tuple[str, str]:
+        if "data extractor" in prompt:
+            kind = "extract"
+        elif "card_id: " in prompt:
+            kind = "reasons"
+        elif "Card Details:" in prompt:
+            kind = "reason"
+        else:
+            kind = "chat"
+        if kind in self.canned:
+            return kind, self.canned[kind]
+        if kind == "extract":
+            return kind, json.dumps(extract_from_prompt(prompt))
+        if kind == "reason":
+            return kind, "This card matches your spending pattern and preferred rewards."
+        if kind == "reasons":
+            ids = re.findall(r"^\s*card_id: (\S+)", prompt, re.MULTILINE)
+            return kind, json.dumps(
+                {cid: "This card matches your spending pattern and preferred rewards." for cid in ids}
+            )
+        return kind, next_question(prompt)
+
+    def _count(self, kind: str):
+        self.calls[(current_endpoint.get(), kind)] += 1
+
+    def _check_error(self, latency: LatencyModel, kind: str):
+        if latency.should_fail():
+            self._count(f"{kind}_error")
+            raise FakeUpstreamError(f"fake {kind} failure")
+
+    async def generate_content(self, model, contents, config=None):
+        kind, text = self._reply_for(str(contents))
+        self._count(kind)
+        await asyncio.sleep(self.latency.sample())
+        self._check_error(self.latency, kind)
+        return _Response(text=text, usage_metadata=_usage(str(contents), text))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        kind, text = self._reply_for(str(contents))
+        self._count(kind)
+        total = self.latency.sample()
+        self._check_error(self.latency, kind)
+        words = text.split(" ")
+
+        async def chunks():
+            # First token arrives after ~20% of the total latency, the rest spread out
+            await asyncio.sleep(total * 0.2)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(total * 0.8 / len(words))
+                last = i == len(words) - 1
+                yield _Response(
+                    text=word + ("" if last else " "),
+                    usage_metadata=_usage(str(contents), text) if last else None,
+                )
+
+        return chunks()
+
+    async def embed_content(self, model, contents, config=None):
+        texts = contents if isinstance(contents, list) else [contents]
+        self._count("embed")
+        await asyncio.sleep(self.embed_latency.sample())
+        self._check_error(self.embed_latency, "embed")
+        return _Response(embeddings=[SimpleNamespace(values=fake_embedding(t)) for t in texts])
+
+
+class _SyncModels:
+    """Blocking facade over FakeGenaiModels for client.models (used by seeding)."""
+
+    def __init__(self, models: FakeGenaiModels):
+        self._models = models
+
+    def embed_content(self, model, contents, config=None):
+        texts = contents if isinstance(contents, list) else [contents]
+        self._models._count("embed")
+        time.sleep(self._models.embed_latency.sample())
+        return _Response(embeddings=[SimpleNamespace(values=fake_embedding(t)) for t in texts])
+
+    def generate_content(self, model, contents, config=None):
+        kind, text = self._models._reply_for(str(contents))
+        self._models._count(kind)
+        time.sleep(self._models.latency.sample())
+        return _Response(text=text, usage_metadata=_usage(str(contents), text))
+
+
+class FakeGenaiClient:
+    def __init__(
+        self,
+        latency: LatencyModel = None,
+        embed_latency: LatencyModel = None,
+        canned: dict = None,
+    ):
+        """
+        canned maps a call kind ("chat", "extract", "reason", "reasons") to a fixed response text,
+        e.g. {"extract": json.dumps(CANNED_PREFERENCES)}; other kinds follow the flow.
+        """
+        self.calls = Counter()
+        aio_models = FakeGenaiModels(
+            latency or LatencyModel(),
+            embed_latency or LatencyModel(median_ms=150, p95_ms=400),
+            self.calls,
+            canned or {},
+        )
+        self.aio = SimpleNamespace(models=aio_models)
+        self.models = _SyncModels(aio_models)
+
+
+class FakePineconeIndex:
+    """
+    Pinecone Index stand-in backed by an exact in-memory search, with Pinecone-shaped
+    query responses, metadata filters and configurable network latency.
+    """
+
+    def __init__(self, latency: LatencyModel = None):
+        from app.vector_store import LocalVectorStore
+
+        self.latency = latency or LatencyModel(median_ms=60, p95_ms=150)
+        self.calls = Counter()
+        self._dir = tempfile.TemporaryDirectory()
+        self._store = LocalVectorStore(Path(self._dir.name) / "index.npy")
+
+    def upsert(self, vectors):
+        self.calls[(current_endpoint.get(), "upsert")] += 1
+        self._store.upsert(list(vectors))
+
+    def delete(self, ids):
+        self.calls[(current_endpoint.get(), "delete")] += 1
+        self._store.delete(list(ids))
+
+    def query(self, vector, top_k, filter=None, include_metadata=True, **kwargs):
+        self.calls[(current_endpoint.get(), "query")] += 1
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise FakeUpstreamError("fake pinecone failure")
+        return {"matches": self._store.query(vector, top_k, filter)}
+
+
+def seed_fake_index(index: FakePineconeIndex):
+    """Fill the fake index from data/cards.json the way app.seed_cards does."""
+    from app.catalog import card_id, load_cards
+    from app.embedding_utils import card_embedding_text
+    from app.seed_cards import card_metadata
+
+    index.upsert(
+        [
+            {
+                "id": card_id(card),
+                "values": fake_embedding(card_embedding_text(card)),
+                "metadata": card_metadata(card),
+            }
+            for card in load_cards()
+        ]
+    )
@@ -0,0 +1,249 @@
+"""
+Offline load benchmark for /chat and /recommend.
+
+Runs the FastAPI app in-process against the fakes in bench/fakes.py: many concurrent
+simulated users walk the SYSTEM_PROMPT question flow turn by turn and then ask for
+recommendations. Reports latency percentiles per endpoint, throughput, LLM calls per
+request and peak RSS, and can save or compare against a baseline JSON.
+
+    python -m bench.run_bench --conversations 200 --concurrency 50
+    python -m bench.run_bench --save-baseline      # writes bench/baseline.json
+    python -m bench.run_bench --compare            # diff against bench/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+
+
+def _isolate_environment(workdir: str):
+    """
+    Point every persistent store at a scratch directory and make sure nothing reaches
+    the network. Must run before the app is imported, since settings are read then.
+    """
+    os.environ["GEMINI_API_KEY"] = "bench"
+    os.environ["PINECONE_API_KEY"] = "bench"
+    os.environ["VECTOR_STORE"] = "local"
+    os.environ["LOCAL_INDEX_PATH"] = str(Path(workdir) / "card_index.npy")
+    os.environ["SESSIONS_DB"] = str(Path(workdir) / "sessions.sqlite3")
+    os.environ["EMBEDDING_CACHE_PATH"] = ""  # memory-only cache
+
+
+def install_fakes(genai_client, index):
+    """Register the fakes as the process-wide clients (see app.clients)."""
+    from app.clients import set_genai_client, set_vector_store
+    from app.vector_store import PineconeVectorStore
+
+    set_genai_client(genai_client)
+    store = PineconeVectorStore.__new__(PineconeVectorStore)
+    store.index = index
+    set_vector_store(store)
+
+
+def make_profile(rng: random.Random) -> list[str]:
+    """User answers to bench.fakes.QUESTION_FIELDS, in order."""
+    spend = lambda low, high: str(rng.randrange(low, high, 500))  # noqa: E731
+    income = rng.choice([25000, 40000, 60000, 90000, 150000, 300000])
+    income_answer = (
+        f"{income * 12} per year" if rng.random() < 0.3 else f"{income} per month"
+    )
+    return [
+        str(rng.randint(21, 60)),
+        income_answer,
+        spend(0, 8000),
+        spend(0, 15000),
+        spend(2000, 20000),
+        spend(0, 12000),
+        spend(0, 20000),
+        spend(1000, 6000),
+        rng.choice(["none", "none", f"education {spend(2000, 10000)}"]),
+        rng.choice(["cashback", "travel rewards, lounge access", "reward points", "fuel surcharge waiver"]),
+        rng.choice(["no preference", "HDFC Bank", "SBI Card", "Axis Bank", "ICICI Bank"]),
+        rng.choice(["lounge access", "dining discounts", "none", "fuel surcharge waiver"]),
+        rng.choice(["yes", "no"]),
+        rng.choice(["750", "800", "unknown", "700"]),
+        rng.choice(["none", "HDFC Millennia"]),
+    ]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_conversation(
+    client, session_id: str, answers: list[str], stream: bool, latencies, failures, read_s: float = 0.0
+):
+    from bench.fakes import current_endpoint
+
+    async def timed(endpoint: str, method: str, url: str, **kwargs):
+        token = current_endpoint.set(endpoint)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            if stream and endpoint == "chat":
+                await response.aread()
+        except Exception as e:
+            failures[endpoint] += 1
+            print(f"{endpoint} request failed:", e, file=sys.stderr)
+            return None
+        finally:
+            latencies[endpoint].append(time.perf_counter() - start)
+            current_endpoint.reset(token)
+        if response.status_code >= 400:
+            failures[endpoint] += 1
+        return response
+
+    since = 0
+    for answer in answers:
+        payload = {"session_id": session_id, "user_input": answer}
+        if stream:
+            await timed("chat", "POST", "/chat/stream", json=payload)
+        else:
+            response = await timed("chat", "POST", "/chat", json={**payload, "since": since})
+            if response is not None and response.status_code == 200:
+                since = response.json()["total_turns"]
+    # The user reads the final message before the frontend asks for recommendations
+    await asyncio.sleep(read_s)
+    await timed("recommend", "POST", "/recommend", params={"session_id": session_id, "top_k": 3})
+
+
+async def run(args) -> dict:
+    import httpx
+    from bench.fakes import FakeGenaiClient, FakePineconeIndex, LatencyModel, seed_fake_index
+
+    genai_client = FakeGenaiClient(
+        latency=LatencyModel(args.llm_median_ms, args.llm_p95_ms, args.llm_error_rate, seed=args.seed),
+        embed_latency=LatencyModel(args.embed_median_ms, args.embed_p95_ms, args.llm_error_rate, seed=args.seed + 1),
+    )
+    index = FakePineconeIndex(LatencyModel(args.vector_median_ms, args.vector_p95_ms, 0.0, seed=args.seed + 2))
+    seed_fake_index(index)
+    index.calls.clear()
+    install_fakes(genai_client, index)
+
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    profiles = [make_profile(rng) for _ in range(args.profiles)]
+    latencies = defaultdict(list)
+    failures = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int, client):
+        async with semaphore:
+            await run_conversation(
+                client,
+                f"bench-{args.seed}-{i}",
+                profiles[i % len(profiles)],
+                rng.random() < args.stream_ratio,
+                latencies,
+                failures,
+                args.read_ms / 1000,
+            )
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i, client) for i in range(args.conversations)))
+            elapsed = time.perf_counter() - start
+
+    calls = Counter(genai_client.calls) + Counter(index.calls)
+    requests_total = sum(len(v) for v in latencies.values())
+    endpoints = {}
+    for endpoint, values in sorted(latencies.items()):
+        kinds = {kind: n for (ep, kind), n in sorted(calls.items()) if ep == endpoint}
+        llm_calls = sum(n for kind, n in kinds.items() if kind in ("chat", "extract", "reason", "reasons"))
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "failures": failures[endpoint],
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+            "llm_calls_per_request": round(llm_calls / len(values), 3),
+            "calls": kinds,
+        }
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare", "output")},
+        "conversations": args.conversations,
+        "requests": requests_total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests_total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_report(results: dict, baseline: dict = None):
+    def delta(value, old):
+        if old in (None, 0):
+            return ""
+        return f" ({(value - old) / old * 100:+.1f}%)"
+
+    base = baseline or {}
+    print(
+        f"{results['conversations']} conversations, {results['requests']} requests in "
+        f"{results['elapsed_s']}s: {results['throughput_rps']} req/s"
+        + delta(results["throughput_rps"], base.get("throughput_rps"))
+    )
+    for endpoint, stats in results["endpoints"].items():
+        old = base.get("endpoints", {}).get(endpoint, {})
+        print(f"  {endpoint}: {stats['requests']} requests, {stats['failures']} failed")
+        for key in ("p50_ms", "p95_ms", "p99_ms", "llm_calls_per_request"):
+            print(f"    {key:<22} {stats[key]:>10}{delta(stats[key], old.get(key))}")
+    print(f"  peak RSS: {results['peak_rss_mb']} MB" + delta(results["peak_rss_mb"], base.get("peak_rss_mb")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50, help="simulated users active at once")
+    parser.add_argument("--profiles", type=int, default=50, help="distinct answer sets to cycle through")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="share of users on /chat/stream")
+    parser.add_argument("--read-ms", type=float, default=0.0, help="pause between the last chat turn and /recommend")
+    parser.add_argument("--llm-median-ms", type=float, default=300)
+    parser.add_argument("--llm-p95-ms", type=float, default=900)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--embed-median-ms", type=float, default=80)
+    parser.add_argument("--embed-p95-ms", type=float, default=200)
+    parser.add_argument("--vector-median-ms", type=float, default=40)
+    parser.add_argument("--vector-p95-ms", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, help="write results JSON here")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE_FILE.name}")
+    parser.add_argument("--compare", action="store_true", help=f"show changes against {BASELINE_FILE.name}")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ccr-bench-")
+    _isolate_environment(workdir)
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare and BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+    print_report(results, baseline)
+    for path in [args.output, BASELINE_FILE if args.save_baseline else None]:
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+            print("Results written to", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import tempfile
+
+from bench.run_bench import _isolate_environment
+
+# Settings are read when the app modules are imported, so this runs before any test
+# module imports them: sessions, caches and the local index live in a scratch directory
+_isolate_environment(tempfile.mkdtemp(prefix="ccr-tests-"))
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import embedding_utils
+from app.embedding_utils import EmbeddingCache
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = EmbeddingCache(path)
+    cache.put_many([("a", [1.0, 2.0]), ("b", [3.0, 4.0])])
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many(["a", "missing", "b"]) == [[1.0, 2.0], None, [3.0, 4.0]]
+    assert reopened.stats()["disk_hits"] == 2
+    assert reopened.stats()["misses"] == 1
+    # Now resident in memory
+    assert reopened.get_many(["a"], memory_only=True) == [[1.0, 2.0]]
+
+
+@pytest.fixture
+def fake_embed(tmp_path, monkeypatch):
+    """Memory-fresh cache over a fresh disk tier and an embed() that records its calls."""
+    monkeypatch.setattr(embedding_utils, "embedding_cache", EmbeddingCache(tmp_path / "cache.sqlite3"))
+    calls = []
+
+    async def embed(contents, model, config=None):
+        calls.append(contents)
+        texts = contents if isinstance(contents, list) else [contents]
+        return SimpleNamespace(
+            embeddings=[SimpleNamespace(values=[float(len(t)), 1.0]) for t in texts]
+        )
+
+    monkeypatch.setattr(embedding_utils, "embed", embed)
+    return calls
+
+
+def test_text_embeddings_are_cached_once_per_distinct_text(fake_embed, tmp_path):
+    vectors = asyncio.run(embedding_utils.generate_text_embeddings(["ab", "abc", "ab"]))
+    assert vectors == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+    assert fake_embed == [["ab", "abc"]]
+
+    assert asyncio.run(embedding_utils.generate_text_embedding("abc")) == [3.0, 1.0]
+    assert len(fake_embed) == 1
+
+    keys = [
+        EmbeddingCache.make_key(embedding_utils.EMBEDDING_MODEL, embedding_utils.EMBEDDING_TASK_TYPE, text)
+        for text in ("ab", "abc")
+    ]
+    restarted = EmbeddingCache(tmp_path / "cache.sqlite3")
+    assert restarted.get_many(keys) == [[2.0, 1.0], [3.0, 1.0]]
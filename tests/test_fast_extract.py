@@ -0,0 +1,121 @@
+import pytest
+
+from app.fast_extract import extract_answer, question_field
+
+REWARDS = "What kind of rewards or benefits do you prefer?"
+BANK = "Do you have a preferred bank?"
+CARDS = "Which credit cards do you already have?"
+INCOME = "What is your income?"
+FUEL = "How much do you spend on fuel per month?"
+
+
+@pytest.mark.parametrize(
+    "bot_text, field",
+    [
+        (REWARDS, ("reward_preferences", None)),
+        (BANK, ("bank_preference", None)),
+        (CARDS, ("existing_cards", None)),
+        (INCOME, ("income", None)),
+        (FUEL, ("spending", "fuel")),
+        ("Thanks! How old are you?", ("age", None)),
+    ],
+)
+def test_question_field(bot_text, field):
+    assert question_field(bot_text) == field
+
+
+@pytest.mark.parametrize(
+    "bot_text, answer, update",
+    [
+        (REWARDS, "cashback and lounge access", {"reward_preferences": ["cashback", "lounge access"]}),
+        (REWARDS, "no annual fee", {"reward_preferences": ["no annual fee"]}),
+        (REWARDS, "none", {"reward_preferences": []}),
+        (BANK, "hdfc", {"bank_preference": "HDFC Bank"}),
+        (BANK, "no preference", {}),
+        (BANK, "any bank is fine", {}),
+        (BANK, "not any particular one", {}),
+        (CARDS, "hdfc millennia", {"existing_cards": ["HDFC Bank Millennia Credit Card"]}),
+        (CARDS, "i don't have any", {"existing_cards": []}),
+        (FUEL, "3-4k", {"spending": {"fuel": 3500}}),
+        (FUEL, "₹24,000 a year", {"spending": {"fuel": 2000}}),
+        ("How old are you?", "29", {"age": 29}),
+    ],
+)
+def test_resolved_answers(bot_text, answer, update):
+    result = extract_answer(bot_text, answer)
+    assert result is not None
+    assert result[0] == update
+
+
+@pytest.mark.parametrize(
+    "bot_text, answer",
+    [
+        (REWARDS, "no cashback"),
+        (REWARDS, "no lounge"),
+        (REWARDS, "anything except cashback"),
+        (BANK, "no sbi"),
+        (BANK, "no, hdfc"),
+        (BANK, "no hdfc please"),
+        (BANK, "anything but hdfc"),
+        (BANK, "not any particular one, maybe sbi"),
+        (BANK, "no preference, hdfc if anything"),
+        (CARDS, "no millennia"),
+        (CARDS, "not millennia anymore"),
+    ],
+)
+def test_negated_answers_go_to_llm(bot_text, answer):
+    assert extract_answer(bot_text, answer) is None
+
+
+def test_unrelated_answer_goes_to_llm():
+    assert extract_answer(BANK, "i travel a lot for work and want airport perks") is None
+
+
+@pytest.mark.parametrize(
+    "bot_text, answer, income, period",
+    [
+        (INCOME, "50k", 50000, "monthly"),
+        (INCOME, "12 lakh", 1200000, "annual"),
+        (INCOME, "3 lakh per month", 300000, "monthly"),
+        ("What is your annual income?", "3 lakh", 300000, "annual"),
+    ],
+)
+def test_income_with_period(bot_text, answer, income, period):
+    update, _ = extract_answer(bot_text, answer)
+    assert update == {"income": income, "income_period": period}
+
+
+@pytest.mark.parametrize("answer", ["3 lakh", "2.5 lakh", "₹1,20,000"])
+def test_income_of_a_lakh_or_more_without_period_goes_to_llm(answer):
+    assert extract_answer(INCOME, answer) is None
+
+
+FEE = "Would you prefer a card with a low or no annual fee?"
+
+
+@pytest.mark.parametrize(
+    "answer, low_fee",
+    [
+        ("no annual fee please", True),
+        ("lifetime free", True),
+        ("low fee", True),
+        ("i don't mind paying", False),
+    ],
+)
+def test_fee_preference(answer, low_fee):
+    update, _ = extract_answer(FEE, answer)
+    assert update == {"annual_fee_preference": low_fee}
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "I don't need a low fee card",
+        "not looking for low fee, premium is fine",
+        "no need for a waived fee",
+        "low fee is not important",
+        "doesn't need to be low",
+    ],
+)
+def test_negated_fee_answers_go_to_llm(answer):
+    assert extract_answer(FEE, answer) is None
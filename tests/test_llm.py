@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from app import llm
+
+
+def _half_open(name: str = "test") -> llm.CircuitBreaker:
+    breaker = llm.CircuitBreaker(name, failure_threshold=1, cooldown=60)
+    breaker.opened_at = time.monotonic() - 61
+    return breaker
+
+
+async def _ok():
+    return "ok"
+
+
+def _call(breaker, call, **kwargs):
+    return asyncio.run(llm.call_with_resilience(call, "test", breaker, **kwargs))
+
+
+@pytest.mark.parametrize("error", [ValueError("bad request"), asyncio.CancelledError()])
+def test_failed_trial_reopens_breaker(error):
+    breaker = _half_open()
+
+    async def fail():
+        raise error
+
+    with pytest.raises(type(error)):
+        _call(breaker, fail)
+    assert not breaker.trial_in_flight
+    assert breaker.state == "open"
+
+    breaker.opened_at = time.monotonic() - 61
+    assert _call(breaker, _ok) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_only_one_trial_while_half_open():
+    breaker = _half_open()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.end_trial()
+    assert breaker.state == "open"
+
+
+def test_abandoned_stream_trial_is_released(monkeypatch):
+    monkeypatch.setattr(llm, "generate_breaker", _half_open("gemini.generate"))
+
+    async def chunks():
+        for text in ("a", "b"):
+            yield text
+
+    class Models:
+        async def generate_content_stream(self, **kwargs):
+            return chunks()
+
+    class Client:
+        class aio:
+            models = Models()
+
+    monkeypatch.setattr(llm, "get_genai_client", lambda: Client())
+
+    async def consume_one():
+        stream = llm.generate_stream("hi", "test")
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+
+    asyncio.run(consume_one())
+    assert not llm.generate_breaker.trial_in_flight
+    assert llm.generate_breaker.state == "open"
+
+
+def test_slot_wait_counts_against_deadline(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 0)
+
+    async def scenario():
+        monkeypatch.setattr(llm, "_llm_semaphore", asyncio.Semaphore(1))
+        await llm._llm_semaphore.acquire()
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await llm.call_with_resilience(_ok, "test", llm.CircuitBreaker("test"), timeout=5, deadline=0.2)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) < 1
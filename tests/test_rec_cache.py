@@ -0,0 +1,35 @@
+from app.catalog import get_catalog
+from app.eligibility import build_eligibility_filter
+from app.rec_cache import preference_fingerprint
+from app.vector_store import matches_filter
+
+# ICICI Rubyx asks for ₹5.5 lakh a year, i.e. 45,833.33 a month
+RUBYX = "icici_bank_rubyx_credit_card"
+
+
+def _prefs(income, period="monthly", **extra):
+    return {"income": income, "income_period": period, "age": 30, "reward_preferences": ["cashback"], **extra}
+
+
+def _eligible(prefs) -> set:
+    filter = build_eligibility_filter(prefs)
+    return {card.id for card in get_catalog().cards if matches_filter(card, filter)}
+
+
+def test_incomes_either_side_of_a_threshold_do_not_share_a_fingerprint():
+    below, above = _prefs(45000), _prefs(45900)
+    assert RUBYX in _eligible(above) - _eligible(below)
+    assert preference_fingerprint(below) != preference_fingerprint(above)
+
+
+def test_incomes_with_the_same_eligibility_share_a_fingerprint():
+    assert _eligible(_prefs(46000)) == _eligible(_prefs(49000))
+    assert preference_fingerprint(_prefs(46000)) == preference_fingerprint(_prefs(49000))
+    # The period is folded into the tier
+    assert preference_fingerprint(_prefs(550000, "annual")) == preference_fingerprint(_prefs(46000))
+
+
+def test_other_preferences_still_count():
+    assert preference_fingerprint(_prefs(46000)) != preference_fingerprint(
+        _prefs(46000, reward_preferences=["lounge access"])
+    )
@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import gemini_api, routes
+from app.main import app
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _reload(client, headers=None):
+    return client.post("/admin/catalog/reload", headers=headers or {})
+
+
+def test_admin_endpoints_are_disabled_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "")
+    assert _reload(client).status_code == 503
+    assert _reload(client, {"X-Admin-Token": ""}).status_code == 503
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "wrong"}, {"X-Admin-Token": ""}])
+def test_admin_endpoints_reject_a_wrong_token(client, monkeypatch, headers):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", TOKEN)
+    assert _reload(client, headers).status_code == 403
+
+
+def test_admin_endpoints_accept_the_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", TOKEN)
+    response = _reload(client, {"X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.json()["cards"] > 0
+
+
+def _batch(client, headers=None):
+    return client.post("/recommend/batch", json={"session_ids": ["nobody"]}, headers=headers or {})
+
+
+@pytest.mark.parametrize(
+    "configured, headers, status",
+    [
+        ("", {}, 503),
+        ("", {"X-Admin-Token": TOKEN}, 503),
+        (TOKEN, {}, 403),
+        (TOKEN, {"X-Admin-Token": "wrong"}, 403),
+    ],
+)
+def test_batch_recommendations_require_the_admin_token(client, monkeypatch, configured, headers, status):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", configured)
+    assert _batch(client, headers).status_code == status
+
+
+def test_batch_recommendations_with_the_token(client, monkeypatch):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", TOKEN)
+    response = _batch(client, {"X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.json() == {"session_id": "nobody", "error": "session not found"}
+
+
+def _sse(response) -> list:
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_cut_off_mid_reply_is_not_saved(client, monkeypatch):
+    client.post("/chat", json={"session_id": "cut", "user_input": "hi"})
+    before = client.get("/sessions/cut/history").json()
+
+    async def failing_stream(contents, operation):
+        yield SimpleNamespace(text="Great, and what is")
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(gemini_api, "generate_stream", failing_stream)
+    response = client.post("/chat/stream", json={"session_id": "cut", "user_input": "I am 30"})
+    events = _sse(response)
+    assert [name for name, _ in events] == ["token", "error"]
+    assert events[-1][1]["truncated"] is True
+    # Neither the half reply nor the unanswered user turn is kept
+    assert client.get("/sessions/cut/history").json() == before
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.session_store import SessionStore
+
+
+@pytest.fixture
+def shared_stores(tmp_path):
+    """Two stores sharing one database, like two workers with SESSION_SHARED=1."""
+    stores = [
+        SessionStore(tmp_path / "sessions.sqlite3", shared=True, sweep_interval=0)
+        for _ in range(2)
+    ]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def _turn(text: str) -> dict:
+    return {"sender": "user", "text": text}
+
+
+def test_write_through_is_visible_to_other_store(shared_stores):
+    a, b = shared_stores
+    a.get_or_create("s1")["history"].append(_turn("hello"))
+    asyncio.run(a.save_async("s1"))
+    assert b.get("s1")["history"] == [_turn("hello")]
+
+
+def test_concurrent_writes_are_merged(shared_stores):
+    a, b = shared_stores
+    session = a.get_or_create("s1")
+    session["history"].append(_turn("one"))
+    a.save("s1")
+
+    # b appends on top of the stored copy while a still holds the older one
+    other = b.get("s1")
+    other["history"].append(_turn("two"))
+    other["preferences"] = {"age": 30}
+    asyncio.run(b.save_async("s1"))
+
+    session["history"].append(_turn("three"))
+    session["income_period"] = "monthly"
+    asyncio.run(a.save_async("s1"))
+
+    merged = b.get("s1")
+    assert merged["history"] == [_turn("one"), _turn("two"), _turn("three")]
+    assert merged["preferences"] == {"age": 30}
+    assert merged["income_period"] == "monthly"
+    # Both saved version 2 on top of version 1; the merge supersedes both
+    assert merged["version"] == 3
+    # a adopted the merged copy as well
+    assert a.get("s1")["history"] == merged["history"]
+    assert a.get("s1")["version"] == merged["version"]
+
+
+def test_pinned_session_is_not_reloaded_mid_turn(tmp_path):
+    turns = set()
+    a = SessionStore(
+        tmp_path / "sessions.sqlite3", shared=True, sweep_interval=0, pinned=turns.__contains__
+    )
+    b = SessionStore(tmp_path / "sessions.sqlite3", shared=True, sweep_interval=0)
+    try:
+        a.get_or_create("s1")["history"].append(_turn("hi"))
+        a.save("s1")
+
+        # A turn starts on a: the user question is in memory, not saved yet
+        turns.add("s1")
+        session = a.get_or_create("s1", holder=True)
+        session["history"].append(_turn("A-question"))
+        # Another worker writes meanwhile, and a poll on a reads the session
+        b.get("s1")["history"].append(_turn("B-msg"))
+        b.save("s1")
+        assert a.get("s1")["history"][-1] == _turn("A-question")
+
+        session["history"].append({"sender": "bot", "text": "A-reply"})
+        a.save("s1")
+        turns.discard("s1")
+        assert [t["text"] for t in b.get("s1")["history"]] == ["hi", "B-msg", "A-question", "A-reply"]
+
+        # The next turn's holder starts from the newest copy
+        b.get("s1")["history"].append(_turn("B-again"))
+        b.save("s1")
+        turns.add("s1")
+        assert a.get_or_create("s1", holder=True)["history"][-1] == _turn("B-again")
+    finally:
+        a.close()
+        b.close()
+
+
+def test_sweep_keeps_a_session_written_after_it_was_selected(shared_stores, monkeypatch):
+    a, b = shared_stores
+    a.ttl = 60
+    for session_id in ("idle", "revived"):
+        a.get_or_create(session_id)["history"].append(_turn("hi"))
+        a.save(session_id)
+    with a._db_lock:
+        a._db.execute("UPDATE sessions SET updated_at = updated_at - 3600")
+
+    # The other worker writes "revived" between the sweep's SELECT and its DELETE
+    evict = a._evict
+
+    def evict_then_write(session_id):
+        evict(session_id)
+        if session_id == "revived":
+            b.get("revived")["history"].append(_turn("back"))
+            b.save("revived")
+
+    monkeypatch.setattr(a, "_evict", evict_then_write)
+    a.sweep()
+    assert a.get("idle") is None
+    assert [t["text"] for t in a.get("revived")["history"]] == ["hi", "back"]
+
+
+def test_legacy_json_is_migrated_once_across_workers(shared_stores, tmp_path):
+    legacy = tmp_path / "sessions.json"
+    legacy.write_text(json.dumps({f"s{i}": {"history": [_turn("hi")], "preferences": {}} for i in range(20)}))
+
+    # Two workers start together and both try the import
+    counts = []
+    start = threading.Barrier(len(shared_stores))
+
+    def migrate(store):
+        start.wait()
+        counts.append(store.migrate_json(legacy))
+
+    threads = [threading.Thread(target=migrate, args=(store,)) for store in shared_stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(counts) == [0, 20]
+    assert not legacy.exists()
+    assert (tmp_path / "sessions.json.migrated").exists()
+    assert all(store.get("s7")["history"] == [_turn("hi")] for store in shared_stores)
+    # A later start finds nothing to do
+    assert shared_stores[0].migrate_json(legacy) == 0
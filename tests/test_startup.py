@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_cold_start_within_budget():
+    # Needs an interpreter that has imported nothing yet, so it cannot run in-process
+    result = subprocess.run(
+        [sys.executable, "-m", "bench.check_startup"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,178 @@
+import json
+
+import pytest
+
+from app import clients, seed_cards, vector_store
+from app.catalog import load_cards
+from app.vector_store import IVFVectorStore, LocalVectorStore, PineconeVectorStore
+from bench.fakes import FakePineconeIndex, LatencyModel
+
+
+def _vector(vid: str, values: list, **metadata) -> dict:
+    return {"id": vid, "values": values, "metadata": metadata}
+
+
+def _pinecone_store(tmp_path):
+    # Same wiring as bench.run_bench.install_fakes
+    store = PineconeVectorStore.__new__(PineconeVectorStore)
+    store.index = FakePineconeIndex(LatencyModel(median_ms=0.001, p95_ms=0.001))
+    return store
+
+
+BACKENDS = {
+    "local": lambda tmp_path: LocalVectorStore(tmp_path / "index.npy"),
+    "ivf": lambda tmp_path: IVFVectorStore(tmp_path / "index.npy", nlist=2, nprobe=2),
+    "pinecone": _pinecone_store,
+}
+
+CARDS = [
+    _vector("cashback", [1, 0, 0], annual_fee=0, min_income=20000, issuer="HDFC Bank"),
+    _vector("travel", [0, 1, 0], annual_fee=2500, min_income=100000, issuer="Axis Bank"),
+    _vector("fuel", [0.8, 0.6, 0], annual_fee=500, min_income=25000, issuer="SBI Card"),
+    _vector("premium", [0, 0.6, 0.8], annual_fee=10000, issuer="HDFC Bank"),
+]
+
+
+@pytest.fixture(params=list(BACKENDS))
+def store(request, tmp_path):
+    store = BACKENDS[request.param](tmp_path)
+    store.upsert(CARDS)
+    store.build_index()
+    return store
+
+
+def _ids(matches: list) -> list:
+    return [m["id"] for m in matches]
+
+
+def test_query_ranks_by_cosine_similarity(store):
+    matches = store.query([1, 0, 0], top_k=2)
+    assert _ids(matches) == ["cashback", "fuel"]
+    assert matches[0]["score"] == pytest.approx(1.0)
+    assert matches[1]["score"] == pytest.approx(0.8)
+
+
+def test_upsert_replaces_existing_vector(store):
+    store.upsert([_vector("travel", [1, 0, 0], annual_fee=2500, min_income=100000, issuer="Axis Bank")])
+    store.build_index()
+    assert set(_ids(store.query([1, 0, 0], top_k=2))) == {"cashback", "travel"}
+    assert len(store.query([0, 1, 0], top_k=10)) == len(CARDS)
+
+
+@pytest.mark.parametrize(
+    "filter, expected",
+    [
+        ({"annual_fee": {"$lte": 500}}, ["cashback", "fuel"]),
+        ({"issuer": {"$in": ["HDFC Bank"]}}, ["cashback", "premium"]),
+        ({"issuer": "Axis Bank"}, ["travel"]),
+        # Cards without the field never match a clause on it
+        ({"min_income": {"$gte": 0}}, ["cashback", "fuel", "travel"]),
+        ({"$or": [{"annual_fee": {"$gt": 5000}}, {"issuer": {"$eq": "SBI Card"}}]}, ["fuel", "premium"]),
+        ({"$and": [{"annual_fee": {"$lt": 5000}}, {"issuer": {"$ne": "HDFC Bank"}}]}, ["fuel", "travel"]),
+        ({"annual_fee": {"$gt": 100000}}, []),
+    ],
+)
+def test_query_with_metadata_filter(store, filter, expected):
+    assert sorted(_ids(store.query([1, 0, 0], top_k=10, filter=filter))) == expected
+
+
+def test_filter_applies_before_top_k(store):
+    assert _ids(store.query([1, 0, 0.1], top_k=1, filter={"annual_fee": {"$gte": 1000}})) == ["premium"]
+
+
+def test_delete(store):
+    store.delete(["cashback", "unknown"])
+    store.build_index()
+    assert _ids(store.query([1, 0, 0], top_k=10))[0] == "fuel"
+    assert "cashback" not in _ids(store.query([1, 0, 0], top_k=10))
+
+
+def test_query_many_matches_query(store):
+    vectors = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    filters = [None, {"annual_fee": {"$lte": 2500}}, {"issuer": "HDFC Bank"}]
+    batched = store.query_many(vectors, top_k=2, filters=filters)
+    assert [_ids(matches) for matches in batched] == [
+        _ids(store.query(v, top_k=2, filter=f)) for v, f in zip(vectors, filters)
+    ]
+    assert _ids(batched[1]) == ["travel", "fuel"]
+    assert _ids(batched[2]) == ["premium", "cashback"]
+
+
+@pytest.mark.parametrize("store_class", [LocalVectorStore, IVFVectorStore])
+def test_shared_store_reloads_after_another_process_writes(tmp_path, monkeypatch, store_class):
+    path = tmp_path / "index.npy"
+    monkeypatch.setattr(vector_store, "get_vector_store", lambda: store_class(path))
+    monkeypatch.setattr(clients, "_vector_store", None)
+    monkeypatch.setattr(clients, "VECTOR_STORE_CHECK_SECONDS", 0)
+
+    seeder = store_class(path)
+    seeder.upsert([_vector("a", [1, 0])])
+    seeder.build_index()
+    served = clients.get_vector_store()
+    assert not clients.refresh_vector_store()
+
+    # A seed run in another process adds a card
+    seeder = store_class(path)
+    seeder.upsert([_vector("b", [0, 1])])
+    seeder.build_index()
+    assert served.stale()
+    assert clients.refresh_vector_store()
+    assert [m["id"] for m in clients.get_vector_store().query([0, 1], top_k=1)] == ["b"]
+
+
+@pytest.mark.parametrize("store_class", [LocalVectorStore, IVFVectorStore])
+def test_bulk_writes_files_once_per_flush(tmp_path, store_class):
+    path = tmp_path / "index.npy"
+    store = store_class(path)
+    with store.bulk():
+        for i in range(100):
+            store.upsert([_vector(f"card-{i}", [1, i])])
+        # Nothing reaches disk until the flush
+        assert not path.exists()
+        assert _ids(store.query([0, 1], top_k=1)) == ["card-99"]
+        store.flush()
+        assert len(LocalVectorStore(path).ids) == 100
+        store.upsert([_vector("card-100", [0, 1])])
+        store.delete(["card-0"])
+        assert len(LocalVectorStore(path).ids) == 100
+    reloaded = LocalVectorStore(path)
+    assert len(reloaded.ids) == 100 and "card-0" not in reloaded.ids
+    assert _ids(reloaded.query([0, 1], top_k=1)) == ["card-100"]
+
+
+def test_appends_reuse_spare_capacity(tmp_path):
+    store = LocalVectorStore(tmp_path / "index.npy")
+    with store.bulk():
+        store.upsert([_vector("a", [1, 0])])
+        rows = store._rows
+        for i in range(10):
+            store.upsert([_vector(f"b-{i}", [0, 1])])
+        assert store._rows is rows
+    assert len(store.matrix) == 11
+
+
+def test_seed_checkpoint_only_lists_persisted_cards(tmp_path, monkeypatch):
+    cards_file = tmp_path / "cards.json"
+    cards_file.write_text(json.dumps(load_cards()[:7]))
+    state_file = tmp_path / "state.json"
+    monkeypatch.setattr(
+        seed_cards, "generate_embeddings_batch", lambda texts, batch_size: [[1.0, 0.0]] * len(texts)
+    )
+    store = LocalVectorStore(tmp_path / "index.npy")
+    saves = []
+    real_save = store._save
+    monkeypatch.setattr(store, "_save", lambda: (saves.append(len(store.ids)), real_save()))
+    checkpoints = []
+    real_save_state = seed_cards.save_state
+
+    def save_state(state, path):
+        # Every checkpointed card is already on disk
+        assert set(state["fingerprints"]) <= set(LocalVectorStore(store.path).ids)
+        checkpoints.append(len(state["fingerprints"]))
+        real_save_state(state, path)
+
+    monkeypatch.setattr(seed_cards, "save_state", save_state)
+    report = seed_cards.seed(cards_file, state_file, chunk_size=1, vector_store=store)
+    assert report["upserted"] == 7
+    # Geometric checkpoints instead of one file rewrite per chunk
+    assert checkpoints == saves == [1, 2, 4, 7]